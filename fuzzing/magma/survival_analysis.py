@@ -5,118 +5,169 @@ Compute a survival analysis for each bug reported in the given JSON file. This
 JSON file is generated by running `magma/tools/benchd/exp2json.py` on the Magma
 work directory.
 
+All of the results are flattened into a single (long) DataFrame, so that the
+Kaplan-Meier curves and restricted mean survival times (RMSTs) of every
+(target, program, fuzzer, bug) are computed at once. These match lifelines'
+`KaplanMeierFitter` and `restricted_mean_survival_time`.
+
 Author: Adrian Herrera
 """
 
 
 from argparse import ArgumentParser, Namespace
-from collections import defaultdict
-from math import sqrt
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 import json
-import warnings
+import multiprocessing.pool as mpp
 
-from lifelines import KaplanMeierFitter
-from lifelines.utils import restricted_mean_survival_time as rmst
+import numpy as np
 import pandas as pd
 
 
-NUM_TRIALS = 30
 TRIAL_LEN = 18 * 60 * 60
 
-ddr = lambda: defaultdict(ddr)
+# A bug in a single campaign (i.e., across all trials)
+GROUP_COLUMNS = ['src', 'fuzzer', 'target', 'program', 'bug']
+RESULT_COLUMNS = ['fuzzer', 'target', 'program', 'run', 'metric', 'bug',
+                  'time']
+TRIAL_COLUMNS = ['fuzzer', 'target', 'program', 'num_trials']
 
 
 def parse_args() -> Namespace:
     """Parse command-line arguments."""
     parser = ArgumentParser(description='Magma survival analysis')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of JSON files to read in parallel')
+    parser.add_argument('-n', '--trials', type=int, default=None,
+                        help='Number of trials per campaign (inferred from '
+                             'the reported runs by default)')
     parser.add_argument('json', type=Path, nargs='+',
                         help='Magma-generated JSON file (containing bug data)')
     return parser.parse_args()
 
 
-def get_time_to_bug(data: dict) -> dict:
-    """Get time-to-bug data from Magma JSON dictionary."""
+def read_magma_json(path: Path) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Flatten a Magma JSON file. Returns a tuple containing:
+
+    1. The time (in seconds) at which each bug metric (e.g., `triggered`) was
+    first reached in each run.
+    2. The number of trials (runs) of each (fuzzer, target, program).
+    """
+    with path.open() as inf:
+        data = json.load(inf).get('results', {})
+
+    results = []
+    trials = []
     for fuzzer, f_data in data.items():
         for target, t_data in f_data.items():
             for program, p_data in t_data.items():
-                bugs = ddr()
-                for run, r_data in p_data.items():
-                    for metric, m_data in r_data.items():
-                        for bug, time in m_data.items():
-                            if metric not in bugs[bug]:
-                                bugs[bug][metric] = [None] * NUM_TRIALS
-                            bugs[bug][metric][int(run)] = time
-                for bug, b_data in bugs.items():
-                    yield dict(
-                        target=target,
-                        program=program,
-                        fuzzer=fuzzer,
-                        bug=bug,
-                        **b_data,
-                    )
-
-
-def calc_survival(data: dict) -> Tuple[float, float]:
-    """Do the survival analysis."""
-    df = pd.DataFrame(data)
-    T = df.fillna(TRIAL_LEN) / 60 / 60
-    E = df.notnull()
-
-    kmf = KaplanMeierFitter()
-    kmf.fit(T, E)
-
-    # Compute the restricted mean survival time and 95% confidence interval
-    surv_time_mean, surv_time_var = rmst(kmf, t=TRIAL_LEN / 60 / 60,
-                                         return_variance=True)
-    surv_time_var = abs(surv_time_var)
-    surv_time_ci = 1.96 * (sqrt(surv_time_var) /
-                           sqrt(len(kmf.survival_function_)))
-
-    return surv_time_mean, surv_time_ci
+                trials.append((fuzzer, target, program,
+                               max(map(int, p_data), default=-1) + 1))
+                results.extend((fuzzer, target, program, int(run), metric,
+                                bug, time)
+                               for run, r_data in p_data.items()
+                               for metric, m_data in r_data.items()
+                               for bug, time in m_data.items())
+
+    results = pd.DataFrame.from_records(results, columns=RESULT_COLUMNS)
+    trials = pd.DataFrame.from_records(trials, columns=TRIAL_COLUMNS)
+    results.insert(0, 'src', path.stem)
+    trials.insert(0, 'src', path.stem)
+    return results, trials
+
+
+def kaplan_meier(times: pd.DataFrame, tau: float) -> pd.DataFrame:
+    """
+    Compute the Kaplan-Meier survival function (and RMST up to `tau`) of every
+    group.
+
+    `times` contains the group columns, a `time`, and the number of `events`
+    and `censored` observations at that time. Returns the RMST, its variance
+    and the number of points on the survival function's timeline for each
+    group.
+    """
+    # Every timeline starts at zero
+    zeros = times[GROUP_COLUMNS].drop_duplicates().assign(time=0.0, events=0,
+                                                          censored=0)
+    points = pd.concat((times, zeros)).groupby(GROUP_COLUMNS + ['time'],
+                                               sort=True).sum().reset_index()
+    observed = points['events'] + points['censored']
+    groups = points.groupby(GROUP_COLUMNS, sort=False)
+
+    # Number at risk at each time: all observations at or after that time
+    observed_groups = observed.groupby(groups.ngroup())
+    at_risk = observed_groups.transform('sum') - observed_groups.cumsum() + \
+        observed
+    survival = (1 - points['events'] / at_risk).groupby(
+        groups.ngroup()).cumprod()
+
+    # The survival function is a step function, so the RMST (and its second
+    # moment) are sums over the steps up to `tau`
+    start = points['time'].to_numpy()
+    end = np.minimum(groups['time'].shift(-1).fillna(tau).to_numpy(), tau)
+    in_range = start <= tau
+    points['mean'] = np.where(in_range, survival * (end - start), 0)
+    points['sq'] = np.where(in_range,
+                            survival * (end ** 2 - start ** 2), 0)
+
+    stats = points.groupby(GROUP_COLUMNS, sort=False).agg(
+        survival_time=('mean', 'sum'), sq=('sq', 'sum'),
+        num_points=('time', 'size'))
+    stats['variance'] = stats['sq'] - stats['survival_time'] ** 2
+    return stats.drop(columns='sq')
+
+
+def calc_survival(results: pd.DataFrame, trials: pd.DataFrame,
+                  num_trials: Optional[int] = None) -> pd.DataFrame:
+    """Do the survival analysis (on the 'triggered' results)."""
+    tau = TRIAL_LEN / 60 / 60
+    bugs = results[GROUP_COLUMNS].drop_duplicates()
+
+    triggered = results[results['metric'] == 'triggered'].copy()
+    triggered['time'] = triggered['time'] / 60 / 60
+
+    # Runs that did not trigger the bug are censored at the end of the trial
+    events = triggered.groupby(GROUP_COLUMNS + ['time']).size().rename(
+        'events').reset_index()
+    censored = events.groupby(GROUP_COLUMNS)['events'].sum().rename(
+        'num_events').reset_index().merge(trials)
+    if num_trials is not None:
+        censored['num_trials'] = num_trials
+    censored = censored.assign(
+        time=tau, events=0,
+        censored=censored['num_trials'] - censored['num_events'])
+    censored = censored[censored['censored'] > 0]
+
+    times = pd.concat((events.assign(censored=0),
+                       censored[GROUP_COLUMNS + ['time', 'events',
+                                                 'censored']]))
+    stats = kaplan_meier(times, tau)
+
+    # 95% confidence interval
+    stats['survival_ci'] = 1.96 * (np.sqrt(stats['variance'].abs()) /
+                                   np.sqrt(stats['num_points']))
+    return bugs.merge(stats[['survival_time', 'survival_ci']].reset_index(),
+                      how='left')
 
 
 def main():
     """The main function."""
     args = parse_args()
 
-    # Ignore warnings
-    warnings.simplefilter("ignore")
-
-    survival_times = dict(target=[],
-                          program=[],
-                          bug=[],
-                          src=[],
-                          fuzzer=[],
-                          survival_time=[],
-                          survival_ci=[])
-
-    for magma_json in args.json:
-        # Read Magma JSON data
-        with magma_json.open() as inf:
-            json_data = json.load(inf).get('results', {})
-
-        # Do survival analysis on 'triggered' results
-        for ttb in get_time_to_bug(json_data):
-            if 'triggered' not in ttb:
-                surv_time_mean = None
-                surv_time_ci = None
-            else:
-                triggered_data = ttb['triggered']
-                surv_time_mean, surv_time_ci = calc_survival(triggered_data)
-
-            # Save table data
-            survival_times['target'].append(ttb['target'])
-            survival_times['program'].append(ttb['program'])
-            survival_times['bug'].append(ttb['bug'])
-            survival_times['src'].append(magma_json.stem)
-            survival_times['fuzzer'].append('afl')
-            survival_times['survival_time'].append(surv_time_mean)
-            survival_times['survival_ci'].append(surv_time_ci)
+    # Read Magma JSON data
+    with mpp.Pool(processes=args.jobs) as pool:
+        data = pool.map(read_magma_json, args.json)
+    results = pd.concat([results for results, _ in data], ignore_index=True)
+    trials = pd.concat([trials for _, trials in data], ignore_index=True)
+
+    survival_times = calc_survival(results, trials, args.trials)
 
     # Write to CSV
-    print(pd.DataFrame.from_dict(survival_times).sort_values(by='bug').to_csv(index=False))
+    columns = ['target', 'program', 'bug', 'src', 'fuzzer', 'survival_time',
+               'survival_ci']
+    print(survival_times[columns].sort_values(by='bug', kind='stable')
+          .to_csv(index=False))
 
 
 if __name__ == '__main__':
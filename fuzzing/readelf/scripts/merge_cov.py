@@ -35,12 +35,11 @@ def get_cov(fuzzer: str, seed: str, trial: int) -> pd.DataFrame:
     df['time'] = df.unix_time - df.unix_time.iloc[0]
     df['dir'] = df.seed.apply(lambda x: Path(x).parent.name)
     df['seed'] = df.seed.apply(lambda x: Path(x).name)
-    df[count_col] = np.nan
-    df[percent_col] = np.nan
 
     # Drop crashes
     df = df.drop(df[df.dir == 'crashes'].index)
 
+    cov_data = []
     for cov_file in sorted(list(cov_dir.glob('*.json'))):
         with cov_file.open() as inf:
             try:
@@ -48,10 +47,15 @@ def get_cov(fuzzer: str, seed: str, trial: int) -> pd.DataFrame:
             except json.JSONDecodeError:
                 print('unable to read %s. Skipping' % cov_file)
                 continue
-            reg_covered = region_data['covered']
-            reg_count = region_data['count']
-        df.loc[df.seed == cov_file.stem, count_col] = reg_covered
-        df.loc[df.seed == cov_file.stem, percent_col] = reg_covered * 100.0 / reg_count
+        cov_data.append((cov_file.stem, region_data['covered'],
+                         region_data['count']))
+
+    # Join the coverage onto the timestamps in one go (rather than assigning
+    # each seed's coverage with `.loc`)
+    cov = pd.DataFrame.from_records(cov_data,
+                                    columns=['seed', count_col, 'reg_count'])
+    cov[percent_col] = cov[count_col] * 100.0 / cov.pop('reg_count')
+    df = df.merge(cov, on='seed', how='left')
 
     return df.set_index('time')[[count_col, percent_col]]
 
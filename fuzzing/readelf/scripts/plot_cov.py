@@ -1,23 +1,31 @@
 #!/usr/bin/env python3
 
 
+from argparse import ArgumentParser, Namespace
+from functools import partial
 from itertools import product
 from pathlib import Path
-import gzip
+from typing import Optional, Tuple
+import multiprocessing.pool as mpp
 
 from matplotlib import rc, rcParams
+from matplotlib.lines import Line2D
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import seaborn as sns
 
 
 DATA_DIR = Path(__file__).parent.parent / 'data'
+CACHE_PATH = Path('plot-cov-cache.npz')
 
 
 TRIAL_LEN = 10 # Hours
 PLOT_STEP = 10 # Seconds
 NUM_TRIALS = 5
 NUM_BOOTS = 2000
+CI = 95
+RANDOM_SEED = 0
 FUZZERS = ('aflfast', 'aflplusplus', 'honggfuzz')
 SEEDS = ('ascii', 'singleton', 'cmin')
 
@@ -27,6 +35,9 @@ FUZZER_LABELS = dict(aflfast='AFLFast',
 SEED_LABELS = dict(ascii='Uninformed',
                    singleton='Valid',
                    cmin='Corpus')
+FUZZER_DASHES = dict(aflfast='-',
+                     aflplusplus='--',
+                     honggfuzz=':')
 
 rc('pdf', fonttype=42)
 rc('ps', fonttype=42)
@@ -45,41 +56,127 @@ rc_fonts = {
 rcParams.update(rc_fonts)
 
 
-def gen_plot_data() -> pd.DataFrame:
-    "Generate the data to plot."""
-    dfs = []
-    trials = range(1, NUM_TRIALS + 1)
-    cols = ['region_percent_%d' % trial for trial in trials]
-
-    for fuzzer, seed in product(FUZZERS, SEEDS):
-        csv_path = DATA_DIR / f'{fuzzer}-{seed}-cov.csv.gz'
-
-        print(f'Parsing {csv_path}...')
-        with gzip.open(csv_path, 'rb') as inf:
-            df = pd.read_csv(inf).set_index('time')
-
-        df = df.loc[~df.index.duplicated(keep='first')]
-        new_idx = pd.RangeIndex(start=0, stop=TRIAL_LEN * 60 * 60,
-                                step=PLOT_STEP)
-        df = df.reindex(new_idx, method='ffill')
-        df.index = df.index / 60 / 60
-        df['time'] = df.index
-        df = df.melt(id_vars='time',
-                     value_name='region_percent',
-                     value_vars=cols)
-        df['Fuzzer'] = FUZZER_LABELS[fuzzer]
-        df['Seed'] = SEED_LABELS[seed]
-
-        dfs.append(df)
-
-    return pd.concat(dfs)
+def parse_args() -> Namespace:
+    """Parse command-line arguments."""
+    parser = ArgumentParser(description='Plot readelf coverage')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of coverage series to bin in parallel')
+    parser.add_argument('-s', '--step', type=int, default=PLOT_STEP,
+                        help='Bin width (in seconds)')
+    parser.add_argument('-b', '--num-boots', type=int, default=NUM_BOOTS,
+                        help='Number of bootstrap resamples')
+    parser.add_argument('-c', '--cache', type=Path, default=CACHE_PATH,
+                        help='Path to the binned coverage cache (default: '
+                             '%(default)s, in the current directory)')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='Rebuild the cache (even if it is up-to-date)')
+    parser.add_argument('-o', '--output', type=Path,
+                        default=Path('readelf-experiment.pdf'),
+                        help='Output plot')
+    return parser.parse_args()
+
+
+def bin_coverage(fuzzer: str, seed: str, step: int) -> Optional[np.ndarray]:
+    """
+    Bin a (fuzzer, seed) coverage series onto a `step`-second grid. Each bin
+    takes the last coverage value at (or before) the bin's start time. Returns
+    a (trials x bins) array, or `None` if there is no coverage for this
+    (fuzzer, seed).
+    """
+    csv_path = DATA_DIR / f'{fuzzer}-{seed}-cov.csv.gz'
+    if not csv_path.exists():
+        print(f'{csv_path} does not exist. Skipping')
+        return None
+
+    print(f'Parsing {csv_path}...')
+    cols = ['region_percent_%d' % trial for trial in range(1, NUM_TRIALS + 1)]
+    df = pd.read_csv(csv_path, usecols=['time', *cols])
+
+    # Keep the first entry for any duplicate time, and forward-fill onto the
+    # grid in one go
+    times, first = np.unique(df['time'].to_numpy(), return_index=True)
+    values = df[cols].to_numpy()[first]
+    grid = np.arange(0, TRIAL_LEN * 60 * 60, step)
+    idx = np.searchsorted(times, grid, side='right') - 1
+    binned = values[np.maximum(idx, 0)]
+    binned[idx < 0] = np.nan
+
+    return binned.T
+
+
+def bootstrap_ci(data: np.ndarray, num_boots: int,
+                 rng: np.random.Generator) -> np.ndarray:
+    """
+    Compute the mean and (percentile) bootstrap confidence interval of each
+    bin of a (trials x bins) array. All bins are resampled at once: each
+    resample is a vector of trial counts, so the resampled means are a single
+    matrix product. Returns a (3 x bins) array (mean, lower, upper).
+    """
+    num_trials = len(data)
+    counts = rng.multinomial(num_trials, np.full(num_trials, 1 / num_trials),
+                             size=num_boots)
+    boot_means = counts @ data / num_trials
+
+    alpha = (100 - CI) / 2
+    low, high = np.percentile(boot_means, [alpha, 100 - alpha], axis=0)
+    return np.stack((data.mean(axis=0), low, high))
+
+
+def cache_is_stale(cache: Path, step: int, num_boots: int) -> bool:
+    """Check if the cache is missing, out-of-date, or for other settings."""
+    if not cache.exists():
+        return True
+
+    cache_mtime = cache.stat().st_mtime
+    if any(csv_path.stat().st_mtime > cache_mtime for csv_path in
+           DATA_DIR.glob('*-cov.csv.gz')):
+        return True
+
+    with np.load(cache) as data:
+        return int(data['step']) != step or int(data['num_boots']) != num_boots
+
+
+def build_cache(cache: Path, step: int, num_boots: int, jobs: int = 1) -> None:
+    """
+    Bin every (fuzzer, seed) coverage series and save their mean and
+    bootstrap confidence intervals to `cache`.
+    """
+    series = list(product(FUZZERS, SEEDS))
+    with mpp.Pool(processes=jobs) as pool:
+        binned = pool.starmap(partial(bin_coverage, step=step), series)
+
+    rng = np.random.default_rng(RANDOM_SEED)
+    summaries = {f'{fuzzer}-{seed}': bootstrap_ci(data, num_boots, rng)
+                 for (fuzzer, seed), data in zip(series, binned)
+                 if data is not None}
+
+    print(f'Saving plot data to {cache}...')
+    np.savez_compressed(cache, step=step, num_boots=num_boots,
+                        time=np.arange(0, TRIAL_LEN * 60 * 60, step) / 60 / 60,
+                        **summaries)
+
+
+def load_cache(cache: Path) -> Tuple[np.ndarray, dict]:
+    """
+    Load the binned coverage cache. Returns a tuple containing the time (in
+    hours) of each bin and the (mean, lower, upper) coverage of each (fuzzer,
+    seed).
+    """
+    with np.load(cache) as data:
+        summaries = {(fuzzer, seed): data[f'{fuzzer}-{seed}'] for
+                     fuzzer, seed in product(FUZZERS, SEEDS) if
+                     f'{fuzzer}-{seed}' in data}
+        return data['time'], summaries
 
 
 def main():
     """The main function."""
+    args = parse_args()
 
-    print('Generating plot data...')
-    plot_data = gen_plot_data()
+    if args.force or cache_is_stale(args.cache, args.step, args.num_boots):
+        print('Generating plot data...')
+        build_cache(args.cache, args.step, args.num_boots, args.jobs)
+    time, plot_data = load_cache(args.cache)
 
     # Do the actual plotting
     print('plotting results...')
@@ -87,8 +184,12 @@ def main():
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
-    ax = sns.lineplot(ax=ax, data=plot_data, x='time', y='region_percent',
-                      hue='Seed', style='Fuzzer', ci=95, n_boot=NUM_BOOTS)
+    colors = dict(zip(SEEDS, sns.color_palette(n_colors=len(SEEDS))))
+    for (fuzzer, seed), (mean, low, high) in plot_data.items():
+        ax.plot(time, mean, color=colors[seed],
+                linestyle=FUZZER_DASHES[fuzzer])
+        ax.fill_between(time, low, high, color=colors[seed], alpha=0.2,
+                        linewidth=0)
 
     # Tidy up plot
     xticks = [0, 1, 2, 5, 10] # Hours
@@ -99,11 +200,21 @@ def main():
            xticklabels=[f'{x}' for x in xticks])
     ax.set_ylim(bottom=0)
     ax.set_xlim(left=0, right=TRIAL_LEN)
-    ax.legend(ncol=2, loc='upper center', bbox_to_anchor=(0.5, 1.3))
+
+    # Legend (seed by color, fuzzer by line style)
+    blank = Line2D([], [], linestyle='')
+    handles = [blank, *(Line2D([], [], color=colors[seed]) for seed in SEEDS),
+               blank, *(Line2D([], [], color='black',
+                               linestyle=FUZZER_DASHES[fuzzer])
+                        for fuzzer in FUZZERS)]
+    labels = ['Seed', *(SEED_LABELS[seed] for seed in SEEDS),
+              'Fuzzer', *(FUZZER_LABELS[fuzzer] for fuzzer in FUZZERS)]
+    ax.legend(handles, labels, ncol=2, loc='upper center',
+              bbox_to_anchor=(0.5, 1.3))
     sns.despine()
 
     # Save plot
-    fig.savefig('readelf-experiment.pdf', bbox_inches='tight')
+    fig.savefig(args.output, bbox_inches='tight')
 
 
 if __name__ == '__main__':
@@ -10,44 +10,38 @@ Author: Adrian Herrera
 from argparse import ArgumentParser, Namespace
 from pathlib import Path
 from shutil import which
-from tempfile import NamedTemporaryFile
+from tempfile import TemporaryDirectory
 from typing import Dict, List, Optional, TextIO, Tuple
-import re
 import subprocess
 
 
-WCNF_SEED_MAP_RE = re.compile(r'^c (\d+) : (.+)$')
-
-
 def parse_args() -> Namespace:
     """Parse command-line arguments."""
     parser = ArgumentParser(description='Run OptiMin to produce a minimized corpus')
     parser.add_argument('-j', '--jobs', type=int, default=0,
-                        help='Number of minimization threads')
+                        help='Number of threads used to read coverage and '
+                             'minimize')
     parser.add_argument('-e', '--edge-only', action='store_true',
                         help='Use edge coverage only, ignore hit counts')
     parser.add_argument('-w', '--weights', metavar='CSV', type=Path,
                         help='Path to weights CSV')
+    parser.add_argument('-o', '--wcnf', metavar='WCNF', type=Path,
+                        help='Write the WCNF to this path (gzip-compressed if '
+                             'it ends in .gz), rather than piping it directly '
+                             'to EvalMaxSAT')
     parser.add_argument('corpus', type=Path, help='Path to input corpus')
     return parser.parse_args()
 
 
-def get_seed_mapping(inf: TextIO) -> Dict[int, str]:
+def read_seed_map(inf: TextIO) -> Dict[int, str]:
     """
     Retrieve the mapping of literal identifiers (integers) to seed names
-    (strings) from the WCNF file.
+    (strings) from the seed map written by `afl-showmap-maxsat -m`.
     """
     mapping = {}
     for line in inf:
-        # This starts the constraint listing
-        if line.startswith('p wcnf '):
-            break
-
-        match = WCNF_SEED_MAP_RE.match(line.strip())
-        if not match:
-            continue
-
-        mapping[int(match.group(1))] = match.group(2)
+        lit, _, seed = line.rstrip('\n').partition(' : ')
+        mapping[int(lit)] = seed
 
     return mapping
 
@@ -102,27 +96,48 @@ def main():
         raise Exception('Cannot find EvalMaxSAT. Check PATH')
 
     # Configure optimin
-    optimin_args = [optimin, '-p']
+    optimin_args = [optimin, '-p', '-j', f'{args.jobs}']
     if args.edge_only:
         optimin_args.append('-e')
     if args.weights:
         optimin_args.extend(['-w', str(args.weights)])
 
-    with NamedTemporaryFile() as wcnf:
-        print(f'[*] Running Optimin on {args.corpus}')
-        optimin_args.extend(['-o', wcnf.name, '--', str(args.corpus)])
-        subprocess.run(optimin_args, check=True)
+    with TemporaryDirectory() as temp_dir:
+        seed_map_path = Path(temp_dir) / 'seeds.map'
+        optimin_args.extend(['-m', str(seed_map_path)])
+        if args.wcnf and args.wcnf.suffix == '.gz':
+            optimin_args.append('-z')
+        optimin_args.extend(['-o', str(args.wcnf) if args.wcnf else '-',
+                             '--', str(args.corpus)])
 
-        with open(wcnf.name, 'r') as inf:
-            seed_map = get_seed_mapping(inf)
+        # Unless the WCNF is kept, it is streamed straight into EvalMaxSAT
+        print(f'[*] Running Optimin on {args.corpus}')
+        if args.wcnf:
+            subprocess.run(optimin_args, check=True)
+            optimin_proc = None
+            wcnf = str(args.wcnf)
+        else:
+            optimin_proc = subprocess.Popen(optimin_args,
+                                            stdout=subprocess.PIPE)
+            wcnf = '/dev/stdin'
 
         print('[*] Running EvalMaxSAT on WCNF')
-        proc = subprocess.run([eval_max_sat, wcnf.name, '-p', f'{args.jobs}'],
-                              check=True, stdout=subprocess.PIPE,
-                              encoding='utf-8')
+        proc = subprocess.run([eval_max_sat, wcnf, '-p', f'{args.jobs}'],
+                              stdin=optimin_proc.stdout if optimin_proc
+                              else None,
+                              stdout=subprocess.PIPE, encoding='utf-8')
+        if optimin_proc:
+            optimin_proc.stdout.close()
+            if optimin_proc.wait():
+                raise subprocess.CalledProcessError(optimin_proc.returncode,
+                                                    optimin_args)
+        proc.check_returncode()
         print('[+] EvalMaxSAT completed')
         maxsat_out = [line.strip() for line in proc.stdout.split('\n')]
 
+        with open(seed_map_path, 'r') as inf:
+            seed_map = read_seed_map(inf)
+
         print('[*] Parsing EvalMaxSAT output')
         solution, exec_time = parse_maxsat_out(maxsat_out, seed_map)
         if not solution:
@@ -5,6 +5,9 @@
  * Author: Adrian Herrera
  */
 
+#include <algorithm>
+#include <atomic>
+#include <charconv>
 #include <chrono>
 #include <cstdint>
 #include <cstdlib>
@@ -14,11 +17,15 @@
 #include <map>
 #include <numeric>
 #include <set>
+#include <string_view>
+#include <thread>
+#include <type_traits>
 #include <unistd.h>
+#include <unordered_map>
 #include <vector>
 
 #include <boost/container/flat_map.hpp>
-#include <boost/container/flat_set.hpp>
+#include <zlib.h>
 
 #include "Common.h"
 #include "ProgressBar.h"
@@ -30,22 +37,137 @@ static constexpr uint32_t MAX_EDGE_FREQ = 8;
 /// Maps WCNF literal identifiers (integers) to seed files
 using MaxSatMap = boost::container::flat_map<unsigned, std::string>;
 
-/// Set of WCNF literals
-using MaxSatLiteralSet = boost::container::flat_set<unsigned>;
+/// Set of WCNF literals (sorted in increasing order)
+using MaxSatLiteralSet = std::vector<unsigned>;
+
+/// The WCNF literals that "cover" a tuple at its highest hit-count bucket
+///
+/// A seed that hits a tuple in bucket `B` also covers every lower bucket, so
+/// the set of seeds covering a lower bucket is a superset of the seeds
+/// covering a higher bucket. Any clause for a lower bucket is therefore
+/// subsumed by the clause for the highest bucket, and only the latter is
+/// kept
+struct MaxSatTupleCover {
+  unsigned Bucket = 0;
+  MaxSatLiteralSet Literals;
+
+  /// Record literal `Lit` covering the tuple in bucket `B`. Literals must be
+  /// added in increasing order
+  void Add(unsigned B, unsigned Lit) {
+    if (B > Bucket) {
+      Bucket = B;
+      Literals.assign(1, Lit);
+    } else if (B == Bucket && B > 0 &&
+               (Literals.empty() || Literals.back() != Lit)) {
+      Literals.push_back(Lit);
+    }
+  }
+
+  /// Merge with a cover whose literals are all greater than this cover's
+  void Merge(MaxSatTupleCover &&Other) {
+    if (Other.Bucket > Bucket) {
+      *this = std::move(Other);
+    } else if (Other.Bucket == Bucket) {
+      Literals.insert(Literals.end(), Other.Literals.begin(),
+                      Other.Literals.end());
+    }
+  }
+};
 
 /// Maps tuple IDs to WCNF literals that "cover" that tuple
 using MaxSatCoverageMap =
-    boost::container::flat_map<AFLTuple::first_type, MaxSatLiteralSet>;
+    std::unordered_map<AFLTuple::first_type, MaxSatTupleCover>;
+
+/// Map a raw hit count (as produced by `afl-showmap -r`) to its bucket
+/// (1, 2, 3, 4-7, 8-15, 16-31, 32-127, 128+). This is based on
+/// `count_class_human[256]` in `afl-showmap.c`
+static unsigned GetHitCountBucket(unsigned Count) {
+  if (Count < 4) {
+    return Count;
+  } else if (Count < 8) {
+    return 4;
+  } else if (Count < 16) {
+    return 5;
+  } else if (Count < 32) {
+    return 6;
+  } else if (Count < 128) {
+    return 7;
+  }
+  return MAX_EDGE_FREQ;
+}
+
+/// Buffered WCNF writer. Output is (optionally) gzip-compressed
+class WCNFWriter {
+public:
+  WCNFWriter(gzFile F) : File(F) { Buf.reserve(BufSize); }
+
+  WCNFWriter &operator<<(std::string_view S) {
+    Buf.append(S);
+    return MaybeFlush();
+  }
+
+  WCNFWriter &operator<<(char C) {
+    Buf.push_back(C);
+    return MaybeFlush();
+  }
+
+  template <typename T>
+  std::enable_if_t<std::is_integral_v<T>, WCNFWriter &> operator<<(T V) {
+    char Tmp[24];
+    const auto Res = std::to_chars(Tmp, Tmp + sizeof(Tmp), V);
+    Buf.append(Tmp, Res.ptr);
+    return MaybeFlush();
+  }
+
+  /// Flush and close the output. Returns `false` if any write failed
+  bool Close() {
+    Flush();
+    return gzclose(File) == Z_OK && !Failed;
+  }
+
+private:
+  static constexpr size_t BufSize = 1 << 20;
+
+  gzFile File;
+  std::string Buf;
+  bool Failed = false;
+
+  WCNFWriter &MaybeFlush() {
+    if (Buf.size() >= BufSize) {
+      Flush();
+    }
+    return *this;
+  }
+
+  void Flush() {
+    if (!Buf.empty() &&
+        gzwrite(File, Buf.data(), Buf.size()) != static_cast<int>(Buf.size())) {
+      Failed = true;
+    }
+    Buf.clear();
+  }
+};
 
 static void Usage(const char *Argv0) {
   std::cerr << '\n' << Argv0 << " [ options ] -- /path/to/corpus_dir\n\n";
   std::cerr << "Required parameters:\n\n";
-  std::cerr << "  -o         - Output WCNF (DIMACS) file\n\n";
+  std::cerr << "  -o         - Output WCNF (DIMACS) file (`-` for stdout)\n\n";
   std::cerr << "Optional parameters:\n\n";
   std::cerr << "  -p         - Show progress bar\n";
   std::cerr << "  -e         - Use edge coverage only, ignore hit counts\n";
   std::cerr << "  -h         - Print this message\n";
-  std::cerr << "  -w weights - CSV containing seed weights (see README)\n\n";
+  std::cerr << "  -j threads - Number of threads to read coverage with (0 to "
+               "use all cores)\n";
+  std::cerr << "  -m map     - Write the literal to seed mapping to a separate "
+               "file (rather\n"
+               "               than the WCNF)\n";
+  std::cerr << "  -r         - Coverage contains raw hit counts "
+               "(`afl-showmap -r`)\n";
+  std::cerr << "  -x         - Generate a clause for every hit-count bucket "
+               "(rather than\n"
+               "               only the highest bucket of each edge)\n";
+  std::cerr << "  -w weights - CSV containing seed weights (see README)\n";
+  std::cerr << "  -z         - gzip-compress the WCNF\n\n";
   std::cerr << std::endl;
 
   std::exit(1);
@@ -54,8 +176,13 @@ static void Usage(const char *Argv0) {
 int main(int Argc, char *Argv[]) {
   bool ShowProg = false;
   bool EdgesOnly = false;
+  bool RawCounts = false;
+  bool ExpandBuckets = false;
+  bool Compress = false;
   std::string WCNFOutFile;
+  std::string SeedMapFile;
   std::string WeightsFile;
+  unsigned NumThreads = 1;
   WeightsMap Weights;
   int Opt;
   ProgressBar Prog;
@@ -63,10 +190,8 @@ int main(int Argc, char *Argv[]) {
   std::chrono::time_point<std::chrono::steady_clock> StartTime, EndTime;
   std::chrono::seconds Duration;
 
-  std::cout << "afl-showmap corpus minimization\n\n";
-
   // Parse command-line options
-  while ((Opt = getopt(Argc, Argv, "+peho:w:")) > 0) {
+  while ((Opt = getopt(Argc, Argv, "+pehj:m:o:rw:xz")) > 0) {
     switch (Opt) {
     case 'p':
       // Show progres bar
@@ -80,14 +205,37 @@ int main(int Argc, char *Argv[]) {
       // Help
       Usage(Argv[0]);
       break;
+    case 'j':
+      // Coverage reader threads
+      NumThreads = std::stoul(optarg);
+      if (NumThreads == 0) {
+        NumThreads = std::max(1U, std::thread::hardware_concurrency());
+      }
+      break;
+    case 'm':
+      // Literal to seed mapping file
+      SeedMapFile = optarg;
+      break;
     case 'o':
       // WCNF file
       WCNFOutFile = optarg;
       break;
+    case 'r':
+      // Coverage contains raw hit counts (rather than buckets)
+      RawCounts = true;
+      break;
     case 'w':
       // Weights file
       WeightsFile = optarg;
       break;
+    case 'x':
+      // Generate a clause for each bucket (no subsumption)
+      ExpandBuckets = true;
+      break;
+    case 'z':
+      // Compress WCNF
+      Compress = true;
+      break;
     default:
       Usage(Argv[0]);
     }
@@ -103,12 +251,18 @@ int main(int Argc, char *Argv[]) {
 
   const char *CorpusDir = Argv[optind];
 
+  // Keep stdout clean if the WCNF is written to it
+  const bool WCNFToStdout = WCNFOutFile == "-";
+  std::ostream &Log = WCNFToStdout ? std::cerr : std::cout;
+
+  Log << "afl-showmap corpus minimization\n\n";
+
   // Parse weights
   //
   // Weights are stored in CSV file mapping a seed file name to an integer
   // greater than zero.
   if (!WeightsFile.empty()) {
-    std::cout << "[*] Reading weights from `" << WeightsFile << "`... "
+    Log << "[*] Reading weights from `" << WeightsFile << "`... "
               << std::flush;
     StartTime = std::chrono::steady_clock::now();
 
@@ -119,7 +273,7 @@ int main(int Argc, char *Argv[]) {
     EndTime = std::chrono::steady_clock::now();
     Duration =
         std::chrono::duration_cast<std::chrono::seconds>(EndTime - StartTime);
-    std::cout << Duration.count() << 's' << std::endl;
+    Log << Duration.count() << 's' << std::endl;
   }
 
   // Calculate the top value
@@ -129,7 +283,7 @@ int main(int Argc, char *Argv[]) {
   // https://maxsat-evaluations.github.io/2020/format.html). Soft clauses have
   // always be less than top.
   if (!ShowProg) {
-    std::cout << "[*] Calculating top... " << std::flush;
+    Log << "[*] Calculating top... " << std::flush;
   }
   StartTime = std::chrono::steady_clock::now();
 
@@ -145,7 +299,7 @@ int main(int Argc, char *Argv[]) {
     }
 
     if ((++WeightCount % 10 == 0) && ShowProg) {
-      Prog.Update(WeightCount * 100 / Weights.size(), "Calculating top");
+      Prog.Update(WeightCount * 100 / Weights.size(), "Calculating top", Log);
     }
   }
 
@@ -153,9 +307,9 @@ int main(int Argc, char *Argv[]) {
   Duration =
       std::chrono::duration_cast<std::chrono::seconds>(EndTime - StartTime);
   if (ShowProg) {
-    std::cout << std::endl;
+    Log << std::endl;
   } else {
-    std::cout << Duration.count() << 's' << std::endl;
+    Log << Duration.count() << 's' << std::endl;
   }
 
   // Get seed coverage
@@ -165,13 +319,13 @@ int main(int Argc, char *Argv[]) {
   // data structures.
   struct dirent *DP;
   DIR *DirFD;
-  AFLCoverageVector Cov;
+  std::vector<std::string> SeedFiles;
 
   MaxSatMap SeedLiterals;
   MaxSatCoverageMap SeedCoverage;
 
   if (!ShowProg) {
-    std::cout << "[*] Reading coverage in `" << CorpusDir << "`... "
+    Log << "[*] Reading coverage in `" << CorpusDir << "`... "
               << std::flush;
   }
   StartTime = std::chrono::steady_clock::now();
@@ -181,112 +335,195 @@ int main(int Argc, char *Argv[]) {
     return 1;
   }
 
-  size_t SeedCount = 0;
-  const size_t NumSeeds = GetNumSeeds(DirFD);
-
+  SeedFiles.reserve(GetNumSeeds(DirFD));
   while ((DP = readdir(DirFD)) != nullptr) {
     if (DP->d_type == DT_DIR) {
       continue;
     }
+    SeedFiles.emplace_back(DP->d_name);
+  }
 
-    // Get seed coverage
-    std::ifstream IFS(std::string(CorpusDir) + '/' + DP->d_name);
-    Cov.clear();
-    GetAFLCoverage(IFS, Cov);
-    IFS.close();
+  closedir(DirFD);
+
+  // Create a literal (an integer) to represent each seed
+  const size_t NumSeeds = SeedFiles.size();
+  for (size_t I = 0; I < NumSeeds; ++I) {
+    SeedLiterals.emplace_hint(SeedLiterals.end(), I + 1, SeedFiles[I]);
+  }
 
-    // Create a literal (an integer) to represent the seed
-    const unsigned SeedLit = SeedCount + 1;
-    SeedLiterals.emplace(SeedLit, DP->d_name);
-
-    // Record the set of seeds that cover a particular edge
-    for (const auto &[Edge, Freq] : Cov) {
-      if (EdgesOnly) {
-        // Ignore edge frequency
-        SeedCoverage[Edge].insert(SeedLit);
-      } else {
-        // Executing edge `E` `N` times means that it was executed `N - 1` times
-        for (unsigned I = 0; I < Freq; ++I)
-          SeedCoverage[MAX_EDGE_FREQ * Edge + I].insert(SeedLit);
+  // Each thread reads a contiguous range of seeds into its own coverage map.
+  // Seed literals are assigned in order, so the maps are merged (in thread
+  // order) by concatenating each tuple's literals, which keeps them sorted
+  NumThreads = std::max<size_t>(1, std::min<size_t>(NumThreads, NumSeeds));
+  std::vector<MaxSatCoverageMap> ThreadCoverage(NumThreads);
+  std::vector<std::thread> Threads;
+  std::atomic<size_t> SeedCount = 0;
+  std::atomic<size_t> FailedCount = 0;
+
+  auto ReadCoverage = [&](unsigned T) {
+    AFLCoverageVector Cov;
+    MaxSatCoverageMap &Coverage = ThreadCoverage[T];
+
+    for (size_t I = T * NumSeeds / NumThreads;
+         I < (T + 1) * NumSeeds / NumThreads; ++I) {
+      // Get seed coverage
+      Cov.clear();
+      if (!GetAFLCoverage(std::string(CorpusDir) + '/' + SeedFiles[I], Cov)) {
+        ++FailedCount;
       }
+      const unsigned SeedLit = I + 1;
+
+      // Record the set of seeds that cover a particular edge
+      for (const auto &[Edge, Freq] : Cov) {
+        if (EdgesOnly) {
+          // Ignore edge frequency
+          Coverage[Edge].Add(1, SeedLit);
+          continue;
+        }
+
+        const unsigned Bucket = RawCounts
+                                    ? GetHitCountBucket(Freq)
+                                    : std::min(Freq, MAX_EDGE_FREQ);
+        if (ExpandBuckets) {
+          // Executing edge `E` in bucket `N` means that it was also executed
+          // in buckets `1` to `N - 1`
+          for (unsigned J = 0; J < Bucket; ++J)
+            Coverage[MAX_EDGE_FREQ * Edge + J].Add(1, SeedLit);
+        } else {
+          Coverage[Edge].Add(Bucket, SeedLit);
+        }
+      }
+
+      ++SeedCount;
     }
+  };
 
-    if ((++SeedCount % 10 == 0) && ShowProg) {
-      Prog.Update(SeedCount * 100 / NumSeeds, "Reading seed coverage");
+  for (unsigned T = 0; T < NumThreads; ++T) {
+    Threads.emplace_back(ReadCoverage, T);
+  }
+  if (ShowProg) {
+    while (SeedCount < NumSeeds) {
+      Prog.Update(SeedCount * 100 / NumSeeds, "Reading seed coverage", Log);
+      std::this_thread::sleep_for(std::chrono::milliseconds(100));
     }
   }
+  for (auto &Thread : Threads) {
+    Thread.join();
+  }
 
-  closedir(DirFD);
+  SeedCoverage = std::move(ThreadCoverage[0]);
+  for (unsigned T = 1; T < NumThreads; ++T) {
+    for (auto &[Tuple, Cover] : ThreadCoverage[T]) {
+      SeedCoverage[Tuple].Merge(std::move(Cover));
+    }
+    MaxSatCoverageMap().swap(ThreadCoverage[T]);
+  }
 
   EndTime = std::chrono::steady_clock::now();
   Duration =
       std::chrono::duration_cast<std::chrono::seconds>(EndTime - StartTime);
   if (ShowProg) {
-    std::cout << std::endl;
+    Log << std::endl;
   } else {
-    std::cout << Duration.count() << 's' << std::endl;
+    Log << Duration.count() << 's' << std::endl;
+  }
+
+  if (FailedCount > 0) {
+    std::cerr << "[!] Unable to read coverage for " << FailedCount
+              << " seed(s)" << std::endl;
   }
 
   // Ensure that at least one seed is selected that covers a particular edge
   // (hard constraint)
   if (!ShowProg) {
-    std::cout << "[*] Generating clauses... " << std::flush;
+    Log << "[*] Generating clauses... " << std::flush;
   }
   StartTime = std::chrono::steady_clock::now();
 
-  SeedCount = 0;
-  boost::container::flat_set<MaxSatLiteralSet> Clauses;
+  size_t TupleCount = 0;
+  std::vector<MaxSatLiteralSet> Clauses;
+  Clauses.reserve(SeedCoverage.size());
 
-  for (const auto &[_, Seeds] : SeedCoverage) {
-    if (Seeds.empty()) {
+  for (auto &[_, Cover] : SeedCoverage) {
+    if (Cover.Literals.empty()) {
       continue;
     }
 
-    Clauses.insert(Seeds);
+    Clauses.push_back(std::move(Cover.Literals));
 
-    if ((++SeedCount % 10 == 0) && ShowProg) {
-      Prog.Update(SeedCount * 100 / SeedCoverage.size(), "Generating clauses");
+    if ((++TupleCount % 10 == 0) && ShowProg) {
+      Prog.Update(TupleCount * 100 / SeedCoverage.size(), "Generating clauses",
+                  Log);
     }
   }
 
+  // Remove duplicate clauses (sorting them in the process)
+  std::sort(Clauses.begin(), Clauses.end());
+  Clauses.erase(std::unique(Clauses.begin(), Clauses.end()), Clauses.end());
+
   EndTime = std::chrono::steady_clock::now();
   Duration =
       std::chrono::duration_cast<std::chrono::seconds>(EndTime - StartTime);
   if (ShowProg) {
-    std::cout << std::endl;
+    Log << std::endl;
   } else {
-    std::cout << Duration.count() << 's' << std::endl;
+    Log << Duration.count() << 's' << std::endl;
   }
+  Log << "[+] " << Clauses.size() << " clauses for "
+            << SeedCoverage.size() << " tuples" << std::endl;
 
   // Now we actually generated the weighted conjunctive normal form (WCNF). This
   // format is similar to the DIMACS CNF format, and is described at
   // https://maxsat-evaluations.github.io/2020/rules.html#input
 
   // Write WCNF header
-  std::ofstream OFS(WCNFOutFile);
-  OFS << "c corpus dir: " << CorpusDir << "\nc" << std::endl;
-  for (const auto &[Literal, Seed] : SeedLiterals) {
-    OFS << "c " << Literal << " : " << Seed << std::endl;
+  gzFile WCNFFile = WCNFToStdout
+                        ? gzdopen(STDOUT_FILENO, Compress ? "wb" : "wbT")
+                        : gzopen(WCNFOutFile.c_str(), Compress ? "wb" : "wbT");
+  if (WCNFFile == nullptr) {
+    std::cerr << "[-] Unable to open WCNF file" << std::endl;
+    return 1;
   }
-  OFS << "c" << std::endl;
-  OFS << "p wcnf " << SeedLiterals.size() << ' '
-      << Clauses.size() + SeedLiterals.size() << ' ' << Top << std::endl;
+  WCNFWriter OS(WCNFFile);
+
+  OS << "c corpus dir: " << CorpusDir << "\nc\n";
+  if (SeedMapFile.empty()) {
+    for (const auto &[Literal, Seed] : SeedLiterals) {
+      OS << "c " << Literal << " : " << Seed << '\n';
+    }
+  } else {
+    std::ofstream MapOFS(SeedMapFile);
+    for (const auto &[Literal, Seed] : SeedLiterals) {
+      MapOFS << Literal << " : " << Seed << '\n';
+    }
+    if (!MapOFS.flush()) {
+      std::cerr << "[-] Unable to write seed mapping" << std::endl;
+      return 1;
+    }
+  }
+  OS << "c\n";
+  OS << "p wcnf " << SeedLiterals.size() << ' '
+     << Clauses.size() + SeedLiterals.size() << ' ' << Top << '\n';
 
   // Write clauses
   for (const auto &Clause : Clauses) {
-    OFS << Top << ' ';
+    OS << Top << ' ';
     for (const auto &Seed : Clause) {
-      OFS << Seed << ' ';
+      OS << Seed << ' ';
     }
-    OFS << 0 << std::endl;
+    OS << "0\n";
   }
 
   // Select the minimum number of seeds that cover a particular set of edges
   // (soft constraint)
   for (const auto &[Literal, Seed] : SeedLiterals) {
-    OFS << Weights[Seed] << " -" << Literal << ' ' << 0 << std::endl;
+    OS << static_cast<unsigned>(Weights[Seed]) << " -" << Literal << " 0\n";
+  }
+
+  if (!OS.Close()) {
+    std::cerr << "[-] Unable to write WCNF" << std::endl;
+    return 1;
   }
-  OFS.close();
 
   return 0;
 }
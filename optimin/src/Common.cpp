@@ -1,17 +1,90 @@
+#include <algorithm>
+#include <cctype>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
 #include "Common.h"
 
+/// Hit counts saturate at this value (raw counts, e.g., from llvm-cov, can
+/// exceed 32 bits), so that they are never wrapped into a lower bucket
+static constexpr uint64_t MAX_HIT_COUNT = UINT32_MAX;
+
 void GetAFLCoverage(std::istream &IS, AFLCoverageVector &Cov) {
   std::string Line;
 
   while (std::getline(IS, Line, '\n')) {
     const size_t DelimPos = Line.find(':');
     const uint32_t E = std::stoul(Line.substr(0, DelimPos));
-    const unsigned Freq = std::stoul(Line.substr(DelimPos + 1));
+    const uint64_t Count = std::stoull(Line.substr(DelimPos + 1));
+    const unsigned Freq = std::min(Count, MAX_HIT_COUNT);
 
     Cov.push_back({E, Freq});
   }
 }
 
+bool GetAFLCoverage(const std::string &Path, AFLCoverageVector &Cov) {
+  const int FD = open(Path.c_str(), O_RDONLY);
+  if (FD < 0) {
+    return false;
+  }
+
+  struct stat St;
+  if (fstat(FD, &St) < 0) {
+    close(FD);
+    return false;
+  }
+
+  // `mmap` fails on empty files
+  if (St.st_size == 0) {
+    close(FD);
+    return true;
+  }
+
+  void *Data = mmap(nullptr, St.st_size, PROT_READ, MAP_PRIVATE, FD, 0);
+  close(FD);
+  if (Data == MAP_FAILED) {
+    return false;
+  }
+
+  // Each line is of the form `tuple:count`. Parse in place, rather than
+  // creating a string per line
+  const char *P = static_cast<const char *>(Data);
+  const char *End = P + St.st_size;
+
+  while (P < End) {
+    uint32_t E = 0;
+    uint64_t Freq = 0;
+    bool Valid = false;
+
+    for (; P < End && *P != ':' && *P != '\n'; ++P) {
+      if (std::isdigit(static_cast<unsigned char>(*P))) {
+        E = E * 10 + (*P - '0');
+        Valid = true;
+      }
+    }
+    if (P < End && *P == ':') {
+      ++P;
+    }
+    for (; P < End && *P != '\n'; ++P) {
+      if (std::isdigit(static_cast<unsigned char>(*P)) &&
+          Freq < MAX_HIT_COUNT) {
+        Freq = std::min<uint64_t>(Freq * 10 + (*P - '0'), MAX_HIT_COUNT);
+      }
+    }
+    ++P;
+
+    // Skip blank lines
+    if (Valid) {
+      Cov.push_back({E, static_cast<unsigned>(Freq)});
+    }
+  }
+
+  munmap(Data, St.st_size);
+  return true;
+}
+
 void GetWeights(std::istream &IS, WeightsMap &Weights) {
   std::string Line;
 
@@ -34,6 +34,10 @@ using WeightsMap =
 /// Read AFL coverage as produced by `afl-showmap`
 void GetAFLCoverage(std::istream &, AFLCoverageVector &);
 
+/// Read AFL coverage as produced by `afl-showmap` from a file (via `mmap`).
+/// Returns `false` if the file could not be read
+bool GetAFLCoverage(const std::string &, AFLCoverageVector &);
+
 /// Read a CSV file containing seed weights
 void GetWeights(std::istream &, WeightsMap &);
 
@@ -4,23 +4,71 @@
 Wrapper around `afl-cmin`. Only keeps the names of the files in the minimized
 corpus.
 
+With `--native` (or any of the other long options), `afl-cmin`'s minimization
+is instead performed natively: seeds are replayed with `afl-showmap` in
+parallel (or their coverage read from an HDF5 file), and the corpus can be
+sharded across processes.
+
 Author: Adrian Herrera
 """
 
 
+from functools import partial
 from getopt import getopt
 from pathlib import Path
 from shutil import which
 from subprocess import run
 from tempfile import TemporaryDirectory
+from typing import Dict, List, Tuple
 import os
 import sys
 
+from h5py import File as H5File
 
-def main():
-    """The main function."""
-    opts, args = getopt(sys.argv[1:], '+i:f:m:t:eQC')
+from seed_selection.cmin import load_hdf5, parallel_cmin, replay_showmap
+
+
+LONG_OPTS = ('native', 'jobs=', 'shards=', 'hdf5=')
+
+
+def native_cmin(opts: Dict[str, str], args: List[str]) -> List[str]:
+    """Minimize the corpus natively (rather than with `afl-cmin`)."""
+    if '-f' in opts:
+        raise Exception('`-f` is not supported with `--native` (seeds are '
+                        'replayed in parallel)')
+
+    if '--hdf5' in opts:
+        h5_path = Path(opts['--hdf5'])
+        with H5File(h5_path, 'r') as h5f:
+            sizes = {seed: int(dset.attrs['size']) for seed, dset in
+                     h5f.items()}
+        load = partial(load_hdf5, h5_path=h5_path)
+    else:
+        if '-i' not in opts or not args:
+            raise Exception('An input directory (`-i`) and target are '
+                            'required')
+        in_dir = Path(opts['-i'])
+        with os.scandir(in_dir) as it:
+            sizes = {entry.name: entry.stat().st_size for entry in it
+                     if entry.is_file()}
+
+        showmap_args = []
+        for opt in ('-m', '-t'):
+            if opt in opts:
+                showmap_args.extend([opt, opts[opt]])
+        if '-Q' in opts:
+            showmap_args.append('-Q')
+        load = partial(replay_showmap, in_dir=in_dir, target=args,
+                       showmap_args=showmap_args, crashes_only='-C' in opts)
 
+    return parallel_cmin(sizes, load, edge_only='-e' in opts,
+                         jobs=int(opts.get('--jobs', 1)),
+                         shards=int(opts.get('--shards', 1)), progress=True)
+
+
+def afl_cmin(opts: List[Tuple[str, str]], args: List[str]) -> \
+        Tuple[List[str], int]:
+    """Minimize the corpus with `afl-cmin`."""
     cmin = which('afl-cmin')
     if not cmin:
         raise Exception('afl-cmin not found. Check PATH')
@@ -28,20 +76,29 @@ def main():
     env = os.environ.copy()
     env['AFL_ALLOW_TMP'] = '1'
 
-    ret = 1
-
     with TemporaryDirectory() as temp_dir:
         cmin_args = [cmin, *[val for vals in opts for val in vals],
                      '-o', temp_dir, '--', *args]
         proc = run(cmin_args, check=False, env=env)
 
-        seeds = list(Path(temp_dir).iterdir())
+        seeds = [seed.name for seed in Path(temp_dir).iterdir()]
+
+    return seeds, proc.returncode
+
+
+def main():
+    """The main function."""
+    opts, args = getopt(sys.argv[1:], '+i:f:m:t:eQC', LONG_OPTS)
 
-        print('\nSeeds (%d):' % len(seeds))
-        for seed in seeds:
-            print(seed.name)
+    if any(opt.startswith('--') for opt, _ in opts):
+        seeds = native_cmin(dict(opts), args)
+        ret = 0
+    else:
+        seeds, ret = afl_cmin(opts, args)
 
-        ret = proc.returncode
+    print('\nSeeds (%d):' % len(seeds))
+    for seed in seeds:
+        print(seed)
 
     sys.exit(ret)
 
@@ -12,18 +12,18 @@ import sys
 
 from h5py import File as H5File
 from matplotlib import rc
-from sklearn.decomposition import PCA
+from scipy.sparse import csr_matrix
+from sklearn.decomposition import IncrementalPCA, TruncatedSVD
 from sklearn.preprocessing import StandardScaler
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-from seed_selection.argparse import path_exists
+from seed_selection.argparse import path_exists, positive_int
+from seed_selection.coverage import coverage_matrix
 
 
-# From afl/config.h
-MAP_SIZE_POW2 = 16
-MAP_SIZE = 1 << MAP_SIZE_POW2
+DECOMPOSITIONS = ('svd', 'ipca')
 
 
 def parse_args() -> Namespace:
@@ -33,9 +33,65 @@ def parse_args() -> Namespace:
                         required=True, help='Input HDF5 file')
     parser.add_argument('-o', '--output', metavar='PDF', type=Path,
                         required=True, help='Path to output PDF')
+    parser.add_argument('-d', '--decomposition', choices=DECOMPOSITIONS,
+                        default='svd',
+                        help='Decomposition method. `svd` runs a truncated '
+                             'SVD directly on the (uncentered) sparse matrix. '
+                             '`ipca` runs a (centered) incremental PCA over '
+                             'dense mini-batches')
+    parser.add_argument('-b', '--batch-size', type=positive_int, default=4096,
+                        help='Number of seeds per mini-batch (`ipca` only)')
+    parser.add_argument('-s', '--sample', type=positive_int, default=None,
+                        help='Randomly sample this many seeds')
+    parser.add_argument('--random-seed', type=int, default=None,
+                        help='Random seed used for sampling')
+    parser.add_argument('--map-size', type=positive_int, default=None,
+                        help='Coverage map size (inferred from the largest '
+                             'edge if not given)')
+    parser.add_argument('--scores', metavar='CSV', type=Path,
+                        help='Save the per-seed component scores to a CSV')
     return parser.parse_args()
 
 
+def compact_columns(x: csr_matrix) -> csr_matrix:
+    """Drop the edges (columns) that are not hit by any seed."""
+    x = x.tocsc()
+    return x[:, np.flatnonzero(np.diff(x.indptr))].tocsr()
+
+
+def svd_scores(x: csr_matrix) -> np.ndarray:
+    """Compute the first two components using a truncated SVD."""
+    x = StandardScaler(with_mean=False).fit_transform(x)
+    return TruncatedSVD(n_components=2).fit_transform(x)
+
+
+def ipca_scores(x: csr_matrix, batch_size: int) -> np.ndarray:
+    """
+    Compute the first two principal components using incremental PCA. Only a
+    single batch is ever densified.
+    """
+    batch_size = max(batch_size, 2)
+    scaler = StandardScaler(with_mean=False).fit(x)
+    mean = np.asarray(x.mean(axis=0)).ravel()
+    scale = scaler.scale_
+
+    def batches():
+        # IncrementalPCA requires each batch to have at least as many samples
+        # as components, so fold a short tail into the preceding batch
+        starts = list(range(0, x.shape[0], batch_size))
+        if len(starts) > 1 and x.shape[0] - starts[-1] < 2:
+            starts.pop()
+        ends = starts[1:] + [x.shape[0]]
+        for start, end in zip(starts, ends):
+            yield (x[start:end].toarray() - mean) / scale
+
+    pca = IncrementalPCA(n_components=2)
+    for batch in batches():
+        pca.partial_fit(batch)
+
+    return np.vstack([pca.transform(batch) for batch in batches()])
+
+
 def main():
     """The main function."""
     args = parse_args()
@@ -44,30 +100,34 @@ def main():
     out_pdf = args.output
 
     print('Reading %s...' % in_hdf5)
-    cov_data = {}
     with H5File(in_hdf5, 'r') as h5_file:
-        for cov_file, cov in h5_file.items():
-            df_cov = np.zeros(MAP_SIZE, dtype=np.uint8)
-            if len(cov.shape) == 0:
-                edge, count = cov[()]
-                df_cov[edge] = count
-            else:
-                for edge, count in cov:
-                    df_cov[edge] = count
-            cov_data[cov_file] = list(df_cov)
-
-    df = pd.DataFrame.from_dict(cov_data, orient='index')
-    x = StandardScaler().fit_transform(df)
-    if len(df) <= 1:
+        seeds = list(h5_file.keys())
+        if args.sample and args.sample < len(seeds):
+            rng = np.random.default_rng(args.random_seed)
+            seeds = sorted(str(seed) for seed in
+                           rng.choice(seeds, size=args.sample, replace=False))
+        x, seeds = coverage_matrix(h5_file, seeds, map_size=args.map_size,
+                                   progress=True)
+
+    if x.shape[0] <= 1:
         sys.stderr.write('Not enough seeds to perform PCA')
         sys.exit(1)
 
+    x = compact_columns(x.astype(np.float32))
+    print('%d seeds, %d edges hit' % x.shape)
+
     # Compute PCA
     # TODO determine the number of components
     print('Computing PCA...')
-    pca = PCA(n_components=2)
-    pca_scores = pd.DataFrame(pca.fit_transform(x),
-                              columns=['PCA 1', 'PCA 2']).set_index(df.index)
+    if args.decomposition == 'ipca':
+        scores = ipca_scores(x, args.batch_size)
+    else:
+        scores = svd_scores(x)
+    pca_scores = pd.DataFrame(scores, columns=['PCA 1', 'PCA 2'],
+                              index=pd.Index(seeds, name='seed'))
+
+    if args.scores:
+        pca_scores.to_csv(args.scores)
 
     # Configure plot
     rc('pdf', fonttype=42)
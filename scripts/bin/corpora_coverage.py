@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+"""
+Compare the AFL edge coverage of minimized corpora (rather than just the seed
+names) against each other and the FULL corpus.
+
+Author: Adrian Herrera
+"""
+
+
+from argparse import ArgumentParser, Namespace
+from functools import partial
+from pathlib import Path
+from typing import List, Optional
+import logging
+import multiprocessing.pool as mpp
+
+from h5py import File as H5File
+import numpy as np
+import pandas as pd
+
+from seed_selection import BENCHMARKS
+from seed_selection.argparse import log_level, path_exists, positive_int
+from seed_selection.corpora import popcount, read_corpora
+from seed_selection.coverage import coverage_matrix, covered_edges
+from seed_selection.log import get_logger
+
+
+# Reference corpora, which are not minimized corpora (so are not compared
+# against when computing unique edges)
+REFERENCE_CORPORA = ('full', 'empty')
+
+logger = get_logger('corpora_coverage')
+
+
+def parse_args() -> Namespace:
+    """Parse command-line arguments."""
+    parser = ArgumentParser(description='Compare the coverage of corpora')
+    parser.add_argument('-j', '--jobs', type=positive_int, default=1,
+                        help='Number of parallel jobs')
+    parser.add_argument('-b', '--benchmark', choices=BENCHMARKS,
+                        action='append',
+                        help='Only process the given benchmark(s)')
+    parser.add_argument('-c', '--corpus', action='append',
+                        help='Only process the given corpus (default: all '
+                             'listings in each target directory)')
+    parser.add_argument('-d', '--coverage', metavar='HDF5', required=True,
+                        help='Path to the coverage HDF5 file for each target. '
+                             '`{benchmark}` and `{target}` are substituted '
+                             '(e.g., `cov/{benchmark}/{target}.hdf5`)')
+    parser.add_argument('-l', '--log', type=log_level, default=logging.WARN,
+                        help='Logging level')
+    parser.add_argument('-o', '--output', metavar='CSV', type=Path,
+                        required=True, help='Output CSV')
+    parser.add_argument('--map-size', type=positive_int, default=None,
+                        help='Coverage map size (inferred from the largest '
+                             'edge if not given)')
+    parser.add_argument('--edges', metavar='DIR', type=Path, default=None,
+                        help='Save the packed covered-edge bitsets for each '
+                             'target to `DIR/<benchmark>/<target>.npz`')
+    parser.add_argument('corpora', metavar='DIR', type=path_exists,
+                        help='Corpora directory (laid out as '
+                             '`<benchmark>/<target>/<corpus>.txt`)')
+    return parser.parse_args()
+
+
+def target_coverage(target_dir: Path, coverage: str,
+                    corpora: Optional[List[str]] = None,
+                    map_size: Optional[int] = None,
+                    edges_dir: Optional[Path] = None) -> Optional[pd.DataFrame]:
+    """Compare the coverage of each corpus for a single benchmark target."""
+    benchmark = target_dir.parent.name
+    target = target_dir.name
+
+    h5_path = Path(coverage.format(benchmark=benchmark, target=target))
+    if not h5_path.exists():
+        logger.warning('No coverage for %s/%s (%s). Skipping', benchmark,
+                       target, h5_path)
+        return None
+
+    listings = read_corpora(target_dir, corpora)
+    if not listings:
+        return None
+
+    with H5File(h5_path, 'r') as h5f:
+        # The FULL corpus defaults to every seed with coverage
+        if 'full' not in listings:
+            listings['full'] = list(h5f.keys())
+
+        # Only read the coverage of seeds that appear in some corpus
+        seeds = sorted({seed for listing in listings.values()
+                        for seed in listing if seed in h5f})
+        cov, seeds = coverage_matrix(h5f, seeds, map_size=map_size)
+
+    seed_rows = {seed: i for i, seed in enumerate(seeds)}
+
+    # Union the coverage of each corpus' seeds
+    names = list(listings)
+    no_cov = []
+    bits = []
+    for name in names:
+        rows = np.array([seed_rows[seed] for seed in listings[name]
+                         if seed in seed_rows], dtype=np.int64)
+        no_cov.append(len(set(listings[name])) - len(np.unique(rows)))
+        bits.append(covered_edges(cov, rows))
+    bits = np.vstack(bits)
+
+    if edges_dir:
+        out_path = edges_dir / benchmark / f'{target}.npz'
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(out_path, map_size=cov.shape[1],
+                            **dict(zip(names, bits)))
+
+    # Edges covered by each corpus and no other minimized corpus (for FULL,
+    # these are the edges that every minimized corpus loses), and FULL edges
+    # that each corpus does not cover
+    full = bits[names.index('full')]
+    minimized = [i for i, name in enumerate(names)
+                 if name not in REFERENCE_CORPORA]
+    unique = []
+    for i in range(len(names)):
+        others = [j for j in minimized if j != i]
+        others_bits = np.bitwise_or.reduce(bits[others], axis=0) if others \
+            else np.zeros_like(full)
+        unique.append(bits[i] & ~others_bits)
+    lost = full & ~bits
+
+    return pd.DataFrame(dict(benchmark=benchmark,
+                             target=target,
+                             corpus=names,
+                             seeds=[len(set(listings[name])) for name in names],
+                             seeds_without_cov=no_cov,
+                             edges=popcount(bits),
+                             unique_edges=popcount(np.vstack(unique)),
+                             lost_edges=popcount(lost)))
+
+
+def main():
+    """The main function."""
+    args = parse_args()
+
+    # Initialize logging
+    logger.setLevel(args.log)
+
+    benchmarks = args.benchmark or BENCHMARKS
+    target_dirs = sorted(target_dir for benchmark in benchmarks
+                         for target_dir in (args.corpora / benchmark).glob('*')
+                         if target_dir.is_dir())
+    logger.info('Comparing coverage for %d targets', len(target_dirs))
+
+    results = []
+    with mpp.Pool(processes=args.jobs) as pool:
+        compare = partial(target_coverage, coverage=args.coverage,
+                          corpora=args.corpus, map_size=args.map_size,
+                          edges_dir=args.edges)
+        for df in pool.imap_unordered(compare, target_dirs):
+            if df is None:
+                continue
+            lost = df[df.lost_edges > 0]
+            for row in lost.itertuples():
+                logger.warning('%s/%s: %s lost %d edges relative to FULL',
+                               row.benchmark, row.target, row.corpus,
+                               row.lost_edges)
+            results.append(df)
+
+    if not results:
+        logger.warning('No corpora coverage computed')
+        return
+
+    pd.concat(results).sort_values(['benchmark', 'target', 'corpus']) \
+        .to_csv(args.output, index=False)
+    logger.info('Coverage comparison written to %s', args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+"""
+Tabulate the overlap between corpora for many benchmark targets at once.
+
+Author: Adrian Herrera
+"""
+
+
+from argparse import ArgumentParser, Namespace
+from functools import partial
+from pathlib import Path
+from typing import List, Optional, Tuple
+import logging
+import multiprocessing.pool as mpp
+
+import pandas as pd
+
+from seed_selection import BENCHMARKS
+from seed_selection.argparse import log_level, path_exists, positive_int
+from seed_selection.corpora import (encode_corpora, exclusive_intersections,
+                                    pairwise_overlap, read_corpora)
+from seed_selection.log import get_logger
+
+
+logger = get_logger('corpora_overlap')
+
+
+def parse_args() -> Namespace:
+    """Parse command-line arguments."""
+    parser = ArgumentParser(description='Tabulate corpora overlap')
+    parser.add_argument('-j', '--jobs', type=positive_int, default=1,
+                        help='Number of parallel jobs')
+    parser.add_argument('-b', '--benchmark', choices=BENCHMARKS,
+                        action='append',
+                        help='Only process the given benchmark(s)')
+    parser.add_argument('-c', '--corpus', action='append',
+                        help='Only process the given corpus (default: all '
+                             'listings in each target directory)')
+    parser.add_argument('-l', '--log', type=log_level, default=logging.WARN,
+                        help='Logging level')
+    parser.add_argument('-o', '--output', metavar='DIR', type=Path,
+                        required=True, help='Output directory for the '
+                                            'overlap tables')
+    parser.add_argument('corpora', metavar='DIR', type=path_exists,
+                        help='Corpora directory (laid out as '
+                             '`<benchmark>/<target>/<corpus>.txt`)')
+    return parser.parse_args()
+
+
+def target_overlap(target_dir: Path,
+                   corpora: Optional[List[str]] = None) -> Tuple[pd.DataFrame,
+                                                                 pd.DataFrame]:
+    """Compute the overlap tables for a single benchmark target."""
+    benchmark = target_dir.parent.name
+    target = target_dir.name
+
+    listings = read_corpora(target_dir, corpora)
+    if 'full' not in listings:
+        logger.warning('No FULL corpus for %s/%s. Skipping', benchmark, target)
+        return None, None
+
+    missing = []
+    names, bits, _ = encode_corpora(listings, warn=missing.append)
+    if missing:
+        logger.warning('%d seed(s) in %s/%s are not in the FULL corpus',
+                       len(missing), benchmark, target)
+
+    pairwise = pairwise_overlap(names, bits)
+    intersections = exclusive_intersections(names, bits)
+    for df in (pairwise, intersections):
+        df.insert(0, 'target', target)
+        df.insert(0, 'benchmark', benchmark)
+
+    return pairwise, intersections
+
+
+def main():
+    """The main function."""
+    args = parse_args()
+    out_dir = args.output
+
+    # Initialize logging
+    logger.setLevel(args.log)
+
+    benchmarks = args.benchmark or BENCHMARKS
+    target_dirs = sorted(target_dir for benchmark in benchmarks
+                         for target_dir in (args.corpora / benchmark).glob('*')
+                         if target_dir.is_dir())
+    logger.info('Computing overlap for %d targets', len(target_dirs))
+
+    pairwise = []
+    intersections = []
+    with mpp.Pool(processes=args.jobs) as pool:
+        overlap = partial(target_overlap, corpora=args.corpus)
+        for pw_df, inter_df in pool.imap_unordered(overlap, target_dirs):
+            if pw_df is None:
+                continue
+            pairwise.append(pw_df)
+            intersections.append(inter_df)
+
+    if not pairwise:
+        logger.warning('No corpora found in %s', args.corpora)
+        return
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    sort_cols = ['benchmark', 'target']
+    pd.concat(pairwise).sort_values(sort_cols + ['a', 'b']) \
+        .to_csv(out_dir / 'pairwise.csv', index=False)
+    pd.concat(intersections).sort_values(sort_cols, kind='stable') \
+        .to_csv(out_dir / 'intersections.csv', index=False)
+    logger.info('Overlap tables written to %s', out_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,60 +1,86 @@
 #!/usr/bin/env python3
 
 """
-Run multiple fuzzing campaigns in parallel.
+Run multiple fuzzing campaigns (possibly with different fuzzers) in parallel.
 
 Author: Adrian Herrera
 """
 
 
 from argparse import ArgumentParser, Namespace
-from concurrent.futures import ProcessPoolExecutor as Executor
-from csv import DictWriter
+from csv import writer as csv_writer
+from contextlib import nullcontext
 from datetime import datetime
 from pathlib import Path
-from shutil import which
-from subprocess import PIPE, run
-from time import sleep
-from typing import TextIO
-import gzip
+from shutil import rmtree, which
+from subprocess import Popen
+from typing import Dict, List, Optional, Tuple, Union
+import asyncio
+import json
 import logging
 import os
-import re
-
-from watchdog.observers import Observer
-from watchdog.events import PatternMatchingEventHandler
-
-from seed_selection.log import FORMATTER as LOG_FORMATTER
-from seed_selection.argparse import mem_limit, path_exists, positive_int
-
-
-AFL_SEED_RE = re.compile(r'''^id[:_]''')
-TIMESTAMP_FIELDNAMES = ('seed', 'size', 'unix_time', 'time_offset')
-
-
-class FuzzEventHandler(PatternMatchingEventHandler):
-    """Only capture testcase creation events."""
-
-    def __init__(self, logger: logging.Logger) -> None:
-        patterns = [
-            str(Path('*') / 'crashes' / 'id:*'),
-            str(Path('*') / 'hangs' / 'id:*'),
-            str(Path('*') / 'queue' / 'id:*'),
-        ]
-        super().__init__(patterns=patterns)
-        self._logger = logger
-
-    def on_created(self, event) -> None:
-        super().on_created(event)
-        self._logger.info(event.src_path)
+import signal
+import sys
+
+from seed_selection.log import get_logger
+from seed_selection.argparse import (cpu_list, log_level, mem_limit,
+                                     path_exists, positive_int)
+from seed_selection.cores import CoreAllocator
+from seed_selection.fuzzers import FUZZERS, Fuzzer, get_fuzzer
+from seed_selection.journal import Journal
+from seed_selection.resources import (RESOURCE_FIELDNAMES, AccountedPopen,
+                                      Cgroup, ProcSampler, rusage_to_dict)
+from seed_selection.staging import StagingArea, free_space, sync_tree
+from seed_selection.timestamps import (TestcaseCollector, timestamp_testcases,
+                                       write_timestamps)
+
+
+JOURNAL_NAME = 'journal.db'
+# Options that must not change when resuming an experiment
+RESUME_CONFIG = ('fuzzers', 'fuzzer_targets', 'input', 'nodes', 'timeout',
+                 'memory', 'trial_len', 'cmp_log', 'trial_memory',
+                 'trial_cpus', 'target', 'target_args')
+
+# Warn when a staged trial uses this fraction of its staging space
+STAGING_WARN_FRACTION = 0.8
+# Staged files read by fuzz_monitor.py, and how often (in seconds) they are
+# synced (well within fuzz_monitor.py's default --stale of 120 seconds)
+STATS_FILES = ('fuzzer_stats', 'plot_data')
+STATS_SYNC_INTERVAL = 30
+
+# How often (in seconds) fuzzer processes are polled
+POLL_INTERVAL = 1
+# How long (in seconds) to wait for a fuzzer to exit after SIGINT before
+# killing it
+KILL_GRACE_PERIOD = 30
+
+logger = get_logger('fuzz')
 
 
 def parse_args() -> Namespace:
     """Parse command-line arguments."""
     parser = ArgumentParser(description='Run a fuzzer experiment')
-    parser.add_argument('-j', '--jobs', type=positive_int,
-                        default=os.cpu_count() // 3,
-                        help='Number of concurrent fuzz campaigns')
+    parser.add_argument('-f', '--fuzzer', metavar='NAME[=PATH]',
+                        dest='fuzzers', action='append',
+                        help='Fuzzer to run (%s). May be repeated to run '
+                             'multiple fuzzers in the same experiment. The '
+                             'fuzzer executable can be given explicitly '
+                             '(default: afl)' % ', '.join(FUZZERS))
+    parser.add_argument('--fuzzer-target', metavar='NAME=PATH',
+                        dest='fuzzer_targets', action='append', default=[],
+                        help='Target program to use for a particular fuzzer '
+                             '(e.g., one built with that fuzzer\'s '
+                             'instrumentation)')
+    parser.add_argument('-j', '--jobs', type=positive_int, default=None,
+                        help='Number of cores to use, i.e., concurrent fuzzer '
+                             'nodes (default: all available cores)')
+    parser.add_argument('--cores', metavar='LIST', type=cpu_list,
+                        default=None,
+                        help='Cores to run fuzzers on, as a CPU list (e.g., '
+                             '`0-15,32-47`. Default: all available cores)')
+    parser.add_argument('--no-pin', action='store_true',
+                        help='Do not pin fuzzers to cores (i.e., let the '
+                             'fuzzer bind to a core itself)')
     parser.add_argument('-i', '--input', metavar='DIR', type=path_exists,
                         required=True,
                         help='Path to the input corpus directory')
@@ -68,14 +94,51 @@ def parse_args() -> Namespace:
     parser.add_argument('-n', '--nodes', type=positive_int, default=2,
                         help='Number of fuzzer nodes')
     parser.add_argument('-w', '--watch', action='store_true',
-                        help='Watch the output directory and generate timestamps')
+                        help='Record testcase creation times while fuzzing')
+    parser.add_argument('-l', '--log', type=log_level, default=logging.INFO,
+                        help='Logging level')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume an interrupted experiment. Completed '
+                             'trials are skipped, and incomplete trials are '
+                             'rerun from scratch')
+    parser.add_argument('--force', action='store_true',
+                        help='Resume even if the configuration differs from '
+                             'the resumed experiment\'s')
     parser.add_argument('--num-trials', type=positive_int, default=30,
                         help='The number of repeated trials to perform')
     parser.add_argument('--trial-len', type=positive_int, default=18 * 60 * 60,
                         help='The length of an individual trial (in seconds)')
+    parser.add_argument('--startup-timeout', type=positive_int, default=120,
+                        help='Time (in seconds) to wait for a fuzzer to start '
+                             'up before starting the next fuzzer')
+    parser.add_argument('--sample-interval', type=positive_int, default=60,
+                        help='How often (in seconds) to sample each fuzzer\'s '
+                             'resource usage')
+    parser.add_argument('--cgroup', metavar='DIR', dest='parent_cgroup',
+                        type=path_exists,
+                        help='Run each trial in its own cgroup (v2), created '
+                             'under the given (delegated) cgroup')
+    parser.add_argument('--trial-memory', type=mem_limit, default=None,
+                        help='Memory limit for each trial (requires --cgroup)')
+    parser.add_argument('--trial-cpus', type=float, default=None,
+                        help='CPU quota for each trial, in number of CPUs '
+                             '(requires --cgroup)')
+    parser.add_argument('--stage', action='store_true',
+                        help='Stage fuzzer output in a temporary (preferably '
+                             'tmpfs) directory, and periodically sync it to '
+                             'the output directory')
+    parser.add_argument('--staging-dir', metavar='DIR', type=path_exists,
+                        help='Directory to create the staging area in '
+                             '(default: /dev/shm if available)')
+    parser.add_argument('--staging-size', type=mem_limit, default='2G',
+                        help='Staging space reserved for each trial. Trials '
+                             'are queued until space is available')
+    parser.add_argument('--sync-interval', type=positive_int, default=300,
+                        help='How often (in seconds) staged output is synced '
+                             'to the output directory')
     parser.add_argument('--cmp-log', metavar='BIN', type=Path,
                         help='Path to cmp-log instrumented binary (if fuzzing '
-                             'with AFL++)')
+                             'with aflplusplus)')
     parser.add_argument('target', metavar='TARGET', type=path_exists,
                         help='Target program')
     parser.add_argument('target_args', metavar='ARG', nargs='*',
@@ -83,150 +146,516 @@ def parse_args() -> Namespace:
     return parser.parse_args()
 
 
-def get_logger(log_file: TextIO) -> logging.Logger:
-    """Create a logger for recording file creation events."""
-    handler = logging.StreamHandler(log_file)
-    handler.setFormatter(LOG_FORMATTER)
-
-    name = '.'.join(log_file.name.split(os.sep)[-3:])
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    logger.addHandler(handler)
-
-    return logger
-
-
-def create_watchdog(logger: logging.Logger, fuzz_dir: Path) -> Observer:
-    """Create a watchdog observer for recording file creation events."""
-    handler = FuzzEventHandler(logger)
-    observer = Observer()
-    observer.schedule(handler, fuzz_dir, recursive=True)
-
-    return observer
-
-
-def timestamp_results(out_dir: Path, start_time: datetime) -> dict:
-    """Timestamp the results of AFL."""
-    stats = []
-
-    for root, dirs, files in os.walk(out_dir):
-        # Ignore hidden directories
-        dirs[:] = [d for d in dirs if not d[0] == '.']
-
-        for name in files:
-            if not AFL_SEED_RE.match(name):
-                continue
-
-            seed = Path(root) / name
-            ctime = seed.stat().st_ctime
-
-            stat_dict = dict(seed=str(seed), unix_time=ctime,
-                             time_offset=ctime - start_time.timestamp(),
-                             size=seed.stat().st_size)
-            stats.append(stat_dict)
-
-    return stats
-
-
-def run_fuzzer(afl: Path, out_dir: Path, node: int, **kwargs) -> int:
-    """Run a fuzzer, and log testcases as they are created."""
-    # Create AFL command-line. We use `timeout` because a timeout in
-    # subprocess.run causes us to lose our `CompletedProcess` object
-    args = ['timeout', '%ds' % kwargs['trial_len'],
-            afl, '-i', str(kwargs['input']), '-o', str(out_dir.parent)]
-
-    if kwargs['timeout']:
-        args.extend(['-t', str(kwargs['timeout'])])
-    if kwargs['memory'] and not kwargs['cmp_log']:
-        args.extend(['-m', kwargs['memory']])
-
-    if node == 1:
-        args.extend(['-M', out_dir.name])
-    else:
-        args.extend(['-S', out_dir.name])
-
-    if kwargs['cmp_log']:
-        args.extend(['-m', 'none', '-c', str(kwargs['cmp_log'])])
-    if 'fuzzer_args' in kwargs:
-        args.extend(kwargs['fuzzer_args'])
-
-    args.extend(['--', str(kwargs['target']), *kwargs['target_args']])
-
-    # Create AFL environment
+async def wait_ready(fuzzer: Fuzzer, proc: Popen, out_dir: Path,
+                     timeout: int) -> bool:
+    """
+    Wait for the fuzzer to finish starting up (e.g., for AFL to write its
+    `fuzzer_stats` file). Returns `False` if the fuzzer exited or did not
+    become ready within the timeout.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    while loop.time() < deadline:
+        if fuzzer.is_ready(out_dir):
+            return True
+        if proc.poll() is not None:
+            return False
+        await asyncio.sleep(POLL_INTERVAL)
+
+    return False
+
+
+async def wait_fuzzer(proc: Popen, trial_len: int) -> bool:
+    """
+    Wait for the fuzzer to run for `trial_len` seconds, then stop it (with
+    SIGINT, so that the fuzzer exits cleanly). Returns `True` if the fuzzer was
+    stopped, or `False` if it exited by itself.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + trial_len
+    kill_deadline = None
+
+    while proc.poll() is None:
+        now = loop.time()
+        if kill_deadline is None and now >= deadline:
+            proc.send_signal(signal.SIGINT)
+            kill_deadline = now + KILL_GRACE_PERIOD
+        elif kill_deadline is not None and now >= kill_deadline:
+            proc.kill()
+        await asyncio.sleep(POLL_INTERVAL)
+
+    return kill_deadline is not None
+
+
+async def stop_fuzzer(proc: Popen) -> None:
+    """
+    Stop a fuzzer that is still running (e.g., because its trial was
+    cancelled) and wait for it to exit. The fuzzer is sent SIGINT, and killed
+    if it does not exit within the grace period.
+    """
+    if proc.poll() is not None:
+        return
+
+    loop = asyncio.get_running_loop()
+    kill_deadline = loop.time() + KILL_GRACE_PERIOD
+    try:
+        proc.send_signal(signal.SIGINT)
+        while proc.poll() is None and loop.time() < kill_deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+async def sample_resources(sampler: Union[Cgroup, ProcSampler], out_path: Path,
+                           interval: int) -> None:
+    """Periodically sample a fuzzer's resource usage to a CSV file."""
+    with open(out_path, 'w') as outf:
+        writer = csv_writer(outf)
+        writer.writerow(RESOURCE_FIELDNAMES)
+        while True:
+            sample = sampler.sample()
+            writer.writerow(sample[field] for field in RESOURCE_FIELDNAMES)
+            outf.flush()
+            await asyncio.sleep(interval)
+
+
+def write_resource_summary(proc: AccountedPopen, out_path: Path,
+                           wall_time: float,
+                           cgroup: Optional[Cgroup] = None) -> None:
+    """Write a fuzzer's total resource usage."""
+    summary = dict(wall_time=wall_time, exit_code=proc.returncode)
+    if proc.rusage:
+        summary.update(rusage_to_dict(proc.rusage))
+    if cgroup:
+        summary.update(cgroup.summary())
+    with open(out_path, 'w') as outf:
+        json.dump(summary, outf, indent=2)
+
+
+def timestamp_node(fuzzer: Fuzzer, out_dir: Path,
+                   seed_dir: Optional[Path] = None) -> None:
+    """
+    Timestamp everything produced by the fuzzer. If `seed_dir` is given, seed
+    paths are made relative to it (rather than `out_dir`).
+    """
+    records = timestamp_testcases(out_dir, fuzzer.testcase_dirs,
+                                  fuzzer.testcase_re)
+    if seed_dir:
+        records['seed'] = [str(seed_dir / Path(seed).relative_to(out_dir))
+                           for seed in records['seed']]
+    write_timestamps(records, out_dir / 'timestamps.csv')
+
+
+async def run_fuzzer(fuzzer: Fuzzer, out_dir: Path, trial: str, node: int,
+                     startup_lock: asyncio.Lock, journal: Journal,
+                     collector: Optional[TestcaseCollector] = None,
+                     core: Optional[int] = None,
+                     cgroup: Optional[Cgroup] = None,
+                     seed_dir: Optional[Path] = None,
+                     **kwargs) -> Tuple[int, bool]:
+    """
+    Run a fuzzer. If a collector is given, testcases are logged as they are
+    created. If a core is given, the fuzzer (and its target) is pinned to that
+    core. If a cgroup is given, the fuzzer (and its target) runs in it. The
+    fuzzer's start (and failure) is recorded in the experiment journal, and its
+    resource usage is sampled to `resources.csv` (with totals in
+    `resources.json`). Seed paths in `timestamps.csv` are relative to
+    `seed_dir` (if given).
+
+    Returns the fuzzer's exit code and whether it ran for the entire trial.
+    The trial records the node as finished once its output is safely stored.
+    """
+    args = fuzzer.command_line(out_dir, node, **kwargs)
+
+    # Create fuzzer environment
     env = os.environ.copy()
-    env['AFL_NO_UI'] = '1'
-
-    # Create watchdog. Testcase creation times are logged to a compressed file
+    env.update(fuzzer.environment(pinned=core is not None))
+
+    # Pin the fuzzer
+    if core is not None:
+        args = [kwargs['taskset'], '--cpu-list', str(core), *args]
+    if cgroup:
+        args = cgroup.wrap_command(args)
+
+    if collector:
+        collector.watch(out_dir, fuzzer.testcase_dirs, fuzzer.testcase_re)
+
+    # Start the fuzzer. Fuzzer output is streamed straight to log files. Only
+    # one fuzzer starts up at a time, so that start-up is staggered (and to
+    # avoid races when a fuzzer attempts to bind to a core)
+    proc = None
+    sampler_task = None
+    try:
+        with open(out_dir / 'stdout.log', 'wb') as stdout, \
+                open(out_dir / 'stderr.log', 'wb') as stderr:
+            async with startup_lock:
+                start_time = datetime.now()
+                logger.info('%s', ' '.join(str(arg) for arg in args))
+                proc = AccountedPopen(args, stdout=stdout, stderr=stderr,
+                                      env=env)
+                journal.start(trial, node)
+                sampler_task = asyncio.create_task(sample_resources(
+                    cgroup or ProcSampler(proc.pid),
+                    out_dir / 'resources.csv', kwargs['sample_interval']))
+                if not await wait_ready(fuzzer, proc, out_dir,
+                                        kwargs['startup_timeout']):
+                    if proc.poll() is None:
+                        logger.warning('%s did not start within %ds', out_dir,
+                                       kwargs['startup_timeout'])
+
+            stopped = await wait_fuzzer(proc, kwargs['trial_len'])
+
+        sampler_task.cancel()
+        write_resource_summary(proc, out_dir / 'resources.json',
+                               (datetime.now() - start_time).total_seconds(),
+                               cgroup)
+
+        if not stopped:
+            logger.error('%s exited early (return code %d). See %s', out_dir,
+                         proc.returncode, out_dir / 'stderr.log')
+
+        # Timestamp everything produced by the fuzzer (without blocking the
+        # other fuzzers' event handling)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, timestamp_node, fuzzer, out_dir,
+                                   seed_dir)
+
+        return proc.returncode, stopped
+    except (Exception, asyncio.CancelledError):
+        journal.finish(trial, node, None, False)
+        raise
+    finally:
+        # Cleanup. The fuzzer is still running if this node failed or was
+        # cancelled, and must exit before its trial's resources are released
+        if proc:
+            await stop_fuzzer(proc)
+        if sampler_task:
+            sampler_task.cancel()
+        if collector:
+            collector.unwatch(out_dir)
+
+
+async def sync_staged(stage_dir: Path, trial_dir: Path,
+                      synced: Dict[str, Tuple[int, int]], interval: int,
+                      trial_size: int) -> None:
+    """
+    Periodically sync a staged trial to its persistent directory. Statistics
+    files are synced every `STATS_SYNC_INTERVAL` seconds (so that the trial can
+    be monitored), and everything else every `interval` seconds. A trial that
+    grows past its staging space is synced every time its statistics are (so
+    that as little as possible is lost if the staging area fills up).
+    """
+    loop = asyncio.get_running_loop()
+    check_interval = min(interval, STATS_SYNC_INTERVAL)
+    next_sync = loop.time() + interval
+    over_budget = False
+    while True:
+        await asyncio.sleep(check_interval)
+        full_sync = over_budget or loop.time() >= next_sync
+        try:
+            num_copied, size = await loop.run_in_executor(
+                None, sync_tree, stage_dir, trial_dir, synced,
+                None if full_sync else STATS_FILES)
+            if size > trial_size and not full_sync:
+                num_copied, size = await loop.run_in_executor(
+                    None, sync_tree, stage_dir, trial_dir, synced)
+                full_sync = True
+        except OSError as e:
+            logger.warning('Failed to sync %s: %s', stage_dir, e)
+            continue
+
+        logger.debug('Synced %d files from %s', num_copied, stage_dir)
+        if full_sync:
+            next_sync = loop.time() + interval
+
+        if size > trial_size:
+            if not over_budget:
+                logger.warning('%s has exceeded its staging space (%d MB). '
+                               'Syncing every %d seconds', trial_dir,
+                               trial_size // 1024 // 1024, check_interval)
+        elif size > STAGING_WARN_FRACTION * trial_size:
+            logger.warning('%s is using %d%% of its staging space', trial_dir,
+                           size * 100 // trial_size)
+        over_budget = size > trial_size
+        if free_space(stage_dir) < (1 - STAGING_WARN_FRACTION) * trial_size:
+            logger.warning('The staging area is almost full')
+
+
+async def run_trial(fuzzer: Fuzzer, trial_dir: Path, trial: str,
+                    core_allocator: CoreAllocator, startup_lock: asyncio.Lock,
+                    journal: Journal,
+                    collector: Optional[TestcaseCollector] = None,
+                    staging: Optional[StagingArea] = None,
+                    **kwargs) -> List[int]:
+    """
+    Run all of the fuzzer nodes for a single trial, and return their exit
+    codes (0 for nodes that ran for the entire trial). The trial is queued until
+    there is a free core for each node (and, if staging, space in the staging
+    area). If a parent cgroup is given, the trial (and each of its nodes) runs
+    in its own cgroup, and the trial's quotas are enforced.
+
+    When staging, fuzzers write to the staging area, which is periodically
+    synced to `trial_dir`. Timestamps are generated from the staged files
+    (before the final sync changes their creation times). Nodes are only
+    recorded as complete in the journal once the final sync succeeds, so that
+    an unsynced trial is rerun on `--resume`.
+    """
+    num_nodes = kwargs['nodes']
+
+    async with staging.reserve() if staging else nullcontext():
+        trial_cores = await core_allocator.allocate(num_nodes)
+        logger.debug('%s allocated cores %s', trial, trial_cores)
+
+        out_dir = staging.trial_dir(trial) if staging else trial_dir
+        trial_cgroup = None
+        node_cgroups = {}
+        sync_task = None
+        synced = {}
+        tasks = []
+        results = []
+        flushed = True
+        try:
+            trial_dir.mkdir(exist_ok=True)
+            out_dir.mkdir(exist_ok=True)
+
+            # Processes can only live in leaf cgroups, so each node gets its
+            # own cgroup under the trial's cgroup (where the quotas are set)
+            if kwargs['parent_cgroup']:
+                trial_cgroup = Cgroup(kwargs['parent_cgroup'] /
+                                      trial.replace('/', '-'))
+                trial_cgroup.create()
+                memory_max = kwargs['trial_memory']
+                trial_cgroup.set_limits(
+                    memory_max=memory_max * 1024 * 1024 if memory_max else None,
+                    cpu_max=kwargs['trial_cpus'])
+                for node in range(1, 1 + num_nodes):
+                    node_cgroups[node] = \
+                        trial_cgroup.child(f'fuzzer-{node:02d}')
+                    node_cgroups[node].create()
+
+            if staging:
+                sync_task = asyncio.create_task(sync_staged(
+                    out_dir, trial_dir, synced, kwargs['sync_interval'],
+                    staging.trial_size))
+
+            # Nodes acquire the startup lock in order, so the main node always
+            # starts first
+            for node, core in zip(range(1, 1 + num_nodes), trial_cores):
+                node_name = f'fuzzer-{node:02d}'
+                node_dir = out_dir / node_name
+                node_dir.mkdir(exist_ok=True)
+                core = None if kwargs['no_pin'] else core
+                tasks.append(asyncio.create_task(
+                    run_fuzzer(fuzzer, node_dir, trial, node, startup_lock,
+                               journal, collector=collector, core=core,
+                               cgroup=node_cgroups.get(node),
+                               seed_dir=trial_dir / node_name, **kwargs)))
+
+            results = await asyncio.gather(*tasks)
+        finally:
+            # If a node failed (or the trial was cancelled), the other nodes
+            # are still running. Stop them before releasing their cores,
+            # cgroups and staging space
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            for cgroup in (*node_cgroups.values(), trial_cgroup):
+                if cgroup and not cgroup.remove():
+                    logger.warning('Failed to remove cgroup %s', cgroup.path)
+            await core_allocator.release(trial_cores)
+
+            # Final flush of the staged trial. Errors are logged (rather than
+            # raised) so that they do not hide an earlier error
+            if staging:
+                if sync_task:
+                    sync_task.cancel()
+                loop = asyncio.get_running_loop()
+                try:
+                    await loop.run_in_executor(None, sync_tree, out_dir,
+                                               trial_dir, synced)
+                except OSError as e:
+                    logger.error('Failed to sync %s to %s: %s', out_dir,
+                                 trial_dir, e)
+                    flushed = False
+                if out_dir.exists():
+                    try:
+                        rmtree(out_dir)
+                    except OSError as e:
+                        logger.warning('Failed to remove %s: %s', out_dir, e)
+
+    for node, (exit_code, stopped) in enumerate(results, 1):
+        journal.finish(trial, node, exit_code, stopped and flushed)
+    if not flushed:
+        raise Exception('Trial %s was not synced to %s' % (trial, trial_dir))
+
+    return [exit_code if not stopped else 0 for exit_code, stopped in results]
+
+
+async def run_experiment(backends: List[Fuzzer], targets: Dict[str, Path],
+                         core_allocator: CoreAllocator, journal: Journal,
+                         staging: Optional[StagingArea] = None,
+                         **kwargs) -> int:
+    """
+    Run all trials of the experiment from a single event loop. Trials that the
+    journal records as complete are skipped. Returns the number of failed
+    fuzzer nodes.
+
+    If there are multiple fuzzers, each fuzzer's trials are stored in their
+    own subdirectory. Trials of different fuzzers are interleaved, so that all
+    fuzzers are scheduled identically.
+    """
+    startup_lock = asyncio.Lock()
+    completed = journal.completed_trials(kwargs['nodes'])
+
+    # A single collector records testcase creation for all fuzzer nodes
+    collector = None
     if kwargs['watch']:
-        log_file = gzip.open(out_dir / 'watchdog.log.gz', 'wt')
-        logger = get_logger(log_file)
-        watchdog = create_watchdog(logger, out_dir)
-        watchdog.start()
-
-    # Start the fuzzer
+        collector = TestcaseCollector()
+        collector.start()
+        if not collector.uses_inotify:
+            logger.warning('inotify unavailable. Falling back to scanning '
+                           'testcase directories')
+
+    out_dir = kwargs['output']
+    trials = {}
+    for trial_num in range(1, kwargs['num_trials'] + 1):
+        for fuzzer in backends:
+            trial_dir = out_dir / f'trial-{trial_num:02d}'
+            if len(backends) > 1:
+                trial_dir = out_dir / fuzzer.name / trial_dir.name
+            trial = str(trial_dir.relative_to(out_dir))
+
+            if trial in completed:
+                logger.info('Skipping completed trial %s', trial)
+                continue
+            if trial_dir.exists():
+                logger.warning('Discarding incomplete trial %s', trial)
+                rmtree(trial_dir)
+            trial_dir.parent.mkdir(exist_ok=True)
+
+            trial_kwargs = dict(kwargs)
+            trial_kwargs['target'] = targets.get(fuzzer.name,
+                                                 kwargs['target'])
+            task = asyncio.create_task(run_trial(fuzzer, trial_dir, trial,
+                                                 core_allocator, startup_lock,
+                                                 journal, collector=collector,
+                                                 staging=staging,
+                                                 **trial_kwargs))
+            trials[task] = trial_dir
+
+    # Report failures as soon as each trial completes
+    num_failed = 0
     try:
-        start_time = datetime.now()
-        print('[%s] %s' % (start_time, ' '.join(args)))
-        proc = run(args, stdout=PIPE, stderr=PIPE, env=env, check=False)
-
-        # Save fuzzer output
-        with open(out_dir / 'stdout.log', 'wb') as outf:
-            outf.write(proc.stdout)
-        with open(out_dir / 'stderr.log', 'wb') as outf:
-            outf.write(proc.stderr)
-
-        # Timestamp everything produced by the fuzzer
-        stats = []
-        for name in ('queue', 'crashes', 'hangs'):
-            stats.extend(timestamp_results(out_dir / name, start_time))
-        stats.sort(key=lambda d: d['unix_time'])
-        with open(out_dir / 'timestamps.csv', 'w') as outf:
-            writer = DictWriter(outf, fieldnames=TIMESTAMP_FIELDNAMES)
-            writer.writeheader()
-            writer.writerows(stats)
-
-        return proc.returncode
+        for task in asyncio.as_completed(trials):
+            try:
+                ret_codes = await task
+            except Exception as e:
+                logger.exception('Trial failed: %s', e)
+                num_failed += kwargs['nodes']
+                continue
+            num_failed += sum(1 for ret in ret_codes if ret != 0)
     finally:
-        # Cleanup
-        watchdog.stop()
-        watchdog.join()
-        log_file.close()
+        if collector:
+            collector.stop()
 
-    return None
+    return num_failed
 
 
 def main():
     """The main function."""
     args = parse_args()
 
-    afl = which('afl-fuzz')
-    if not afl:
-        raise Exception('Cannot find `afl-fuzz`. Check PATH')
+    # Initialize logging
+    logger.setLevel(args.log)
+
+    backends = [get_fuzzer(spec) for spec in args.fuzzers or ['afl']]
+    names = [fuzzer.name for fuzzer in backends]
+    if len(set(names)) != len(names):
+        raise Exception('Each fuzzer can only be given once')
+    if args.cmp_log and 'aflplusplus' not in names:
+        raise Exception('--cmp-log requires the aflplusplus fuzzer')
+
+    if args.parent_cgroup and not Cgroup.is_available(args.parent_cgroup):
+        raise Exception('%s is not a cgroup v2 directory' % args.parent_cgroup)
+    if (args.trial_memory or args.trial_cpus) and not args.parent_cgroup:
+        raise Exception('--trial-memory/--trial-cpus require --cgroup')
+
+    targets = {}
+    for spec in args.fuzzer_targets:
+        name, _, target = spec.partition('=')
+        if name not in names or not target:
+            raise Exception('Invalid fuzzer target `%s`' % spec)
+        targets[name] = path_exists(target)
+
+    taskset = which('taskset')
+    if not taskset and not args.no_pin:
+        raise Exception('Cannot find `taskset`. Check PATH (or use --no-pin)')
+
+    # Determine the cores to fuzz on. Cores are allocated to trials such that
+    # all nodes in a trial share a NUMA node
+    cores = args.cores or sorted(os.sched_getaffinity(0))
+    if args.jobs:
+        cores = cores[:args.jobs]
+    core_allocator = CoreAllocator(cores)
 
-    num_jobs = args.jobs
     num_nodes = args.nodes
-
-    if num_jobs % num_nodes != 0:
-        raise Exception('The number of jobs (%d) must be divisible by the '
-                        'number of nodes (%d)' % (num_jobs, num_nodes))
+    if num_nodes > core_allocator.num_cores:
+        raise Exception('The number of nodes (%d) exceeds the number of '
+                        'cores (%d)' % (num_nodes, core_allocator.num_cores))
+    logger.info('Fuzzing on %d cores (NUMA nodes: %s)',
+                core_allocator.num_cores,
+                ', '.join(f'{node}: {len(node_cores)} cores' for node, node_cores
+                          in core_allocator.numa_nodes.items()))
 
     out_dir = args.output
+    journal_path = out_dir / JOURNAL_NAME
+    if not args.resume and (journal_path.exists() or
+                            any(out_dir.glob('trial-*')) or
+                            any(out_dir.glob('*/trial-*'))):
+        raise Exception('%s contains a previous experiment. Use --resume to '
+                        'resume it' % out_dir)
     out_dir.mkdir(exist_ok=True)
 
-    with Executor(max_workers=num_jobs) as executor:
-        for trial in range(1, args.num_trials + 1):
-            # Create output directory
-            trial_dir = args.output / f'trial-{trial:02d}'
-            trial_dir.mkdir(exist_ok=True)
-
-            # Run the fuzzer node
-            for node in range(1, 1 + args.nodes):
-                node_dir = trial_dir / f'fuzzer-{node:02d}'
-                node_dir.mkdir(exist_ok=True)
-
-                # Sleep to avoid races when AFL attempts to bind to a core
-                executor.submit(run_fuzzer, afl, node_dir, node, **vars(args))
-                sleep(1.5)
+    with Journal(journal_path) as journal:
+        # Resuming with a different configuration would mix incomparable
+        # trials
+        config = {key: str(getattr(args, key)) for key in RESUME_CONFIG}
+        prev_config = journal.get_config()
+        diffs = [key for key, val in prev_config.items()
+                 if config.get(key) != val]
+        for key in diffs:
+            logger.warning('`%s` differs from the resumed experiment '
+                           '(%s vs. %s)', key, config.get(key),
+                           prev_config[key])
+        if diffs and not args.force:
+            raise Exception('The configuration differs from the resumed '
+                            'experiment (%s). Use --force to resume it anyway'
+                            % ', '.join(diffs))
+        if not prev_config:
+            journal.set_config(config)
+
+        staging = None
+        if args.stage:
+            staging = StagingArea(args.staging_dir,
+                                  args.staging_size * 1024 * 1024)
+            logger.info('Staging up to %d trials in %s', staging.max_trials,
+                        staging.root)
+        try:
+            num_failed = asyncio.run(run_experiment(backends, targets,
+                                                    core_allocator, journal,
+                                                    staging=staging,
+                                                    taskset=taskset,
+                                                    **vars(args)))
+        finally:
+            if staging:
+                staging.cleanup()
+    if num_failed:
+        logger.error('%d fuzzer node(s) failed', num_failed)
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+
+"""
+Monitor running `fuzz.py` experiments.
+
+Periodically polls the `fuzzer_stats` and `plot_data` files of every fuzzer
+node, and aggregates them per trial, per corpus, and (for multi-fuzzer
+experiments) per fuzzer. The aggregated statistics are served as JSON over
+HTTP and appended to a CSV.
+
+Author: Adrian Herrera
+"""
+
+
+from argparse import ArgumentParser, Namespace
+from csv import writer as csv_writer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+from typing import Dict, Iterator, List, Optional, Tuple
+import json
+import logging
+import os
+import time
+
+from seed_selection.afl import (AFLPP_FIELD_ALIASES, parse_fuzzer_stats,
+                                parse_stat_value)
+from seed_selection.argparse import log_level, path_exists, positive_int
+from seed_selection.log import get_logger
+
+
+# Per-node metrics, and how they are aggregated across a trial's nodes
+# (parallel nodes sync their queues, so paths/coverage are not summed)
+METRICS = (
+    ('execs_per_sec', sum),
+    ('execs_done', sum),
+    ('paths_total', max),
+    ('unique_crashes', sum),
+    ('unique_hangs', sum),
+    ('bitmap_cvg', max),
+    ('stability', min),
+)
+CSV_FIELDNAMES = ('unix_time', 'corpus', 'fuzzer', 'trial', 'nodes',
+                  'active_nodes', *(metric for metric, _ in METRICS))
+
+# plot_data columns that override (fresher) fuzzer_stats values
+PLOT_DATA_METRICS = {
+    'execs_per_sec': 'execs_per_sec',
+    'execs_done': 'execs_done',
+    'paths_total': 'paths_total',
+    'unique_crashes': 'unique_crashes',
+    'unique_hangs': 'unique_hangs',
+    'map_size': 'bitmap_cvg',
+}
+
+
+logger = get_logger('fuzz_monitor')
+
+
+def parse_args() -> Namespace:
+    """Parse command-line arguments."""
+    parser = ArgumentParser(description='Monitor fuzz.py experiments')
+    parser.add_argument('-i', '--interval', type=positive_int, default=10,
+                        help='Polling interval (in seconds)')
+    parser.add_argument('--stale', type=positive_int, default=120,
+                        help='Treat a node as stopped if its statistics have '
+                             'not changed for this many seconds')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address to serve statistics on')
+    parser.add_argument('-p', '--port', type=int, default=8000,
+                        help='Port to serve statistics on (0 disables the '
+                             'HTTP server)')
+    parser.add_argument('-o', '--output', metavar='CSV', type=Path,
+                        help='Append per-trial statistics to the given CSV')
+    parser.add_argument('-l', '--log', type=log_level, default=logging.WARN,
+                        help='Logging level')
+    parser.add_argument('experiments', metavar='DIR', nargs='+',
+                        type=path_exists,
+                        help='fuzz.py output directories (one per corpus). '
+                             'The directory name is used as the corpus name')
+    return parser.parse_args()
+
+
+class NodeMonitor:
+    """
+    Track a single fuzzer node. `fuzzer_stats` is only reread when it changes,
+    and `plot_data` is tailed from where the previous poll stopped.
+    """
+
+    def __init__(self, node_dir: Path) -> None:
+        self.last_change = None
+        self._stats_path = node_dir / 'fuzzer_stats'
+        self._plot_path = node_dir / 'plot_data'
+        self._stats_mtime = None
+        self._plot_offset = 0
+        self._plot_header = None
+        self._plot_partial = b''
+        self.stats = {}
+        self.plot = {}
+
+    def poll(self) -> None:
+        """Update the node's statistics."""
+        try:
+            mtime = os.stat(self._stats_path).st_mtime_ns
+            if mtime != self._stats_mtime:
+                with open(self._stats_path, 'r') as inf:
+                    self.stats = parse_fuzzer_stats(inf.read())
+                self._stats_mtime = mtime
+                self.last_change = time.monotonic()
+        except FileNotFoundError:
+            pass
+
+        try:
+            self._tail_plot_data()
+        except FileNotFoundError:
+            pass
+
+    def _tail_plot_data(self) -> None:
+        size = os.stat(self._plot_path).st_size
+        if size < self._plot_offset:
+            # The file was truncated (e.g., the fuzzer was restarted)
+            self._plot_offset = 0
+            self._plot_header = None
+            self._plot_partial = b''
+        if size == self._plot_offset:
+            return
+
+        with open(self._plot_path, 'rb') as inf:
+            inf.seek(self._plot_offset)
+            data = self._plot_partial + inf.read(size - self._plot_offset)
+        self._plot_offset = size
+        self.last_change = time.monotonic()
+
+        # Only complete lines are parsed
+        lines = data.split(b'\n')
+        self._plot_partial = lines.pop()
+
+        last_line = None
+        for line in lines:
+            line = line.decode('utf-8', errors='replace').strip()
+            if not line:
+                continue
+            if self._plot_header is None:
+                self._plot_header = [AFLPP_FIELD_ALIASES.get(col.strip(),
+                                                             col.strip())
+                                     for col in line.lstrip('# ').split(',')]
+            elif not line.startswith('#'):
+                last_line = line
+
+        # Only the latest row is needed
+        if last_line is not None:
+            vals = [parse_stat_value(val.strip())
+                    for val in last_line.split(',')]
+            self.plot = dict(zip(self._plot_header, vals))
+
+    def is_active(self, stale: int) -> bool:
+        """Whether the node's statistics changed in the last `stale` seconds."""
+        return self.last_change is not None and \
+            time.monotonic() - self.last_change < stale
+
+    def metrics(self, stale: int) -> Dict[str, float]:
+        """Get the node's latest metrics."""
+        metrics = {metric: self.stats[metric] for metric, _ in METRICS
+                   if isinstance(self.stats.get(metric), float)}
+        for col, metric in PLOT_DATA_METRICS.items():
+            val = self.plot.get(col)
+            if isinstance(val, float):
+                metrics[metric] = val
+
+        # A stopped fuzzer is not executing anything
+        metrics['active'] = self.is_active(stale)
+        if not metrics['active'] and 'execs_per_sec' in metrics:
+            metrics['execs_per_sec'] = 0.0
+        return metrics
+
+
+class ExperimentMonitor:
+    """
+    Track all of the fuzzer nodes in a set of `fuzz.py` experiments. Trials
+    are either directly in the experiment directory (`<exp>/trial-XX`) or, for
+    multi-fuzzer experiments, in per-fuzzer subdirectories
+    (`<exp>/<fuzzer>/trial-XX`).
+    """
+
+    def __init__(self, experiments: List[Path], stale: int) -> None:
+        self._experiments = experiments
+        self._stale = stale
+        # (corpus, fuzzer, trial, node) -> node monitor
+        self._nodes: Dict[Tuple[str, Optional[str], str, str],
+                          NodeMonitor] = {}
+
+    def _trial_dirs(self, exp_dir: Path) -> \
+            Iterator[Tuple[Optional[str], os.DirEntry]]:
+        """Yield the fuzzer (if any) and directory of each trial."""
+        with os.scandir(exp_dir) as entries:
+            subdirs = [entry for entry in entries if entry.is_dir() and
+                       not entry.name.startswith('.')]
+        for subdir in subdirs:
+            if subdir.name.startswith('trial-'):
+                yield None, subdir
+                continue
+
+            try:
+                with os.scandir(subdir.path) as trials:
+                    trial_dirs = [entry for entry in trials
+                                  if entry.name.startswith('trial-') and
+                                  entry.is_dir()]
+            except FileNotFoundError:
+                continue
+            for trial in trial_dirs:
+                yield subdir.name, trial
+
+    def _discover(self) -> None:
+        """Find any new fuzzer nodes."""
+        for exp_dir in self._experiments:
+            for fuzzer, trial in self._trial_dirs(exp_dir):
+                try:
+                    with os.scandir(trial.path) as nodes:
+                        node_dirs = [entry for entry in nodes
+                                     if entry.is_dir() and
+                                     not entry.name.startswith('.')]
+                except FileNotFoundError:
+                    continue
+                for node in node_dirs:
+                    key = (exp_dir.name, fuzzer, trial.name, node.name)
+                    if key not in self._nodes:
+                        logger.info('Monitoring %s', node.path)
+                        self._nodes[key] = NodeMonitor(Path(node.path))
+
+    def poll(self) -> Dict[str, object]:
+        """Poll all fuzzer nodes, and aggregate their statistics."""
+        self._discover()
+
+        trial_nodes = {}
+        for (corpus, fuzzer, trial, node), monitor in self._nodes.items():
+            monitor.poll()
+            trial_nodes.setdefault((corpus, fuzzer, trial), {})[node] = \
+                monitor.metrics(self._stale)
+
+        trials = [dict(corpus=corpus, fuzzer=fuzzer, trial=trial,
+                       nodes=len(nodes),
+                       active_nodes=sum(node['active']
+                                        for node in nodes.values()),
+                       **aggregate(nodes.values(), METRICS))
+                  for (corpus, fuzzer, trial), nodes in
+                  sorted(trial_nodes.items(), key=sort_key)]
+
+        corpora = {}
+        for corpus in sorted({trial['corpus'] for trial in trials}):
+            corpus_trials = [trial for trial in trials
+                             if trial['corpus'] == corpus]
+            corpora[corpus] = summarize(corpus_trials)
+
+            # Multi-fuzzer experiments are also summarized per fuzzer
+            fuzzers = sorted({trial['fuzzer'] for trial in corpus_trials
+                              if trial['fuzzer'] is not None})
+            if fuzzers:
+                corpora[corpus]['fuzzers'] = {
+                    fuzzer: summarize([trial for trial in corpus_trials
+                                       if trial['fuzzer'] == fuzzer])
+                    for fuzzer in fuzzers}
+
+        nodes = [dict(corpus=corpus, fuzzer=fuzzer, trial=trial, node=node,
+                      **metrics)
+                 for (corpus, fuzzer, trial), trial_metrics in
+                 sorted(trial_nodes.items(), key=sort_key)
+                 for node, metrics in sorted(trial_metrics.items())]
+
+        return dict(unix_time=time.time(), corpora=corpora, trials=trials,
+                    nodes=nodes)
+
+
+def sort_key(item: Tuple[Tuple[str, Optional[str], str], dict]) -> \
+        Tuple[str, str, str]:
+    """Sort trials by corpus, fuzzer and trial (where there may be no fuzzer)."""
+    (corpus, fuzzer, trial), _ = item
+    return corpus, fuzzer or '', trial
+
+
+def summarize(trials: List[Dict[str, object]]) -> Dict[str, object]:
+    """Summarize a set of trials' statistics."""
+    return dict(trials=len(trials),
+                execs_per_sec_total=sum(trial.get('execs_per_sec', 0)
+                                        for trial in trials),
+                **{f'{metric}_mean': mean(trial.get(metric)
+                                          for trial in trials)
+                   for metric, _ in METRICS})
+
+
+def mean(vals) -> Optional[float]:
+    """Mean of the non-`None` values (or `None` if there are none)."""
+    vals = [val for val in vals if val is not None]
+    return sum(vals) / len(vals) if vals else None
+
+
+def aggregate(nodes, metrics) -> Dict[str, float]:
+    """Aggregate node metrics with each metric's aggregation function."""
+    nodes = list(nodes)
+    agg = {}
+    for metric, func in metrics:
+        vals = [node[metric] for node in nodes if metric in node]
+        if vals:
+            agg[metric] = func(vals)
+    return agg
+
+
+def serve(host: str, port: int, snapshot: Dict[str, bytes]) -> None:
+    """Serve the latest snapshot over HTTP (from a background thread)."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            key = self.path.strip('/') or 'summary'
+            body = snapshot.get(key)
+            if body is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            logger.debug(fmt, *args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    logger.info('Serving statistics on http://%s:%d/', host,
+                server.server_address[1])
+    Thread(target=server.serve_forever, daemon=True).start()
+
+
+def main():
+    """The main function."""
+    args = parse_args()
+
+    # Initialize logging
+    logger.setLevel(args.log)
+
+    monitor = ExperimentMonitor(args.experiments, args.stale)
+
+    # Snapshots are pre-serialized, so that requests do not contend with
+    # polling
+    snapshot = {}
+    if args.port:
+        serve(args.host, args.port, snapshot)
+
+    csv_file = None
+    if args.output:
+        write_header = not args.output.exists() or \
+            args.output.stat().st_size == 0
+        csv_file = open(args.output, 'a', newline='')
+        writer = csv_writer(csv_file)
+        if write_header:
+            writer.writerow(CSV_FIELDNAMES)
+
+    try:
+        while True:
+            start = time.monotonic()
+            stats = monitor.poll()
+
+            snapshot.update(
+                summary=json.dumps(dict(unix_time=stats['unix_time'],
+                                        corpora=stats['corpora'])).encode(),
+                trials=json.dumps(stats['trials']).encode(),
+                nodes=json.dumps(stats['nodes']).encode())
+
+            if csv_file:
+                writer.writerows([stats['unix_time'],
+                                  *(trial.get(field) for field in
+                                    CSV_FIELDNAMES[1:])]
+                                 for trial in stats['trials'])
+                csv_file.flush()
+
+            logger.debug('Polled %d nodes in %.3fs', len(stats['nodes']),
+                         time.monotonic() - start)
+            time.sleep(max(0, args.interval - (time.monotonic() - start)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if csv_file:
+            csv_file.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+Find the functions (or source files) that corpora miss relative to a baseline
+corpus, based on llvm-cov JSON exports (e.g., as generated by
+`llvm_cov_merge.py`).
+
+Author: Adrian Herrera
+"""
+
+
+from argparse import ArgumentParser, Namespace
+from functools import partial
+from pathlib import Path
+from typing import Dict, List
+import logging
+import multiprocessing.pool as mpp
+
+import numpy as np
+import pandas as pd
+
+from seed_selection.argparse import log_level, positive_int
+from seed_selection.llvm_cov import align_coverage, get_index, segment_sum
+from seed_selection.log import get_logger
+
+
+logger = get_logger('llvm_cov_diff')
+
+
+def parse_args() -> Namespace:
+    """Parse command-line arguments."""
+    parser = ArgumentParser(description='Diff llvm-cov coverage between '
+                                        'corpora')
+    parser.add_argument('-j', '--jobs', type=positive_int, default=1,
+                        help='Number of parallel jobs')
+    parser.add_argument('-c', '--corpus', metavar='ARG', nargs='+',
+                        action='append', required=True,
+                        help='Corpus name, followed by the llvm-cov JSON '
+                             'exports (or cached indices) of its trials')
+    parser.add_argument('-b', '--baseline', default='full',
+                        help='Name of the baseline corpus')
+    parser.add_argument('--cache', metavar='DIR', type=Path,
+                        help='Cache the region coverage index of each export '
+                             'in the given directory')
+    parser.add_argument('--level', choices=('function', 'file'),
+                        default='function', help='Diff granularity')
+    parser.add_argument('--all', action='store_true',
+                        help='Output all functions/files, not just those '
+                             'with missed regions')
+    parser.add_argument('-l', '--log', type=log_level, default=logging.WARN,
+                        help='Logging level')
+    parser.add_argument('-o', '--output', metavar='CSV', type=Path,
+                        required=True, help='Output CSV')
+    return parser.parse_args()
+
+
+def corpus_coverage(indices: List[Dict[str, np.ndarray]],
+                    ref: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Align each trial's region coverage to the reference index. Returns a
+    (trials x regions) boolean array.
+    """
+    return np.vstack([align_coverage(index, ref) for index in indices])
+
+
+def main():
+    """The main function."""
+    args = parse_args()
+
+    # Initialize logging
+    logger.setLevel(args.log)
+
+    corpora = {corpus[0]: [Path(p) for p in corpus[1:]]
+               for corpus in args.corpus}
+    if args.baseline not in corpora:
+        raise Exception('Baseline corpus `%s` not given' % args.baseline)
+    for name, paths in corpora.items():
+        if not paths:
+            raise Exception('No llvm-cov exports given for `%s`' % name)
+
+    # Build (or load) the coverage indices in parallel
+    all_paths = [p for paths in corpora.values() for p in paths]
+    logger.info('Indexing %d llvm-cov exports', len(all_paths))
+    with mpp.Pool(processes=args.jobs) as pool:
+        indices = dict(zip(all_paths,
+                           pool.map(partial(get_index, cache_dir=args.cache),
+                                    all_paths)))
+
+    # All coverage is expressed over the regions of the first baseline trial
+    ref = indices[corpora[args.baseline][0]]
+    offsets = ref['region_offsets']
+    num_funcs = len(ref['functions'])
+    func_files = ref['files'][ref['function_file']]
+    func_regions = np.diff(offsets)
+
+    df = pd.DataFrame(dict(file=func_files, function=ref['functions'],
+                           regions=func_regions))
+    covered = {}
+    for name, paths in corpora.items():
+        trials = corpus_coverage([indices[p] for p in paths], ref)
+        covered[name] = trials.any(axis=0)
+
+        # A function is entered in a trial if its entry region is covered
+        entry = np.zeros((trials.shape[0], num_funcs), dtype=bool)
+        has_regions = func_regions > 0
+        entry[:, has_regions] = trials[:, offsets[:-1][has_regions]]
+
+        df[f'{name}_covered'] = segment_sum(covered[name], offsets)
+        df[f'{name}_trials'] = entry.sum(axis=0)
+
+    # Regions covered by the baseline but not by the corpus
+    missed_cols = []
+    for name in corpora:
+        if name == args.baseline:
+            continue
+        missed = covered[args.baseline] & ~covered[name]
+        df[f'{name}_missed'] = segment_sum(missed, offsets)
+        missed_cols.append(f'{name}_missed')
+
+    if args.level == 'file':
+        df = df.drop(columns='function').groupby('file', as_index=False).sum()
+        trial_cols = [col for col in df.columns if col.endswith('_trials')]
+        df = df.drop(columns=trial_cols)
+
+    if not args.all and missed_cols:
+        df = df[(df[missed_cols] > 0).any(axis=1)]
+
+    logger.info('Saving %d %s diffs to %s', len(df), args.level, args.output)
+    df.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,20 +8,26 @@ Author: Adrian Herrera
 
 
 from argparse import ArgumentParser, Namespace
+from csv import DictReader, DictWriter
 from functools import partial
 from pathlib import Path
-from random import randint
-from tempfile import TemporaryDirectory, gettempdir
-from typing import List, Optional
+from shutil import copyfile
+from tempfile import TemporaryDirectory
+from typing import Dict, List, Optional, TextIO, Tuple
+import hashlib
 import json
 import logging
 import multiprocessing.pool as mpp
 import os
 import subprocess
 
+from tqdm import tqdm
+
 from seed_selection.afl import replace_atat
 from seed_selection.argparse import log_level, path_exists, positive_int
+from seed_selection.llvm_cov import flatten_totals, write_summary
 from seed_selection.log import get_logger
+from seed_selection.staging import get_temp_dir
 
 
 logger = get_logger('llvm_cov_merge')
@@ -40,51 +46,79 @@ def parse_args() -> Namespace:
                         help='Logging level')
     parser.add_argument('-t', '--timeout', type=positive_int, default=None,
                         help='Timeout (seconds)')
+    parser.add_argument('-b', '--batch-size', type=positive_int, default=1000,
+                        help='Merge raw coverage profiles every N seeds')
+    parser.add_argument('-c', '--cache', metavar='DIR', type=Path,
+                        help='Cache merged coverage profiles in the given '
+                             'directory (keyed by the target binary). Seeds '
+                             'already merged into the cache are not replayed '
+                             'again')
     parser.add_argument('--summary-only', action='store_true',
                         help='Export only summary information for each source file')
+    parser.add_argument('--timestamps', metavar='CSV', type=path_exists,
+                        help='Merge coverage cumulatively over time, using '
+                             'the seed times in the given `timestamps.csv`')
+    parser.add_argument('--bucket', metavar='SECONDS', type=positive_int,
+                        default=60, help='Time bucket length when merging '
+                                         'over time')
+    parser.add_argument('--curve', metavar='CSV', type=Path,
+                        help='Save the coverage-over-time curve to the given '
+                             'CSV (requires `--timestamps`)')
     parser.add_argument('target', metavar='TARGET', type=path_exists,
                         help='LLVM SanitizerCoverage-intrumented target program')
     parser.add_argument('target_args', metavar='ARG', nargs='+',
                         help='Target program arguments')
-    return parser.parse_args()
+
+    args = parser.parse_args()
+    if args.curve and not args.timestamps:
+        parser.error('--curve requires --timestamps')
+    return args
 
 
-def get_seed_profraw(seed: Path, outdir: Path, target: Path,
-                     target_args: List[str], timeout:Optional[int] = None) -> Path:
+def get_seed_profraw(seed: Path, profraw: Path, target: Path,
+                     target_args: List[str],
+                     timeout: Optional[int] = None) -> Optional[Path]:
     """
-    Generate the raw coverage profile by replaying the seed through a
-    SanitizerCoverage-instrumented target.
+    Generate the raw coverage profile (at `profraw`) by replaying the seed
+    through a SanitizerCoverage-instrumented target.
+
+    Returns `None` if no profile was generated.
     """
     if seed.stat().st_size == 0:
         logger.warning('%s is empty', seed)
 
-    rand_id = randint(0, 99999)
-    profraw = outdir / f'{rand_id}-{seed.stem}.profraw'
-
     env = os.environ.copy()
-    env['LLVM_PROFILE_FILE'] = profraw
+    env['LLVM_PROFILE_FILE'] = str(profraw)
 
     target_args_w_seed, found_atat = replace_atat(target_args, seed)
     if not found_atat:
         raise Exception('No seed placeholder `@@` found in target arguments')
 
-    stderr = ''
+    stderr = b''
     try:
         proc = subprocess.run([str(target), *target_args_w_seed], check=False,
                               env=env, timeout=timeout,
-                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
         stderr = proc.stderr
         if proc.returncode:
             logger.debug('%s error: %s', seed, stderr.strip())
     except subprocess.TimeoutExpired:
         logger.warning('%s timed out', seed)
     if not profraw.exists():
-        raise Exception('Failed to create raw coverage profile for `%s`: %s' %
-                        (seed, stderr.strip()))
+        logger.warning('Failed to create raw coverage profile for `%s`: %s',
+                       seed, stderr.strip())
+        return None
 
     return profraw
 
 
+def _replay_seed(job: Tuple[Path, Path], **kwargs) -> Tuple[Path,
+                                                            Optional[Path]]:
+    """Unpack a `(seed, profraw)` job for `get_seed_profraw`."""
+    seed, profraw = job
+    return seed, get_seed_profraw(seed, profraw, **kwargs)
+
+
 def merge_profraw(seed_list: Path, profdata: Path, jobs : int = 1) -> None:
     """
     Run llvm-profdata to merge raw coverage profiles (listed in `seed_list`).
@@ -104,6 +138,67 @@ def merge_profraw(seed_list: Path, profdata: Path, jobs : int = 1) -> None:
                         proc.stderr.strip())
 
 
+def merge_batch(profiles: List[Path], profdata: Path,
+                jobs: int = 1) -> None:
+    """
+    Merge a batch of coverage profiles (raw or previously merged) into
+    `profdata`. The raw profiles are deleted once merged.
+    """
+    seed_list = profdata.with_suffix('.txt')
+    with open(seed_list, 'w') as outf:
+        for profile in profiles:
+            outf.write('1,%s\n' % profile)
+
+    merge_profraw(seed_list, profdata, jobs=jobs)
+
+    seed_list.unlink()
+    for profile in profiles:
+        if profile.suffix == '.profraw':
+            profile.unlink()
+
+
+def target_cache_dir(cache_dir: Path, target: Path) -> Path:
+    """
+    Get the cache directory for the given target binary. Profiles are only
+    valid for the binary that generated them, so the cache is keyed by a hash
+    of the binary.
+    """
+    digest = hashlib.sha256()
+    with open(target, 'rb') as inf:
+        for chunk in iter(lambda: inf.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return cache_dir / digest.hexdigest()[:16]
+
+
+def read_cache(cache_dir: Path) -> Tuple[Optional[Path], List[str]]:
+    """
+    Read a coverage cache. Returns the cached (merged) coverage profile and the
+    seeds that have been merged into it.
+    """
+    profdata = cache_dir / 'merged.profdata'
+    seed_list = cache_dir / 'seeds.txt'
+    if not profdata.exists() or not seed_list.exists():
+        return None, []
+
+    with open(seed_list, 'r') as inf:
+        return profdata, [line.strip() for line in inf]
+
+
+def write_cache(cache_dir: Path, profdata: Path, seeds: List[str]) -> None:
+    """Save a merged coverage profile (and the seeds that it contains)."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # Update the profile first, so that an interrupted write never lists
+    # seeds that are missing from the cached profile
+    tmp_profdata = cache_dir / 'merged.profdata.tmp'
+    copyfile(profdata, tmp_profdata)
+    tmp_profdata.replace(cache_dir / 'merged.profdata')
+    with open(cache_dir / 'seeds.txt', 'a') as outf:
+        for seed in seeds:
+            outf.write('%s\n' % seed)
+
+
 def export_json(target: Path, profdata: Path,
                 summary_only: bool = False) -> dict:
     """Run llvm-cov to export coverage as JSON."""
@@ -122,15 +217,170 @@ def export_json(target: Path, profdata: Path,
     return json.loads(proc.stdout)
 
 
-def get_temp_dir() -> Path:
-    """Determine temporary directory location. Prefer tmpfs if available."""
-    root = Path('/')
-    preferred_dirs = (root / 'dev' / 'shm', root / 'run' / 'shm')
-    for dir_ in preferred_dirs:
-        if dir_.exists():
-            return dir_
+def read_timestamps(inf: TextIO) -> Dict[Path, float]:
+    """
+    Read the testcase times (relative to the start of the campaign) from a
+    `timestamps.csv` file (as generated by `fuzz.py`, `timestamp_afl.py`, or
+    `timestamp_experiment.py`). The campaign starts when the earliest testcase
+    (i.e., an initial seed) is created.
+
+    Seeds are keyed by their last three path components (i.e.,
+    `<node>/queue/<name>`), so that the timestamps remain valid if the output
+    directory is moved.
+    """
+    rows = list(DictReader(inf))
+    if not rows:
+        return {}
+
+    # Older versions of `fuzz.py` also wrote each testcase's offset from the
+    # fuzzer's start time
+    if 'time_offset' in rows[0]:
+        offsets = [float(row['time_offset']) for row in rows]
+    else:
+        start_time = min(float(row['unix_time']) for row in rows)
+        offsets = [float(row['unix_time']) - start_time for row in rows]
+
+    return {Path(*Path(row['seed']).parts[-3:]): offset
+            for row, offset in zip(rows, offsets)}
 
-    return Path(gettempdir())
+
+def merge_seeds(seeds: List[Path], in_dir: Path, temp_dir: Path,
+                args: Namespace,
+                profdata_file: Optional[Path] = None) -> Optional[Path]:
+    """
+    Replay seeds and merge their coverage profiles in batches (optionally on
+    top of an existing merged profile). Returns the merged profile.
+    """
+    num_batches = 0
+    profraws = []
+    merged_seeds = []
+    failed_seeds = []
+
+    def merge_profraws():
+        nonlocal num_batches, profdata_file, profraws, merged_seeds
+        if not profraws:
+            return
+
+        profiles = profraws + ([profdata_file] if profdata_file else [])
+        num_batches += 1
+        new_profdata = temp_dir / f'merged-{num_batches:06d}.profdata'
+        merge_batch(profiles, new_profdata, jobs=args.jobs)
+        if profdata_file and profdata_file.parent == temp_dir:
+            profdata_file.unlink()
+        profdata_file = new_profdata
+
+        if args.cache:
+            write_cache(args.cache, profdata_file, merged_seeds)
+        profraws, merged_seeds = [], []
+
+    # Generate raw coverage files. Each seed gets a unique profile name, and
+    # raw profiles are periodically merged so that they do not pile up in the
+    # temporary directory
+    with mpp.Pool(processes=args.jobs) as pool:
+        logger.info('Generating raw coverage profiles from %s...', in_dir)
+        replay = partial(_replay_seed, target=args.target,
+                         target_args=args.target_args, timeout=args.timeout)
+        jobs = ((seed, temp_dir / f'{i:08d}.profraw')
+                for i, seed in enumerate(seeds))
+        chunksize = max(1, min(64, len(seeds) // (args.jobs * 4)))
+        for seed, profraw in tqdm(pool.imap_unordered(replay, jobs,
+                                                      chunksize=chunksize),
+                                  desc='Replaying seeds', total=len(seeds),
+                                  unit='seeds'):
+            if not profraw:
+                failed_seeds.append(seed)
+                continue
+
+            profraws.append(profraw)
+            merged_seeds.append(str(seed.relative_to(in_dir)))
+            if len(profraws) >= args.batch_size:
+                merge_profraws()
+
+    merge_profraws()
+    logger.info('Merged %d coverage profiles in %d batches',
+                len(seeds) - len(failed_seeds), num_batches)
+    if failed_seeds:
+        logger.warning('%d/%d seeds failed to generate a coverage profile',
+                       len(failed_seeds), len(seeds))
+
+    return profdata_file
+
+
+def merge_time_sliced(seeds: List[Path], timestamps: Dict[Path, float],
+                      temp_dir: Path, args: Namespace) -> Tuple[Optional[Path],
+                                                                List[dict]]:
+    """
+    Replay seeds in the order that they were found, and cumulatively merge
+    their coverage profiles one time bucket at a time. A summary is exported
+    after each bucket, producing the coverage-over-time curve.
+
+    Returns the final merged profile and the curve.
+    """
+    seed_times = []
+    for seed in seeds:
+        key = Path(*seed.parts[-3:])
+        if key not in timestamps:
+            logger.warning('No timestamp for %s. Skipping', seed)
+            continue
+        seed_times.append((timestamps[key], seed))
+    seed_times.sort()
+
+    profdata_file = None
+    profraws = []
+    num_seeds = 0
+    num_failed = 0
+    curve = []
+
+    def merge_bucket(bucket: int):
+        nonlocal profdata_file, profraws
+        if profraws:
+            profiles = profraws + ([profdata_file] if profdata_file else [])
+            new_profdata = temp_dir / f'merged-{bucket:06d}.profdata'
+            merge_batch(profiles, new_profdata, jobs=args.jobs)
+            if profdata_file:
+                profdata_file.unlink()
+            profdata_file = new_profdata
+            profraws = []
+        if not profdata_file:
+            return
+
+        totals = export_json(args.target, profdata_file,
+                             summary_only=True)['data'][0]['totals']
+        curve.append(dict(time=(bucket + 1) * args.bucket, seeds=num_seeds,
+                          **flatten_totals(totals)))
+
+    # Results are consumed in time order (so that each bucket can be merged as
+    # soon as it is complete), while seeds are still replayed in parallel
+    with mpp.Pool(processes=args.jobs) as pool:
+        replay = partial(_replay_seed, target=args.target,
+                         target_args=args.target_args, timeout=args.timeout)
+        jobs = ((seed, temp_dir / f'{i:08d}.profraw')
+                for i, (_, seed) in enumerate(seed_times))
+        results = zip((time for time, _ in seed_times), pool.imap(replay, jobs))
+        bucket = None
+        for time, (_, profraw) in tqdm(results, desc='Replaying seeds',
+                                       total=len(seed_times), unit='seeds'):
+            seed_bucket = int(time // args.bucket)
+            if bucket is not None and seed_bucket != bucket:
+                merge_bucket(bucket)
+            bucket = seed_bucket
+
+            if not profraw:
+                num_failed += 1
+                continue
+            profraws.append(profraw)
+            num_seeds += 1
+
+        if bucket is not None:
+            merge_bucket(bucket)
+
+    logger.info('Merged %d coverage profiles in %d time buckets', num_seeds,
+                len(curve))
+    if num_failed:
+        logger.warning('%d/%d seeds failed to generate a coverage profile',
+                       num_failed, len(seed_times))
+
+    return profdata_file, curve
 
 
 def main():
@@ -143,35 +393,47 @@ def main():
     # Initialize logging
     logger.setLevel(args.log)
 
-    seeds = (seed for queue in in_dir.glob('**/queue') \
-             for seed in queue.iterdir() if seed.is_file())
+    if '@@' not in args.target_args:
+        raise Exception('No seed placeholder `@@` found in target arguments')
+    if args.timestamps and args.cache:
+        raise Exception('Caching is not supported with time-sliced merging')
+
+    seeds = sorted(seed for queue in in_dir.glob('**/queue')
+                   for seed in queue.iterdir() if seed.is_file())
+
+    # Skip the seeds that have already been merged into the cache
+    profdata_file, cached_seeds = None, []
+    if args.cache:
+        args.cache = target_cache_dir(args.cache, target)
+        profdata_file, cached_seeds = read_cache(args.cache)
+        cached_seeds = set(cached_seeds)
+        seeds = [seed for seed in seeds
+                 if str(seed.relative_to(in_dir)) not in cached_seeds]
+        logger.info('%d seeds already merged in %s', len(cached_seeds),
+                    args.cache)
 
     with TemporaryDirectory(dir=get_temp_dir()) as temp_dir:
-        # Generate raw coverage files
-        with mpp.Pool(processes=args.jobs) as pool:
-            logger.info('Generating raw coverage profiles from %s...', in_dir)
-            get_profraw = partial(get_seed_profraw, outdir=Path(temp_dir),
-                                  target=target, target_args=args.target_args,
-                                  timeout=args.timeout)
-            profraws = pool.map(get_profraw, seeds)
-            logger.info('Generated %d coverage profiles', len(profraws))
-
-        if not profraws:
+        temp_dir = Path(temp_dir)
+
+        if args.timestamps:
+            with open(args.timestamps, 'r') as inf:
+                timestamps = read_timestamps(inf)
+            profdata_file, curve = merge_time_sliced(seeds, timestamps,
+                                                     temp_dir, args)
+            if curve and args.curve:
+                logger.info('Saving coverage curve to %s', args.curve)
+                with open(args.curve, 'w') as outf:
+                    writer = DictWriter(outf, fieldnames=curve[0].keys())
+                    writer.writeheader()
+                    writer.writerows(curve)
+        else:
+            profdata_file = merge_seeds(seeds, in_dir, temp_dir, args,
+                                        profdata_file)
+
+        if not profdata_file:
             logger.warning('No coverage profiles generated')
             return
 
-        # Create list of seeds for merging
-        logger.info('Generating seeds.txt...')
-        seed_list = Path(temp_dir) / 'seeds.txt'
-        with open(seed_list, 'w') as outf:
-            for profraw in profraws:
-                outf.write('1,%s\n' % profraw)
-
-        # Merge raw coverage
-        logger.info('Merging raw coverage profiles...')
-        profdata_file = Path(temp_dir) / 'merged.profdata'
-        merge_profraw(seed_list, profdata_file, jobs=args.jobs)
-
         # Generate JSON
         logger.info('Generating JSON coverage report...')
         summary_only = not(output is not None and not args.summary_only)
@@ -182,6 +444,7 @@ def main():
         logger.info('Saving JSON report to %s', output)
         with open(output, 'w') as outf:
             json.dump(prof_data, outf)
+        write_summary(output, prof_data['data'][0]['totals'])
 
     region_data = prof_data['data'][0]['totals']['regions']
     region_cvg = region_data['covered'] / region_data['count'] * 100.0
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+"""
+Convert per-seed llvm-cov JSON exports into region coverage, in the same
+formats as AFL coverage (`afl-showmap` output files and/or an HDF5 file). The
+OptiMin/greedy minimization pipeline used for AFL coverage (e.g.,
+`afl-showmap-maxsat`, `expand_hdf5_coverage.py`) can then minimize on
+source-level coverage.
+
+Each code region is assigned an ID from its position in a reference export
+(all exports must be of the same binary). Exports are parsed in parallel.
+
+Exports are named after their seed (i.e., `<seed>.json`). As with
+`replay_seeds.py`, each HDF5 dataset records its seed's size (which weighted
+minimization requires), so the seeds themselves must also be given.
+
+Author: Adrian Herrera
+"""
+
+
+from argparse import ArgumentParser, Namespace
+from functools import partial
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import logging
+import multiprocessing.pool as mpp
+
+from h5py import File as H5File
+from tqdm import tqdm
+import numpy as np
+import pandas as pd
+
+from seed_selection.argparse import log_level, path_exists, positive_int
+from seed_selection.coverage import count_class
+from seed_selection.llvm_cov import align_counts, build_index
+from seed_selection.log import get_logger
+
+
+COV_TYPE = np.dtype([('edge', np.uint32), ('count', np.uint8)])
+RAW_COV_TYPE = np.dtype([('edge', np.uint32), ('count', np.uint64)])
+
+logger = get_logger('llvm_cov_regions')
+
+# Reference index (set in each worker process)
+_REF = None
+
+
+def parse_args() -> Namespace:
+    """Parse command-line arguments."""
+    parser = ArgumentParser(description='Extract region coverage from llvm-cov '
+                                        'JSON exports')
+    parser.add_argument('-j', '--jobs', type=positive_int, default=1,
+                        help='Number of parallel jobs')
+    parser.add_argument('-o', '--output', metavar='DIR', type=Path,
+                        help='Write afl-showmap-style coverage files to the '
+                             'given directory')
+    parser.add_argument('--hdf5', metavar='HDF5', type=Path,
+                        help='Write coverage to the given HDF5 file '
+                             '(requires --seeds)')
+    parser.add_argument('-s', '--seeds', metavar='DIR', type=path_exists,
+                        help='Directory of the seeds that the exports were '
+                             'generated from')
+    parser.add_argument('-m', '--region-map', metavar='CSV', type=Path,
+                        help='Write the region ID to source location mapping '
+                             'to the given CSV')
+    parser.add_argument('-r', '--raw-counts', action='store_true',
+                        help='Keep raw execution counts (rather than AFL hit '
+                             'count classes)')
+    parser.add_argument('-l', '--log', type=log_level, default=logging.WARN,
+                        help='Logging level')
+    parser.add_argument('exports', metavar='DIR', type=path_exists,
+                        help='Directory of llvm-cov JSON exports (one per '
+                             'seed)')
+    return parser.parse_args()
+
+
+def _init_worker(ref: Dict[str, np.ndarray]) -> None:
+    global _REF
+    _REF = ref
+
+
+def get_region_cov(llvm_cov_json: Path, out_dir: Optional[Path] = None,
+                   raw_counts: bool = False) -> \
+        Tuple[str, np.ndarray, np.ndarray]:
+    """
+    Get the region coverage of a single seed. Returns the seed name and the
+    IDs and counts of its covered regions.
+    """
+    counts = align_counts(build_index(llvm_cov_json), _REF)
+    regions = np.flatnonzero(counts)
+    counts = counts[regions]
+    if not raw_counts:
+        counts = count_class(counts)
+
+    seed = llvm_cov_json.stem
+    if out_dir:
+        with open(out_dir / seed, 'w') as outf:
+            outf.writelines('%06d:%d\n' % cov for cov in zip(regions, counts))
+
+    return seed, regions, counts
+
+
+def get_region_map(ref: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """Map each region ID to its source location."""
+    func_regions = np.diff(ref['region_offsets'])
+    func_ids = np.repeat(np.arange(len(ref['functions'])), func_regions)
+    return pd.DataFrame(dict(
+        file=ref['files'][ref['function_file'][func_ids]],
+        function=ref['functions'][func_ids],
+        line=ref['region_lines'])).rename_axis('region')
+
+
+def main():
+    """The main function."""
+    args = parse_args()
+
+    # Initialize logging
+    logger.setLevel(args.log)
+
+    if not args.output and not args.hdf5:
+        raise Exception('At least one of `--output` or `--hdf5` is required')
+    if args.hdf5 and not args.seeds:
+        raise Exception('`--hdf5` requires `--seeds` (for the seed sizes)')
+
+    exports = sorted(path for path in args.exports.iterdir()
+                     if path.suffix == '.json')
+    if not exports:
+        raise Exception('No llvm-cov exports found in %s' % args.exports)
+    if args.seeds:
+        missing = [path.name for path in exports
+                   if not (args.seeds / path.stem).is_file()]
+        if missing:
+            raise Exception('No seed in %s for %d export(s) (e.g., %s)' %
+                            (args.seeds, len(missing), missing[0]))
+
+    # Every export lists all of the binary's functions, so any export can be
+    # used as the reference
+    logger.info('Building reference index from %s', exports[0])
+    ref = build_index(exports[0])
+    logger.info('%d code regions', ref['region_offsets'][-1])
+
+    if args.region_map:
+        get_region_map(ref).to_csv(args.region_map)
+    if args.output:
+        args.output.mkdir(exist_ok=True)
+
+    h5f = H5File(args.hdf5, 'w') if args.hdf5 else None
+    cov_type = RAW_COV_TYPE if args.raw_counts else COV_TYPE
+    try:
+        get_cov = partial(get_region_cov, out_dir=args.output,
+                          raw_counts=args.raw_counts)
+        with mpp.Pool(processes=args.jobs, initializer=_init_worker,
+                      initargs=(ref,)) as pool:
+            for seed, regions, counts in tqdm(pool.imap(get_cov, exports),
+                                              desc='Extracting region '
+                                                   'coverage',
+                                              total=len(exports),
+                                              unit='seeds'):
+                if not h5f or not regions.size:
+                    continue
+                cov = np.empty(regions.size, dtype=cov_type)
+                cov['edge'] = regions
+                cov['count'] = counts
+                compression = 'gzip' if cov.size > 1 else None
+                dset = h5f.create_dataset(seed, data=cov,
+                                          compression=compression)
+                dset.attrs['size'] = (args.seeds / seed).stat().st_size
+    finally:
+        if h5f:
+            h5f.close()
+
+
+if __name__ == '__main__':
+    main()
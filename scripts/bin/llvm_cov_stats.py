@@ -9,44 +9,57 @@ Author: Adrian Herrera
 
 from argparse import ArgumentParser, Namespace
 from pathlib import Path
-import json
+import multiprocessing.pool as mpp
 
 from bootstrapped import bootstrap as bs
 import bootstrapped.stats_functions as bs_stats
-import numpy as np
+import pandas as pd
 
-from seed_selection.argparse import path_exists
+from seed_selection.argparse import path_exists, positive_int
+from seed_selection.llvm_cov import TOTALS_METRICS, flatten_totals, read_totals
 
 
 def parse_args() -> Namespace:
     """Parse command-line arguments."""
     parser = ArgumentParser(description='Generate llvm-cov statistics')
+    parser.add_argument('-j', '--jobs', type=positive_int, default=1,
+                        help='Number of parallel jobs')
+    parser.add_argument('-o', '--output', metavar='CSV', type=Path,
+                        help='Save the per-trial coverage totals to a CSV')
     parser.add_argument('jsons', metavar='JSON', nargs='+', type=path_exists,
                         help='llvm-cov-generated JSON coverage file(s)')
     return parser.parse_args()
 
 
-def get_region_cov(llvm_cov_json: Path) -> float:
-    """Get region coverage from the llvm-cov-generated JSON file."""
-    with llvm_cov_json.open() as inf:
-        root = json.load(inf)
-        data = root['data'][0]['totals']['regions']
-        return data['covered'] / data['count'] * 100.0
+def get_cov_totals(llvm_cov_json: Path) -> dict:
+    """Get the coverage totals from the llvm-cov-generated JSON file."""
+    return dict(json=str(llvm_cov_json),
+                **flatten_totals(read_totals(llvm_cov_json)))
 
 
 def main():
     """The main function."""
     args = parse_args()
 
-    # Get region coverage
-    regions = np.array([get_region_cov(p) for p in args.jsons])
+    # Get coverage totals
+    with mpp.Pool(processes=args.jobs) as pool:
+        df = pd.DataFrame(pool.map(get_cov_totals, args.jsons))
 
-    # Calculate mean and confidence intervals
-    cov_ci = bs.bootstrap(regions, stat_func=bs_stats.mean)
+    if args.output:
+        df.to_csv(args.output, index=False)
 
-    # Output
-    print(f'mean coverage ({len(regions)} trials)')
-    print(f'  {cov_ci.value:.02f} +/- {cov_ci.error_width() / 2:.02f}')
+    # Calculate mean and confidence intervals
+    print(f'mean coverage ({len(df)} trials)')
+    for metric in TOTALS_METRICS:
+        covered = df.get(f'{metric}_covered')
+        count = df.get(f'{metric}_count')
+        if covered is None or count is None or not count.all():
+            continue
+
+        cov_ci = bs.bootstrap((covered / count * 100.0).to_numpy(),
+                              stat_func=bs_stats.mean)
+        print(f'  {metric}: {cov_ci.value:.02f} +/- '
+              f'{cov_ci.error_width() / 2:.02f}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+"""
+Minimize the corpora of benchmark targets with any (or all) of the
+minimization techniques, from a single coverage source per target.
+
+Each (target, technique) pair runs in a fresh process (in parallel), and its
+wall time, peak memory usage, and minimized corpus size are recorded. Corpus
+listings are written in the `<benchmark>/<target>/<technique>.txt` layout.
+
+Author: Adrian Herrera
+"""
+
+
+from argparse import ArgumentParser, Namespace
+from csv import writer as csv_writer
+from multiprocessing import get_context
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Dict, Iterator, List, Optional, Tuple
+import logging
+
+from h5py import File as H5File
+from tqdm import tqdm
+import pandas as pd
+
+from seed_selection import BENCHMARKS, MINIMIZE_TECHNIQUES, TARGET_FILE_TYPES
+from seed_selection.argparse import log_level, positive_int
+from seed_selection.coverage import expand_hdf5
+from seed_selection.log import get_logger
+from seed_selection.minimize import TECHNIQUES, measure
+from seed_selection.staging import get_temp_dir
+
+
+STATS_FIELDNAMES = ('benchmark', 'target', 'technique', 'num_seeds',
+                    'wall_time', 'peak_rss_bytes', 'error')
+
+logger = get_logger('minimize')
+
+
+def parse_args() -> Namespace:
+    """Parse command-line arguments."""
+    parser = ArgumentParser(description='Minimize benchmark target corpora')
+    parser.add_argument('-j', '--jobs', type=positive_int, default=1,
+                        help='Number of techniques to run in parallel')
+    parser.add_argument('-p', '--threads', type=int, default=1,
+                        help='Number of threads for each technique (if '
+                             'supported by the technique)')
+    parser.add_argument('-b', '--benchmark', choices=BENCHMARKS,
+                        action='append',
+                        help='Only process the given benchmark(s)')
+    parser.add_argument('-t', '--target', action='append',
+                        help='Only process the given target(s)')
+    parser.add_argument('-c', '--technique', choices=MINIMIZE_TECHNIQUES,
+                        action='append',
+                        help='Only run the given technique(s) (default: all)')
+    parser.add_argument('-d', '--coverage', metavar='PATH', required=True,
+                        help='Path to each target\'s coverage: either an '
+                             'HDF5 file or a directory of `afl-showmap` '
+                             'files. `{benchmark}`, `{target}` and '
+                             '`{filetype}` are substituted (e.g., '
+                             '`cov/{benchmark}/{target}.hdf5`)')
+    parser.add_argument('-w', '--weights', metavar='CSV',
+                        help='Path to each target\'s weights (file sizes) '
+                             'CSV, with the same substitutions as '
+                             '`--coverage` (e.g., `weights/{filetype}.csv`). '
+                             'By default the sizes stored in the coverage '
+                             'HDF5 are used')
+    parser.add_argument('-s', '--stats', metavar='CSV', type=Path,
+                        help='Write minimization statistics to the given CSV '
+                             '(default: `stats.csv` in the output directory)')
+    parser.add_argument('-l', '--log', type=log_level, default=logging.WARN,
+                        help='Logging level')
+    parser.add_argument('output', metavar='DIR', type=Path,
+                        help='Corpora output directory')
+    return parser.parse_args()
+
+
+def get_targets(benchmarks: Optional[List[str]] = None,
+                targets: Optional[List[str]] = None) -> \
+        Iterator[Tuple[str, str, str]]:
+    """Yield the benchmark, target and file type of the targets to process."""
+    for benchmark in benchmarks or BENCHMARKS:
+        for target, filetype in TARGET_FILE_TYPES[benchmark].items():
+            if not targets or target in targets:
+                yield benchmark, target, filetype
+
+
+def write_hdf5_weights(h5f: H5File, out_path: Path) -> None:
+    """Write the seed sizes stored in the coverage HDF5 as a weights CSV."""
+    with open(out_path, 'w') as outf:
+        writer = csv_writer(outf)
+        for seed, dset in h5f.items():
+            writer.writerow((seed, dset.attrs['size']))
+
+
+def prepare_target(cov_path: Path, weights_path: Optional[Path],
+                   temp_dir: Path, jobs: int = 1) -> Tuple[Path, Optional[Path]]:
+    """
+    Get a target's `afl-showmap` coverage directory and weights CSV. HDF5
+    coverage is expanded (once, for all techniques) into `temp_dir`.
+    """
+    if cov_path.is_dir():
+        return cov_path, weights_path
+
+    cov_dir = temp_dir / 'cov'
+    cov_dir.mkdir()
+    with H5File(cov_path, 'r') as h5f:
+        for _ in expand_hdf5(h5f, cov_dir, jobs=jobs, progress=True):
+            pass
+        if not weights_path:
+            weights_path = temp_dir / 'weights.csv'
+            write_hdf5_weights(h5f, weights_path)
+
+    return cov_dir, weights_path
+
+
+def _minimize(job: Tuple[str, str, str, Path, Optional[Path], int]) -> \
+        Tuple[str, str, str, Optional[List[str]], Dict]:
+    """Run a single (target, technique) job, catching any error."""
+    benchmark, target, technique, cov_dir, weights, threads = job
+    try:
+        seeds, wall_time, peak_rss = measure(technique, cov_dir, weights,
+                                             threads)
+        stats = dict(num_seeds=len(seeds), wall_time=wall_time,
+                     peak_rss_bytes=peak_rss)
+    except Exception as e:
+        seeds = None
+        stats = dict(error=str(e) or type(e).__name__)
+    return benchmark, target, technique, seeds, stats
+
+
+def main():
+    """The main function."""
+    args = parse_args()
+    techniques = args.technique or MINIMIZE_TECHNIQUES
+
+    # Initialize logging
+    logger.setLevel(args.log)
+
+    with TemporaryDirectory(prefix='minimize-', dir=get_temp_dir()) as tmp:
+        # Prepare each target's coverage (and weights). A target that cannot
+        # be prepared fails all of its techniques
+        jobs = []
+        stats = []
+        for benchmark, target, filetype in get_targets(args.benchmark,
+                                                       args.target):
+            subs = dict(benchmark=benchmark, target=target, filetype=filetype)
+            cov_path = Path(args.coverage.format(**subs))
+            if not cov_path.exists():
+                logger.warning('No coverage for %s/%s (%s). Skipping',
+                               benchmark, target, cov_path)
+                continue
+            weights_path = Path(args.weights.format(**subs)) if args.weights \
+                else None
+            if weights_path and not weights_path.exists():
+                logger.warning('No weights for %s/%s (%s)', benchmark, target,
+                               weights_path)
+                weights_path = None
+
+            logger.info('Preparing %s/%s coverage from %s', benchmark, target,
+                        cov_path)
+            target_tmp = Path(tmp) / benchmark / target
+            target_tmp.mkdir(parents=True)
+            try:
+                cov_dir, weights_path = prepare_target(cov_path, weights_path,
+                                                       target_tmp, args.jobs)
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                logger.error('Failed to prepare %s/%s coverage from %s: %s',
+                             benchmark, target, cov_path, error)
+                stats.extend(dict(benchmark=benchmark, target=target,
+                                  technique=technique, error=error)
+                             for technique in techniques)
+                continue
+
+            for technique in techniques:
+                if TECHNIQUES[technique].weighted and not weights_path:
+                    logger.warning('%s requires weights for %s/%s. Skipping',
+                                   technique, benchmark, target)
+                    continue
+                jobs.append((benchmark, target, technique, cov_dir,
+                             weights_path, args.threads))
+
+        # Minimize. Each job runs in a fresh (spawned) process so that its
+        # peak memory usage is not inflated by earlier jobs (or this process)
+        ctx = get_context('spawn')
+        with ctx.Pool(processes=args.jobs, maxtasksperchild=1) as pool:
+            for benchmark, target, technique, seeds, job_stats in \
+                    tqdm(pool.imap_unordered(_minimize, jobs),
+                         desc='Minimizing', total=len(jobs), unit='jobs'):
+                stats.append(dict(benchmark=benchmark, target=target,
+                                  technique=technique, **job_stats))
+                if seeds is None:
+                    logger.error('%s failed for %s/%s: %s', technique,
+                                 benchmark, target, job_stats['error'])
+                    continue
+
+                logger.info('%s/%s %s: %d seeds in %.02fs', benchmark,
+                            target, technique, len(seeds),
+                            job_stats['wall_time'])
+                out_dir = args.output / benchmark / target
+                out_dir.mkdir(parents=True, exist_ok=True)
+                with open(out_dir / f'{technique}.txt', 'w') as outf:
+                    outf.writelines(f'{seed}\n' for seed in seeds)
+
+    stats_path = args.stats or args.output / 'stats.csv'
+    stats_path.parent.mkdir(parents=True, exist_ok=True)
+    stats_df = pd.DataFrame(stats, columns=STATS_FIELDNAMES).astype(
+        dict(num_seeds='Int64', peak_rss_bytes='Int64'))
+    stats_df.sort_values(['benchmark', 'target', 'technique']).to_csv(
+        stats_path, index=False)
+
+
+if __name__ == '__main__':
+    main()
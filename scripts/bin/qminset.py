@@ -9,16 +9,22 @@ Author: Adrian Herrera
 
 
 from argparse import ArgumentParser, Namespace
+from functools import partial
 from io import BytesIO
 from pathlib import Path
 from shutil import copytree, which
 from subprocess import PIPE, run
 from tarfile import TarInfo
 from tempfile import TemporaryDirectory
+import multiprocessing.pool as mpp
 import re
 import tarfile
 
-from seed_selection.argparse import path_exists
+from h5py import File as H5File
+from tqdm import tqdm
+
+from seed_selection.argparse import path_exists, positive_int
+from seed_selection.coverage import expand_hdf5
 
 
 SEED_RE = re.compile(r'Adding \d+ instructions \((?P<seed>.+?)\)')
@@ -27,19 +33,66 @@ SEED_RE = re.compile(r'Adding \d+ instructions \((?P<seed>.+?)\)')
 def parse_args() -> Namespace:
     """Parse command-line arguments."""
     parser = ArgumentParser(description='Wrapper around minset')
-    parser.add_argument('-i', '--input', metavar='DIR', type=path_exists,
-                        required=True, help='Path to input directory of '
-                                            '`afl-showmap` coverage files')
+    parser.add_argument('-j', '--jobs', type=positive_int, default=1,
+                        help='Number of parallel jobs')
+    parser.add_argument('-z', '--compress-level', type=int, default=1,
+                        choices=range(10),
+                        help='gzip compression level of the minset data. 0 '
+                             'writes uncompressed tars (only if `qminset` '
+                             'auto-detects the archive format)')
+    cov = parser.add_mutually_exclusive_group(required=True)
+    cov.add_argument('-i', '--input', metavar='DIR', type=path_exists,
+                     help='Path to input directory of `afl-showmap` coverage '
+                          'files')
+    cov.add_argument('--hdf5', metavar='HDF5', type=path_exists,
+                     help='Path to input HDF5 coverage file (expanded '
+                          'directly, rather than with '
+                          '`expand_hdf5_coverage.py`)')
     parser.add_argument('-s', '--bitvectors', metavar='DIR', type=Path,
                         help='Save the `moonbeam-afl` bitvector traces in the '
                              'given directory')
     return parser.parse_args()
 
 
+def _add_file(tar: tarfile.TarFile, name: Path, data: bytes) -> None:
+    """Add an in-memory file to a tar archive."""
+    tarinfo = TarInfo(name=str(name))
+    tarinfo.size = len(data)
+    tar.addfile(tarinfo=tarinfo, fileobj=BytesIO(data))
+
+
+def prepare_bitvector(bitvector: Path, mset_dir: Path, corpus_name: str,
+                      compress_level: int = 1) -> None:
+    """
+    Prepare the minset data for a single bitvector: a directory containing the
+    bitvector size and an `output.tgz` archive. The bitvector is read once.
+    """
+    data = bitvector.read_bytes()
+    output_path = Path('output')
+    mset_bv_dir = mset_dir / bitvector.stem
+    mset_bv_dir.mkdir()
+
+    # Write size
+    with open(mset_bv_dir / 'size', 'w') as outf:
+        outf.write('%d\n' % len(data))
+
+    # Write output.tgz
+    if compress_level:
+        tar = tarfile.open(mset_bv_dir / 'output.tgz', 'w:gz',
+                           compresslevel=compress_level)
+    else:
+        tar = tarfile.open(mset_bv_dir / 'output.tgz', 'w')
+    with tar:
+        _add_file(tar, output_path / 'imagefilemap.txt',
+                  b'%s,%s\n' % (corpus_name.encode(), bitvector.name.encode()))
+        _add_file(tar, output_path / 'info.txt',
+                  b'0_0_0_0_0_0_0\n0_0_0_0_0_0_WEIGHT}_0\n')
+        _add_file(tar, output_path / bitvector.name, data)
+
+
 def main():
     """The main function."""
     args = parse_args()
-    in_dir = args.input
 
     moonbeam = which('moonbeam-afl')
     if not moonbeam:
@@ -48,14 +101,25 @@ def main():
     if not qminset:
         raise Exception('`qminset` not found. Check PATH')
 
-    with TemporaryDirectory() as bv_dir, TemporaryDirectory() as mset_dir:
+    with TemporaryDirectory() as bv_dir, TemporaryDirectory() as mset_dir, \
+            TemporaryDirectory() as cov_dir:
+        # Expand the HDF5 coverage
+        if args.hdf5:
+            in_dir = Path(cov_dir) / args.hdf5.stem
+            in_dir.mkdir()
+            with H5File(args.hdf5, 'r') as h5f:
+                for _ in expand_hdf5(h5f, in_dir, jobs=args.jobs,
+                                     progress=True):
+                    pass
+        else:
+            in_dir = args.input
+
         # Generate bitvectors
         proc = run([moonbeam, '-i', in_dir, '-o', bv_dir], check=True)
         if proc.returncode != 0:
             raise Exception('moonbeam failed to generate bitvectors')
         print('')
 
-        output_path = Path('output')
         bitvectors = list(Path(bv_dir).glob('*.bv'))
         num_bitvectors = len(bitvectors)
 
@@ -65,35 +129,15 @@ def main():
 
         # Prepare the minset data
         print('Preparing minset data...')
-        for bitvector in bitvectors:
-            bitvector_size = bitvector.stat().st_size
-            mset_bv_dir = Path(mset_dir) / bitvector.stem
-            mset_bv_dir.mkdir()
-
-            # Write size
-            with open(mset_bv_dir / 'size', 'w') as outf:
-                outf.write('%d\n' % bitvector_size)
-
-            # Write output.tgz
-            with tarfile.open(mset_bv_dir / 'output.tgz', 'w:gz') as tar:
-                # Write imagefilemap.txt
-                imagefilemap = BytesIO(b'%s,%s\n' % (in_dir.name.encode(),
-                                                     bitvector.name.encode()))
-                tarinfo = TarInfo(name=str(output_path / 'imagefilemap.txt'))
-                tarinfo.size = len(imagefilemap.getvalue())
-                tar.addfile(tarinfo=tarinfo, fileobj=imagefilemap)
-
-                # Write info.txt
-                info = BytesIO(b'0_0_0_0_0_0_0\n0_0_0_0_0_0_WEIGHT}_0\n')
-                tarinfo = TarInfo(name=str(output_path / 'info.txt'))
-                tarinfo.size = len(info.getvalue())
-                tar.addfile(tarinfo=tarinfo, fileobj=info)
-
-                # Write the bitvector
-                with open(bitvector, 'rb') as inf:
-                    tarinfo = TarInfo(name=str(output_path / bitvector.name))
-                    tarinfo.size = bitvector_size
-                    tar.addfile(tarinfo=tarinfo, fileobj=inf)
+        prepare = partial(prepare_bitvector, mset_dir=Path(mset_dir),
+                          corpus_name=in_dir.name,
+                          compress_level=args.compress_level)
+        with mpp.Pool(processes=args.jobs) as pool:
+            for _ in tqdm(pool.imap_unordered(prepare, bitvectors,
+                                              chunksize=64),
+                          desc='Preparing minset data', total=num_bitvectors,
+                          unit='bitvectors'):
+                pass
 
         # Run qminset
         print('Running minset...')
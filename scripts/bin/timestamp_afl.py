@@ -4,16 +4,20 @@
 Get the timestamps and sizes for all fuzzing testcases in the queue, crashes,
 and hangs directories (works for both AFL and Angora).
 
+This script is copied as-is into the Magma AFL image, so it must not depend on
+the `seed_selection` package. `timestamp_experiment.py` timestamps entire
+experiments.
+
 Author: Adrian Herrera
 """
 
 
 from argparse import ArgumentParser, Namespace
-from csv import DictWriter
+from csv import writer as csv_writer
 from pathlib import Path
+from typing import Iterator, Tuple
 import os
 import re
-from typing import Dict
 
 
 AFL_SEED_RE = re.compile(r'''^id[:_]''')
@@ -31,26 +35,26 @@ def parse_args() -> Namespace:
     return parser.parse_args()
 
 
-def timestamp_results(out_dir: Path) -> Dict[str, int]:
-    """Timestamp the results of AFL."""
-    stats = []
-
-    for root, dirs, files in os.walk(out_dir):
-        # Ignore hidden directories
-        dirs[:] = [d for d in dirs if not d[0] == '.']
-
-        for name in files:
-            if not AFL_SEED_RE.match(name):
-                continue
-
-            seed = Path(root) / name
-            ctime = seed.stat().st_ctime
-
-            stat_dict = dict(seed=str(seed), unix_time=ctime,
-                             size=seed.stat().st_size)
-            stats.append(stat_dict)
-
-    return stats
+def timestamp_results(out_dir: Path) -> Iterator[Tuple[str, int, float]]:
+    """
+    Timestamp the results of AFL. Yields the path, size, and creation time of
+    each testcase. Each testcase is `stat`-ed once.
+    """
+    todo = [str(out_dir)]
+    while todo:
+        try:
+            it = os.scandir(todo.pop())
+        except FileNotFoundError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    # Ignore hidden directories
+                    if not entry.name.startswith('.'):
+                        todo.append(entry.path)
+                elif AFL_SEED_RE.match(entry.name):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_ctime
 
 
 def main():
@@ -60,12 +64,12 @@ def main():
     stats = []
     for name in ('queue', 'crashes', 'hangs'):
         stats.extend(timestamp_results(args.out_dir / name))
-    stats.sort(key=lambda d: d['unix_time'])
+    stats.sort(key=lambda stat: stat[2])
 
     # Write the results to the output CSV file
     with open(args.output, 'w') as outf:
-        writer = DictWriter(outf, fieldnames=FIELDNAMES)
-        writer.writeheader()
+        writer = csv_writer(outf)
+        writer.writerow(FIELDNAMES)
         writer.writerows(stats)
 
 
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""
+Get the timestamps and sizes of the testcases of every fuzzer output directory
+in an experiment, in a single pass over the experiment. Output directories are
+timestamped in parallel, and the timestamps are written to a CSV in each
+output directory.
+
+Author: Adrian Herrera
+"""
+
+
+from argparse import ArgumentParser, Namespace
+import logging
+
+from tqdm import tqdm
+
+from seed_selection.argparse import log_level, path_exists, positive_int
+from seed_selection.fuzzers import FUZZERS
+from seed_selection.log import get_logger
+from seed_selection.timestamps import find_output_dirs, timestamp_output_dirs
+
+
+logger = get_logger('timestamp_experiment')
+
+
+def parse_args() -> Namespace:
+    """Parse command-line arguments."""
+    parser = ArgumentParser(description='Get timestamps and file sizes for '
+                                        'all fuzzer results in an experiment')
+    parser.add_argument('-f', '--fuzzer', choices=FUZZERS, default='afl',
+                        help='Fuzzer that produced the results')
+    parser.add_argument('-j', '--jobs', type=positive_int, default=1,
+                        help='Number of parallel jobs')
+    parser.add_argument('-n', '--name', default='timestamps.csv',
+                        help='Name of the CSV written to each output '
+                             'directory')
+    parser.add_argument('-l', '--log', type=log_level, default=logging.WARN,
+                        help='Logging level')
+    parser.add_argument('experiment', metavar='DIR', type=path_exists,
+                        help='Experiment directory')
+    return parser.parse_args()
+
+
+def main():
+    """The main function."""
+    args = parse_args()
+    fuzzer = FUZZERS[args.fuzzer]
+
+    # Initialize logging
+    logger.setLevel(args.log)
+
+    # Fuzzer output directories contain (at least) the first testcase
+    # directory
+    out_dirs = find_output_dirs(args.experiment, fuzzer.testcase_dirs[0])
+    logger.info('Found %d output directories in %s', len(out_dirs),
+                args.experiment)
+
+    for out_dir, num_testcases in tqdm(
+            timestamp_output_dirs(out_dirs, args.name, fuzzer.testcase_dirs,
+                                  fuzzer.testcase_re, args.jobs),
+            desc='Timestamping', total=len(out_dirs), unit='dirs'):
+        logger.debug('Timestamped %d testcases in %s', num_testcases,
+                     out_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,22 +8,26 @@ Author: Adrian Herrera
 
 
 from argparse import ArgumentParser, Namespace
-from collections import defaultdict, OrderedDict
+from collections import OrderedDict
 from pathlib import Path
-from typing import Set, TextIO
 
 from matplotlib import rc, rcParams
 from supervenn import supervenn
 import matplotlib.pyplot as plt
+import numpy as np
 
 from seed_selection.argparse import path_exists
+from seed_selection.corpora import (CORPUS_LABELS, encode_corpora,
+                                    pairwise_overlap, read_corpus)
 
 
 def parse_args() -> Namespace:
     """Parse command-line arguments."""
     parser = ArgumentParser(description='Visualize corpora overlap')
     parser.add_argument('-o', '--output', metavar='PDF', type=Path,
-                        required=True)
+                        default=None, help='Plot the overlap to this PDF')
+    parser.add_argument('--table', metavar='CSV', type=Path, default=None,
+                        help='Write the pairwise overlap table to this CSV')
     parser.add_argument('--cmin', metavar='CORPUS', type=path_exists,
                         default=None)
     parser.add_argument('--full', metavar='CORPUS', type=path_exists,
@@ -36,12 +40,11 @@ def parse_args() -> Namespace:
                         type=path_exists, default=None)
     parser.add_argument('--weighted-max-freq-optimal', metavar='CORPUS',
                         type=path_exists, default=None)
-    return parser.parse_args()
 
-
-def read_corpus(inf: TextIO) -> Set[str]:
-    """Read the given corpus listing as a set of seed names."""
-    return {line.strip() for line in inf}
+    args = parser.parse_args()
+    if not args.output and not args.table:
+        parser.error('at least one of -o/--output or --table is required')
+    return args
 
 
 def main():
@@ -50,38 +53,26 @@ def main():
 
     # Read corpora
     corpora = dict()
-    if args.cmin:
-        with open(args.cmin, 'r') as inf:
-            corpora['CMIN'] = read_corpus(inf)
-    if args.full:
-        with open(args.full, 'r') as inf:
-            corpora['FULL'] = read_corpus(inf)
-    if args.minset:
-        with open(args.minset, 'r') as inf:
-            corpora['MSET'] = read_corpus(inf)
-    if args.unweighted_optimal:
-        with open(args.unweighted_optimal, 'r') as inf:
-            corpora['UOPT'] = read_corpus(inf)
-    if args.weighted_optimal:
-        with open(args.weighted_optimal, 'r') as inf:
-            corpora['WOPT'] = read_corpus(inf)
-    if args.weighted_max_freq_optimal:
-        with open(args.weighted_max_freq_optimal, 'r') as inf:
-            corpora['WMOPT'] = read_corpus(inf)
-
-    # Represent the corpora as a set of integers, where each integer uniquely
-    # maps to a seed file
-    seed_map = {seed: i for i, seed in enumerate(corpora['FULL'])}
-
-    plot_data = defaultdict(set)
-    plot_data['FULL'] = set(seed_map.values())
-
-    for corpus in set(corpora.keys()) - set(['FULL']):
-        for seed in corpora[corpus]:
-            if seed not in seed_map:
-                print('WARN: seed `%s` is not in the FULL corpus' % seed)
-                continue
-            plot_data[corpus].add(seed_map[seed])
+    for corpus, label in CORPUS_LABELS.items():
+        listing = getattr(args, corpus.replace('-', '_'))
+        if listing:
+            with open(listing, 'r') as inf:
+                corpora[label] = read_corpus(inf)
+
+    # Represent the corpora as bitsets over the FULL corpus, where each bit
+    # uniquely maps to a seed file
+    names, bits, _ = encode_corpora(
+        corpora, full='FULL',
+        warn=lambda seed: print('WARN: seed `%s` is not in the FULL corpus' %
+                                seed))
+
+    if args.table:
+        pairwise_overlap(names, bits).to_csv(args.table, index=False)
+    if not args.output:
+        return
+
+    plot_data = {name: set(np.flatnonzero(np.unpackbits(corpus_bits)))
+                 for name, corpus_bits in zip(names, bits)}
 
     # Configure plot
     plt.style.use('seaborn-dark')
@@ -7,7 +7,7 @@ Author: Adrian Herrera
 
 from getopt import getopt, GetoptError
 from pathlib import Path
-from typing import List, TextIO, Tuple
+from typing import Dict, List, TextIO, Tuple, Union
 import re
 
 import pandas as pd
@@ -77,6 +77,21 @@ FUZZER_STATS_RES = (
     PEAK_RSS_MB_RE,
 )
 
+# AFL++ renamed several fuzzer_stats/plot_data fields. Map them back to their
+# original AFL names
+AFLPP_FIELD_ALIASES = {
+    'corpus_count': 'paths_total',
+    'corpus_favored': 'paths_favored',
+    'corpus_found': 'paths_found',
+    'corpus_imported': 'paths_imported',
+    'corpus_variable': 'variable_paths',
+    'cur_item': 'cur_path',
+    'last_find': 'last_path',
+    'saved_crashes': 'unique_crashes',
+    'saved_hangs': 'unique_hangs',
+    'total_execs': 'execs_done',
+}
+
 AFL_GETOPT = '+i:o:f:m:t:T:dnCB:S:M:x:Q'
 AFLPP_GETOPT = '+c:i:I:o:f:m:t:T:dnCB:S:M:x:QNUWe:p:s:V:E:L:hRP:'
 
@@ -128,6 +143,30 @@ def read_plot_data(in_file: TextIO) -> pd.DataFrame:
     return df
 
 
+def parse_stat_value(val: str) -> Union[float, str]:
+    """Convert a fuzzer_stats/plot_data value to a number (if possible)."""
+    try:
+        return float(val.rstrip('%'))
+    except ValueError:
+        return val
+
+
+def parse_fuzzer_stats(text: str) -> Dict[str, Union[float, str]]:
+    """
+    Parse the contents of a fuzzer_stats file into a dictionary. Unlike
+    `FuzzerStats`, this accepts any field, and AFL++ field names are mapped to
+    their original AFL names.
+    """
+    stats = {}
+    for line in text.splitlines():
+        key, sep, val = line.partition(':')
+        if not sep:
+            continue
+        key = key.strip()
+        stats[AFLPP_FIELD_ALIASES.get(key, key)] = parse_stat_value(val.strip())
+    return stats
+
+
 class FuzzerStats:
     """Container for AFL fuzzer_stats file."""
 
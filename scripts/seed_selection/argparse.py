@@ -7,13 +7,27 @@ Author: Adrian Herrera
 
 from argparse import ArgumentTypeError
 from pathlib import Path
+from typing import List
 import logging
 import re
 
+from .cores import parse_cpulist
+
 
 MEM_LIMIT_RE = re.compile(r'''(\d+)([TGkM]?)''')
 
 
+def cpu_list(val: str) -> List[int]:
+    """Parse a Linux-style CPU list (e.g., `0-3,8,10-11`)."""
+    try:
+        cores = parse_cpulist(val)
+    except ValueError as e:
+        raise ArgumentTypeError('%r is not a valid CPU list' % val) from e
+    if not cores:
+        raise ArgumentTypeError('%r is an empty CPU list' % val)
+    return cores
+
+
 def log_level(val: str) -> int:
     """Ensure that an argument value is a valid log level."""
     numeric_level = getattr(logging, val.upper(), None)
@@ -29,7 +43,7 @@ def mem_limit(val: str) -> int:
         match = MEM_LIMIT_RE.match(val)
         if not match:
             raise ArgumentTypeError('%r is not a valid memory limit' % val)
-        mem_limit = match.group(1)
+        mem_limit = int(match.group(1))
         suffix = match.group(2)
         if suffix == 'T':
             mem_limit *= 1024 * 1024
@@ -0,0 +1,191 @@
+"""
+A native implementation of `afl-cmin`'s corpus minimization.
+
+`afl-cmin` selects, for every tuple (edge and hit count class), the smallest
+seed that exercises it. Tuples are visited from rarest to most common, and a
+tuple's seed is only kept if the tuple is not already covered by a previously
+kept seed. Ties are broken in the same order as `afl-cmin`, so the same corpus
+is produced.
+
+Large corpora can be sharded: each shard is minimized independently (in
+parallel), and the union of the shard corpora is then minimized again. This is
+not guaranteed to produce the same corpus as minimizing the whole corpus at
+once (although the corpus still covers every tuple).
+
+Author: Adrian Herrera
+"""
+
+
+from functools import partial
+from pathlib import Path
+from shutil import which
+from subprocess import DEVNULL, run
+from tempfile import NamedTemporaryFile
+from typing import Callable, Dict, List, Optional, Sequence
+import multiprocessing.pool as mpp
+
+from h5py import File as H5File
+from tqdm import tqdm
+import numpy as np
+
+from .afl import replace_atat
+from .coverage import read_seed_cov
+
+
+# A tuple is encoded as its edge (upper 32 bits) and hit count (lower 32 bits)
+_EDGE_SHIFT = np.uint64(32)
+_COUNT_MASK = np.uint64(0xffffffff)
+
+# `afl-showmap` exit codes
+SHOWMAP_TIMEOUT = 1
+SHOWMAP_CRASH = 2
+
+# A coverage loader maps a seed name to its tuples (or `None` if the seed is
+# rejected)
+Loader = Callable[[str], Optional[np.ndarray]]
+
+
+def encode_tuples(edges: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Encode (edge, hit count) pairs as 64-bit tuple keys."""
+    return (edges.astype(np.uint64) << _EDGE_SHIFT) | counts.astype(np.uint64)
+
+
+def read_showmap(path: Path) -> np.ndarray:
+    """Read the tuples from an `afl-showmap` coverage file."""
+    cov = np.array(path.read_text().replace(':', ' ').split(),
+                   dtype=np.uint64).reshape(-1, 2)
+    return encode_tuples(cov[:, 0], cov[:, 1])
+
+
+def load_showmap(seed: str, cov_dir: Path) -> Optional[np.ndarray]:
+    """Load a seed's tuples from a directory of `afl-showmap` files."""
+    return read_showmap(cov_dir / seed)
+
+
+def load_hdf5(seed: str, h5_path: Path) -> Optional[np.ndarray]:
+    """Load a seed's tuples from a coverage HDF5 file."""
+    with H5File(h5_path, 'r') as h5f:
+        return encode_tuples(*read_seed_cov(h5f[seed]))
+
+
+def replay_showmap(seed: str, in_dir: Path, target: List[str],
+                   showmap_args: Sequence[str] = (),
+                   crashes_only: bool = False) -> Optional[np.ndarray]:
+    """
+    Load a seed's tuples by running `afl-showmap` on it. As with `afl-cmin`,
+    seeds that time out (or crash, or do not crash if `crashes_only` is set)
+    are rejected.
+    """
+    afl_showmap = which('afl-showmap')
+    if not afl_showmap:
+        raise Exception('Cannot find `afl-showmap`. Check PATH')
+
+    seed_path = in_dir / seed
+    target_args, found_atat = replace_atat(target[1:], seed_path)
+    with NamedTemporaryFile() as temp, open(seed_path, 'rb') as stdin:
+        proc = run([afl_showmap, '-q', *showmap_args, '-o', temp.name, '--',
+                    target[0], *target_args],
+                   stdin=DEVNULL if found_atat else stdin, check=False)
+        if proc.returncode == SHOWMAP_TIMEOUT or \
+                (proc.returncode == SHOWMAP_CRASH) != crashes_only:
+            return None
+        return read_showmap(Path(temp.name))
+
+
+def cmin(sizes: Dict[str, int], tuples: Dict[str, np.ndarray],
+         edge_only: bool = False) -> List[str]:
+    """
+    Minimize a corpus. `sizes` and `tuples` map each seed name to its file
+    size and tuples, respectively.
+    """
+    # `afl-cmin` lists seeds with `ls -rS`: smallest first, and ties in
+    # reverse name order
+    seeds = sorted(tuples, reverse=True)
+    seeds.sort(key=sizes.__getitem__)
+    if not seeds:
+        return []
+
+    seed_tuples = [tuples[seed] for seed in seeds]
+    if edge_only:
+        seed_tuples = [(tups & ~_COUNT_MASK) | np.uint64(1)
+                       for tups in seed_tuples]
+    offsets = np.cumsum([0, *(len(tups) for tups in seed_tuples)])
+    owners = np.repeat(np.arange(len(seeds)), np.diff(offsets))
+
+    # The first occurrence of a tuple is in the smallest seed
+    uniq, first, inverse, freqs = np.unique(np.concatenate(seed_tuples),
+                                            return_index=True,
+                                            return_inverse=True,
+                                            return_counts=True)
+    best = owners[first]
+
+    # `afl-cmin` sorts tuples by frequency and then (as strings) by the
+    # `afl-showmap -Z` encoding, which is the hit count followed by the edge
+    names = np.char.add((uniq & _COUNT_MASK).astype(str),
+                        (uniq >> _EDGE_SHIFT).astype(str))
+    order = np.lexsort((names, freqs))
+
+    covered = bytearray(len(uniq))
+    selected = []
+    for tup in order.tolist():
+        if covered[tup]:
+            continue
+        seed = best[tup]
+        selected.append(seeds[seed])
+        for seed_tup in inverse[offsets[seed]:offsets[seed + 1]].tolist():
+            covered[seed_tup] = 1
+
+    return selected
+
+
+def _cmin_shard(shard: List[str], sizes: Dict[str, int], load: Loader,
+                edge_only: bool = False) -> Dict[str, np.ndarray]:
+    """Minimize a shard. Returns the tuples of the selected seeds."""
+    tuples = {}
+    for seed in shard:
+        seed_tuples = load(seed)
+        if seed_tuples is not None:
+            tuples[seed] = seed_tuples
+
+    return {seed: tuples[seed] for seed in cmin(sizes, tuples, edge_only)}
+
+
+def parallel_cmin(sizes: Dict[str, int], load: Loader,
+                  edge_only: bool = False, jobs: int = 1, shards: int = 1,
+                  progress: bool = False) -> List[str]:
+    """
+    Minimize the corpus of seeds in `sizes` (which maps seed names to file
+    sizes). Seed coverage is loaded (with `load`, which must be picklable) in
+    parallel.
+
+    If `shards` is greater than one, the corpus is split into that many
+    shards, which are minimized in parallel before a final minimization of
+    their union.
+    """
+    seeds = sorted(sizes, key=lambda seed: (sizes[seed], seed))
+    tuples = {}
+
+    with mpp.Pool(processes=jobs) as pool:
+        if shards > 1:
+            # Deal the seeds out so that each shard has a similar size
+            # distribution
+            cmin_shard = partial(_cmin_shard, sizes=sizes, load=load,
+                                 edge_only=edge_only)
+            shard_iter = pool.imap_unordered(cmin_shard,
+                                             (seeds[i::shards] for i in
+                                              range(shards)))
+            for shard_tuples in tqdm(shard_iter, desc='Minimizing shards',
+                                     total=shards, unit='shards',
+                                     disable=not progress):
+                tuples.update(shard_tuples)
+        else:
+            cov_iter = pool.imap(load, seeds,
+                                 chunksize=max(1, len(seeds) // (jobs * 16)))
+            for seed, seed_tuples in tqdm(zip(seeds, cov_iter),
+                                          desc='Loading coverage',
+                                          total=len(seeds), unit='seeds',
+                                          disable=not progress):
+                if seed_tuples is not None:
+                    tuples[seed] = seed_tuples
+
+    return cmin(sizes, tuples, edge_only)
@@ -0,0 +1,142 @@
+"""
+CPU core allocation.
+
+Author: Adrian Herrera
+"""
+
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import asyncio
+import os
+
+
+NUMA_NODE_DIR = Path('/sys') / 'devices' / 'system' / 'node'
+
+
+def parse_cpulist(val: str) -> List[int]:
+    """Parse a Linux CPU list (e.g., `0-3,8,10-11`)."""
+    cores = []
+    for part in val.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cores.extend(range(int(start), int(end) + 1))
+        else:
+            cores.append(int(part))
+    return cores
+
+
+def get_numa_nodes(cores: Iterable[int]) -> Dict[int, List[int]]:
+    """
+    Group the given cores by NUMA node. If the NUMA topology is unavailable,
+    all cores are placed on a single node.
+    """
+    cores = set(cores)
+    nodes = {}
+
+    for cpulist in sorted(NUMA_NODE_DIR.glob('node*/cpulist')):
+        node_id = cpulist.parent.name[len('node'):]
+        if not node_id.isdigit():
+            continue
+        node_cores = sorted(cores & set(parse_cpulist(cpulist.read_text())))
+        if node_cores:
+            nodes[int(node_id)] = node_cores
+
+    # Cores that do not appear in the topology
+    unknown = cores - {core for node in nodes.values() for core in node}
+    if unknown:
+        nodes.setdefault(-1, []).extend(sorted(unknown))
+
+    return nodes
+
+
+class CoreAllocator:
+    """
+    Track free/busy CPU cores, and allocate groups of cores such that each
+    group is kept on a single NUMA node where possible.
+    """
+
+    def __init__(self, cores: Optional[Iterable[int]] = None) -> None:
+        if cores is None:
+            cores = os.sched_getaffinity(0)
+        self._nodes = get_numa_nodes(cores)
+        self._free = {node: set(node_cores)
+                      for node, node_cores in self._nodes.items()}
+        self._cond = None
+
+    @property
+    def num_cores(self) -> int:
+        """The total number of cores managed by the allocator."""
+        return sum(len(cores) for cores in self._nodes.values())
+
+    @property
+    def num_free(self) -> int:
+        """The number of currently-free cores."""
+        return sum(len(cores) for cores in self._free.values())
+
+    @property
+    def numa_nodes(self) -> Dict[int, List[int]]:
+        """The cores on each NUMA node."""
+        return dict(self._nodes)
+
+    def try_allocate(self, num: int) -> Optional[List[int]]:
+        """
+        Allocate `num` cores, or return `None` if there are not enough free
+        cores.
+
+        The fullest NUMA node that can fit all `num` cores is used. If no
+        single node is large enough to *ever* fit the request, cores are
+        allocated across nodes.
+        """
+        candidates = [node for node, free in self._free.items()
+                      if len(free) >= num]
+        if candidates:
+            node = min(candidates, key=lambda n: (len(self._free[n]), n))
+            cores = sorted(self._free[node])[:num]
+            self._free[node].difference_update(cores)
+            return cores
+
+        max_node_size = max(len(cores) for cores in self._nodes.values())
+        if num <= max_node_size or self.num_free < num:
+            return None
+
+        cores = []
+        for node in sorted(self._free, key=lambda n: -len(self._free[n])):
+            take = sorted(self._free[node])[:num - len(cores)]
+            self._free[node].difference_update(take)
+            cores.extend(take)
+            if len(cores) == num:
+                break
+        return cores
+
+    def _condition(self) -> asyncio.Condition:
+        # Created lazily so that it belongs to the running event loop
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def allocate(self, num: int) -> List[int]:
+        """Wait until `num` cores are free, and allocate them."""
+        if num > self.num_cores:
+            raise ValueError('Cannot allocate %d cores (only %d available)' %
+                             (num, self.num_cores))
+
+        cond = self._condition()
+        async with cond:
+            while True:
+                cores = self.try_allocate(num)
+                if cores is not None:
+                    return cores
+                await cond.wait()
+
+    async def release(self, cores: Iterable[int]) -> None:
+        """Return previously-allocated cores."""
+        cores = set(cores)
+        for node, node_cores in self._nodes.items():
+            self._free[node].update(cores.intersection(node_cores))
+
+        cond = self._condition()
+        async with cond:
+            cond.notify_all()
@@ -0,0 +1,145 @@
+"""
+Corpus overlap utilities.
+
+Corpora are encoded as bitsets over the seeds in the FULL corpus, so that set
+operations between corpora become vectorised bitwise operations.
+
+Author: Adrian Herrera
+"""
+
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, TextIO, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# Short labels used when tabulating/plotting corpora
+CORPUS_LABELS = {
+    'full': 'FULL',
+    'minset': 'MSET',
+    'cmin': 'CMIN',
+    'unweighted-optimal': 'UOPT',
+    'weighted-optimal': 'WOPT',
+    'weighted-max-freq-optimal': 'WMOPT',
+}
+
+# Number of set bits in each byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def read_corpus(inf: TextIO) -> List[str]:
+    """Read the given corpus listing as a list of seed names."""
+    return [seed for seed in (line.strip() for line in inf) if seed]
+
+
+def read_corpora(target_dir: Path,
+                 corpora: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+    """
+    Read the corpus listings (`<corpus>.txt`) in a target directory.
+
+    If `corpora` is not given, every listing in the directory is read.
+    """
+    if corpora is None:
+        paths = sorted(target_dir.glob('*.txt'))
+    else:
+        paths = [target_dir / f'{corpus}.txt' for corpus in corpora]
+
+    listings = {}
+    for path in paths:
+        if not path.exists():
+            continue
+        with path.open() as inf:
+            listings[path.stem] = read_corpus(inf)
+
+    return listings
+
+
+def popcount(bits: np.ndarray) -> np.ndarray:
+    """Count the set bits along the last axis of a packed bitset array."""
+    return _POPCOUNT[bits].sum(axis=-1, dtype=np.int64)
+
+
+def encode_corpora(corpora: Dict[str, Iterable[str]], full: str = 'full',
+                   warn=None) -> Tuple[List[str], np.ndarray, List[str]]:
+    """
+    Encode corpora as bitsets over the seeds in the `full` corpus.
+
+    Args:
+        corpora: Mapping of corpus names to seed names.
+        full: Name of the corpus that indexes all seeds.
+        warn: Optional callable, called with each seed that is not in the
+              `full` corpus. These seeds are dropped.
+
+    Returns:
+        A tuple containing the corpus names, a `(num_corpora, num_bytes)`
+        array of packed bitsets (one row per corpus) and the seed index.
+    """
+    index = sorted(set(corpora[full]))
+    index_arr = np.array(index, dtype=object)
+    names = list(corpora)
+    bools = np.zeros((len(names), len(index)), dtype=bool)
+
+    for i, name in enumerate(names):
+        seeds = np.array(sorted(set(corpora[name])), dtype=object)
+        pos = np.searchsorted(index_arr, seeds)
+        found = pos < len(index)
+        found[found] = index_arr[pos[found]] == seeds[found]
+        if warn:
+            for seed in seeds[~found]:
+                warn(seed)
+        bools[i, pos[found]] = True
+
+    return names, np.packbits(bools, axis=-1), index
+
+
+def pairwise_overlap(names: Sequence[str], bits: np.ndarray) -> pd.DataFrame:
+    """
+    Compute the pairwise overlap between packed corpus bitsets.
+
+    Returns a long-form frame with one row per ordered corpus pair, containing
+    the intersection/union sizes, the Jaccard index and the containment of
+    corpus `a` in corpus `b` (i.e., |a & b| / |a|).
+    """
+    sizes = popcount(bits)
+    inter = popcount(bits[:, None, :] & bits[None, :, :])
+    union = sizes[:, None] + sizes[None, :] - inter
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        jaccard = np.where(union > 0, inter / union, np.nan)
+        containment = np.where(sizes[:, None] > 0, inter / sizes[:, None],
+                               np.nan)
+
+    idx_a, idx_b = np.meshgrid(np.arange(len(names)), np.arange(len(names)),
+                               indexing='ij')
+    names_arr = np.array(names, dtype=object)
+    return pd.DataFrame(dict(a=names_arr[idx_a.ravel()],
+                             b=names_arr[idx_b.ravel()],
+                             size_a=sizes[idx_a.ravel()],
+                             size_b=sizes[idx_b.ravel()],
+                             intersection=inter.ravel(),
+                             union=union.ravel(),
+                             jaccard=jaccard.ravel(),
+                             containment=containment.ravel()))
+
+
+def exclusive_intersections(names: Sequence[str],
+                            bits: np.ndarray) -> pd.DataFrame:
+    """
+    Compute the size of every all-way (exclusive) intersection of corpora.
+
+    Each seed is assigned to exactly one region, identified by the set of
+    corpora it belongs to. Returns one row per non-empty region, with a
+    boolean column per corpus and the region size.
+    """
+    # Bitset padding has an empty signature, so it is dropped with the seeds
+    # that are not in any corpus
+    bools = np.unpackbits(bits, axis=-1).astype(np.int64)
+    signatures = (bools << np.arange(len(names))[:, None]).sum(axis=0)
+    regions, sizes = np.unique(signatures[signatures > 0], return_counts=True)
+
+    data = {name: (regions >> i) & 1 == 1 for i, name in enumerate(names)}
+    data['size'] = sizes
+    return pd.DataFrame(data).sort_values('size', ascending=False,
+                                          ignore_index=True)
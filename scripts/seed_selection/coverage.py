@@ -8,25 +8,38 @@ Author: Adrian Herrera
 from functools import partial
 from itertools import repeat
 from pathlib import Path
-from typing import Optional, Set
+from typing import Iterable, List, Optional, Set, Tuple
 import multiprocessing.pool as mpp
 
-from h5py import File
+from h5py import Dataset, File
+from scipy.sparse import csr_matrix
 from tqdm import tqdm
+import numpy as np
 
 # pylint: disable=unused-import
 from . import istarmap
 
 
+# From afl/config.h
+MAP_SIZE_POW2 = 16
+MAP_SIZE = 1 << MAP_SIZE_POW2
+
+# Lower bounds of AFL's hit count classes (from `count_class_human` in
+# afl-showmap.c)
+COUNT_CLASS_BOUNDS = np.array([1, 2, 3, 4, 8, 16, 32, 128], dtype=np.uint64)
+
+
 def _get_seed_cov(h5_path: Path, seed: str, out_dir: Path,
                   seeds: Optional[Set[str]] = None) -> str:
     """Extract the given seed from the HDF5 file specified at `h5_path`."""
     if seeds and seed not in seeds:
         return None
 
-    with File(h5_path, 'r') as h5f, open(out_dir / seed, 'w') as outf:
-        for edge, count in h5f[seed]:
-            outf.write('%d:%d\n' % (edge, count))
+    with File(h5_path, 'r') as h5f:
+        edges, counts = read_seed_cov(h5f[seed])
+    with open(out_dir / seed, 'w') as outf:
+        outf.writelines('%d:%d\n' % cov for cov in zip(edges.tolist(),
+                                                        counts.tolist()))
 
     return seed
 
@@ -55,7 +68,85 @@ def expand_hdf5(h5f: File, out_dir: Path, seeds: Optional[Set[str]] = None,
         num_seeds = len(seeds) if seeds else len(list(h5f.keys()))
         print('%d seeds to extract' % num_seeds)
         iter_func = partial(tqdm, desc='Expanding %s' % h5_filename,
-                            total=num_seeds, unit='seeds') if progress else id
+                            total=num_seeds, unit='seeds') if progress else iter
         for seed in iter_func(pool.istarmap(get_cov, h5_iter)):
             if seed:
                 yield seed
+
+
+def read_seed_cov(dset: Dataset) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Read a seed's coverage from an HDF5 dataset.
+
+    Returns a tuple of `(edges, counts)` arrays. Single-edge seeds are stored
+    as scalar datasets, so these are promoted to one-element arrays.
+    """
+    cov = np.atleast_1d(dset[()])
+    edge_field, count_field = cov.dtype.names[:2]
+    return cov[edge_field], cov[count_field]
+
+
+def coverage_matrix(h5f: File, seeds: Optional[Iterable[str]] = None,
+                    map_size: Optional[int] = None,
+                    progress: bool = False) -> Tuple[csr_matrix, List[str]]:
+    """
+    Build a sparse (seeds x edges) matrix of hit counts from an HDF5 file.
+
+    Args:
+        h5f: h5py file object.
+        seeds: An optional seed list. If provided, only these seeds are read
+               (in the given order).
+        map_size: Number of matrix columns. If not provided, this is inferred
+                  from the largest edge identifier.
+        progress: Set to `True` for progress bar.
+
+    Returns:
+        A tuple containing the CSR coverage matrix and the seed name for each
+        row.
+    """
+    names = list(seeds) if seeds is not None else list(h5f.keys())
+    indptr = np.zeros(len(names) + 1, dtype=np.int64)
+    edges = []
+    counts = []
+
+    for i, name in enumerate(tqdm(names, desc='Reading %s' % h5f.filename,
+                                  unit='seeds', disable=not progress)):
+        seed_edges, seed_counts = read_seed_cov(h5f[name])
+        edges.append(seed_edges)
+        counts.append(seed_counts)
+        indptr[i + 1] = indptr[i] + len(seed_edges)
+
+    indices = np.concatenate(edges) if edges else np.empty(0, dtype=np.uint32)
+    data = np.concatenate(counts) if counts else np.empty(0, dtype=np.uint8)
+
+    if map_size is None:
+        map_size = int(indices.max()) + 1 if indices.size else 0
+    elif indices.size and indices.max() >= map_size:
+        raise Exception('Edge %d exceeds the map size (%d)' %
+                        (indices.max(), map_size))
+
+    return csr_matrix((data, indices, indptr),
+                      shape=(len(names), map_size)), names
+
+
+def covered_edges(cov: csr_matrix, rows: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Compute the union of the edges covered by the given rows (seeds) of a
+    coverage matrix.
+
+    Returns a packed bitset over the matrix columns (i.e., the map).
+    """
+    if rows is not None:
+        cov = cov[rows]
+    hit = np.zeros(cov.shape[1], dtype=bool)
+    hit[cov.indices[cov.data > 0]] = True
+    return np.packbits(hit)
+
+
+def count_class(counts: np.ndarray) -> np.ndarray:
+    """
+    Map raw hit counts to AFL's hit count classes (1, 2, 3, 4-7, 8-15, 16-31,
+    32-127, 128+), as reported by `afl-showmap`. A count of zero maps to zero.
+    """
+    return np.searchsorted(COUNT_CLASS_BOUNDS, counts,
+                           side='right').astype(np.uint8)
@@ -0,0 +1,175 @@
+"""
+Fuzzer backends.
+
+Each backend describes how to run a particular fuzzer: its command-line,
+environment, output layout, and how to tell when it has started.
+
+Author: Adrian Herrera
+"""
+
+
+from math import ceil
+from pathlib import Path
+from shutil import which
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from .timestamps import AFL_SEED_RE, HONGGFUZZ_SEED_RE, TESTCASE_DIRS
+
+
+class Fuzzer:
+    """Base class for fuzzer backends."""
+
+    # Backend name
+    name = None
+    # Default executable (searched for on PATH)
+    executable = None
+    # Node subdirectories that testcases are written to
+    testcase_dirs: Tuple[str, ...] = ()
+    # Testcase file name pattern
+    testcase_re: Pattern = None
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        if path is None:
+            found = which(self.executable)
+            if not found:
+                raise Exception('Cannot find `%s`. Check PATH' %
+                                self.executable)
+            path = Path(found)
+        self.path = path
+
+    def command_line(self, node_dir: Path, node: int, **kwargs) -> List[str]:
+        """Create the command-line for the given fuzzer node."""
+        raise NotImplementedError
+
+    def environment(self, pinned: bool) -> Dict[str, str]:
+        """
+        Environment variables to set for the fuzzer. `pinned` is `True` if the
+        fuzzer is pinned to a core by the caller.
+        """
+        return {}
+
+    def is_ready(self, node_dir: Path) -> bool:
+        """Determine if the fuzzer node has finished starting up."""
+        raise NotImplementedError
+
+    def is_testcase(self, name: str) -> bool:
+        """Determine if a file name is a testcase generated by the fuzzer."""
+        return bool(self.testcase_re.search(name))
+
+
+class AFL(Fuzzer):
+    """American Fuzzy Lop."""
+
+    name = 'afl'
+    executable = 'afl-fuzz'
+    testcase_dirs = TESTCASE_DIRS
+    testcase_re = AFL_SEED_RE
+
+    def _fuzzer_args(self, **kwargs) -> List[str]:
+        """Fuzzer-specific command-line options."""
+        args = []
+        if kwargs['memory']:
+            args.extend(['-m', str(kwargs['memory'])])
+        return args
+
+    def command_line(self, node_dir: Path, node: int, **kwargs) -> List[str]:
+        args = [str(self.path), '-i', str(kwargs['input']),
+                '-o', str(node_dir.parent)]
+
+        if kwargs['timeout']:
+            args.extend(['-t', str(kwargs['timeout'])])
+
+        if node == 1:
+            args.extend(['-M', node_dir.name])
+        else:
+            args.extend(['-S', node_dir.name])
+
+        args.extend(self._fuzzer_args(**kwargs))
+        if 'fuzzer_args' in kwargs:
+            args.extend(kwargs['fuzzer_args'])
+
+        args.extend(['--', str(kwargs['target']), *kwargs['target_args']])
+
+        return args
+
+    def environment(self, pinned: bool) -> Dict[str, str]:
+        env = dict(AFL_NO_UI='1')
+
+        # AFL must not try to bind to a (different) core itself
+        if pinned:
+            env['AFL_NO_AFFINITY'] = '1'
+
+        return env
+
+    def is_ready(self, node_dir: Path) -> bool:
+        return (node_dir / 'fuzzer_stats').exists()
+
+
+class AFLFast(AFL):
+    """AFLFast (AFL with power schedules)."""
+
+    name = 'aflfast'
+
+    def _fuzzer_args(self, **kwargs) -> List[str]:
+        return [*super()._fuzzer_args(**kwargs), '-p', 'fast']
+
+
+class AFLPlusPlus(AFL):
+    """AFL++."""
+
+    name = 'aflplusplus'
+
+    def _fuzzer_args(self, **kwargs) -> List[str]:
+        if not kwargs['cmp_log']:
+            return super()._fuzzer_args(**kwargs)
+        return ['-m', 'none', '-c', str(kwargs['cmp_log'])]
+
+
+class Honggfuzz(Fuzzer):
+    """honggfuzz. Each node is a separate single-threaded instance."""
+
+    name = 'honggfuzz'
+    executable = 'honggfuzz'
+    testcase_dirs = ('queue', 'crashes')
+    testcase_re = HONGGFUZZ_SEED_RE
+
+    def command_line(self, node_dir: Path, node: int, **kwargs) -> List[str]:
+        args = [str(self.path), '--threads', '1', '--quiet', '--verbose',
+                '-i', str(kwargs['input']), '-o', str(node_dir / 'queue'),
+                '-W', str(node_dir), '--crashdir', str(node_dir / 'crashes')]
+
+        # honggfuzz timeouts are in seconds (AFL's are in milliseconds)
+        if kwargs['timeout']:
+            args.extend(['-t', str(ceil(kwargs['timeout'] / 1000))])
+        if kwargs['memory']:
+            args.extend(['--rlimit_as', str(kwargs['memory'])])
+        if 'fuzzer_args' in kwargs:
+            args.extend(kwargs['fuzzer_args'])
+
+        target_args = ['___FILE___' if arg == '@@' else arg
+                       for arg in kwargs['target_args']]
+        args.extend(['--', str(kwargs['target']), *target_args])
+
+        return args
+
+    def is_ready(self, node_dir: Path) -> bool:
+        # honggfuzz has no stats file. It is ready once it has written the
+        # (minimized) input corpus to its output directory
+        queue = node_dir / 'queue'
+        return queue.exists() and any(queue.iterdir())
+
+
+FUZZERS = {fuzzer.name: fuzzer for fuzzer in (AFL, AFLFast, AFLPlusPlus,
+                                              Honggfuzz)}
+
+
+def get_fuzzer(spec: str) -> Fuzzer:
+    """
+    Create a fuzzer backend from a specification of the form `NAME[=PATH]`,
+    where `PATH` overrides the fuzzer's executable.
+    """
+    name, _, path = spec.partition('=')
+    if name not in FUZZERS:
+        raise Exception('Unsupported fuzzer `%s` (must be one of: %s)' %
+                        (name, ', '.join(FUZZERS)))
+    return FUZZERS[name](Path(path) if path else None)
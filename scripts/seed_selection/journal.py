@@ -0,0 +1,98 @@
+"""
+Persistent experiment journal.
+
+Records the state of each fuzzer node in each trial in an SQLite database, so
+that an interrupted experiment can be resumed.
+
+Author: Adrian Herrera
+"""
+
+
+from pathlib import Path
+from time import time
+from typing import Dict, Optional, Set
+import sqlite3
+
+
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS experiment (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    trial TEXT NOT NULL,
+    node INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    start_time REAL,
+    end_time REAL,
+    exit_code INTEGER,
+    PRIMARY KEY (trial, node)
+);
+'''
+
+
+class Journal:
+    """
+    SQLite-backed record of each trial/node's status. Trials are identified by
+    their directory (relative to the experiment's output directory).
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._conn = sqlite3.connect(str(path))
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def __enter__(self) -> 'Journal':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the journal."""
+        self._conn.close()
+
+    def get_config(self) -> Dict[str, str]:
+        """Get the experiment configuration."""
+        return dict(self._conn.execute('SELECT key, value FROM experiment'))
+
+    def set_config(self, config: Dict[str, str]) -> None:
+        """Set the experiment configuration."""
+        with self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO experiment '
+                                   'VALUES (?, ?)', config.items())
+
+    def start(self, trial: str, node: int) -> None:
+        """Record that a fuzzer node has started."""
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO nodes '
+                               'VALUES (?, ?, ?, ?, NULL, NULL)',
+                               (trial, node, RUNNING, time()))
+
+    def finish(self, trial: str, node: int, exit_code: Optional[int],
+               completed: bool) -> None:
+        """
+        Record that a fuzzer node has finished. A node has failed if it did not
+        run for the entire trial (e.g., it exited early or was interrupted).
+        """
+        status = DONE if completed else FAILED
+        with self._conn:
+            self._conn.execute('UPDATE nodes SET status = ?, end_time = ?, '
+                               'exit_code = ? WHERE trial = ? AND node = ?',
+                               (status, time(), exit_code, trial, node))
+
+    def completed_trials(self, num_nodes: int) -> Set[str]:
+        """Get the trials where all `num_nodes` nodes completed."""
+        rows = self._conn.execute('SELECT trial FROM nodes WHERE status = ? '
+                                  'GROUP BY trial HAVING COUNT(*) = ?',
+                                  (DONE, num_nodes))
+        return {trial for trial, in rows}
+
+    def status(self) -> Dict[str, int]:
+        """Count the number of nodes in each state."""
+        return dict(self._conn.execute('SELECT status, COUNT(*) FROM nodes '
+                                       'GROUP BY status'))
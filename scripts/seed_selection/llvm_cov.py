@@ -0,0 +1,234 @@
+"""
+llvm-cov JSON export helper functions.
+
+Author: Adrian Herrera
+"""
+
+
+from hashlib import sha1
+from pathlib import Path
+from typing import Dict, Optional
+import json
+import os
+
+import numpy as np
+
+
+# llvm-cov sorts JSON object keys, so the export totals (`data[0].totals`) are
+# the last object in the file
+TOTALS_KEY = b'"totals":'
+TAIL_SIZE = 64 * 1024
+MAX_TAIL_SIZE = 16 * 1024 * 1024
+
+TOTALS_METRICS = ('branches', 'functions', 'instantiations', 'lines',
+                  'regions')
+
+# Fields of a function region in an llvm-cov export
+REGION_LINE_START = 0
+REGION_EXECUTION_COUNT = 4
+REGION_KIND = 7
+CODE_REGION_KIND = 0
+
+
+def summary_path(llvm_cov_json: Path) -> Path:
+    """
+    Get the path of the side-car summary for an llvm-cov JSON export. The
+    side-car is not a `.json` file, so that it is not mistaken for an export
+    when globbing an output directory.
+    """
+    return llvm_cov_json.with_name('%s.totals' % llvm_cov_json.stem)
+
+
+def write_summary(llvm_cov_json: Path, totals: dict) -> None:
+    """Write the side-car summary (i.e., totals) for an llvm-cov JSON export."""
+    with open(summary_path(llvm_cov_json), 'w') as outf:
+        json.dump(totals, outf)
+
+
+def _read_tail_totals(llvm_cov_json: Path) -> Optional[dict]:
+    """
+    Find the totals by reading backwards from the end of the export. Returns
+    `None` if they could not be found.
+    """
+    decoder = json.JSONDecoder()
+    file_size = llvm_cov_json.stat().st_size
+    tail_size = TAIL_SIZE
+
+    with open(llvm_cov_json, 'rb') as inf:
+        while True:
+            tail_size = min(tail_size, file_size)
+            inf.seek(file_size - tail_size, os.SEEK_SET)
+            tail = inf.read(tail_size)
+
+            idx = tail.rfind(TOTALS_KEY)
+            if idx >= 0:
+                try:
+                    text = tail[idx + len(TOTALS_KEY):].decode('utf-8')
+                    totals, _ = decoder.raw_decode(text.lstrip())
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    return None
+                return totals if isinstance(totals, dict) else None
+
+            if tail_size == file_size or tail_size >= MAX_TAIL_SIZE:
+                return None
+            tail_size *= 2
+
+
+def read_totals(llvm_cov_json: Path) -> dict:
+    """
+    Read the coverage totals from an llvm-cov JSON export.
+
+    The side-car summary is used if it exists. Otherwise the totals are read
+    from the end of the export, falling back to parsing the entire export.
+    """
+    sidecar = summary_path(llvm_cov_json)
+    if sidecar.exists():
+        with open(sidecar, 'r') as inf:
+            return json.load(inf)
+
+    totals = _read_tail_totals(llvm_cov_json)
+    if totals is not None:
+        return totals
+
+    with open(llvm_cov_json, 'r') as inf:
+        return json.load(inf)['data'][0]['totals']
+
+
+def flatten_totals(totals: dict) -> Dict[str, float]:
+    """Flatten llvm-cov totals into `<metric>_<count|covered|percent>`."""
+    return {f'{metric}_{key}': val for metric, data in sorted(totals.items())
+            for key, val in data.items() if key in ('count', 'covered',
+                                                    'percent')}
+
+
+def build_index(llvm_cov_json: Path) -> Dict[str, np.ndarray]:
+    """
+    Build a compact region coverage index from a (non-summary) llvm-cov JSON
+    export.
+
+    Only code regions are indexed (as these are what llvm-cov's region
+    coverage counts). The index is a set of flat arrays:
+
+    * `files`: Source file names.
+    * `functions`: Function names.
+    * `function_file`: Index (into `files`) of each function's source file.
+    * `region_offsets`: Each function's regions are
+      `region_offsets[i]:region_offsets[i + 1]`.
+    * `region_lines`: The start line of each region.
+    * `region_counts`: The execution count of each region.
+    """
+    with open(llvm_cov_json, 'r') as inf:
+        functions = json.load(inf)['data'][0]['functions']
+
+    files = sorted({func['filenames'][0] for func in functions})
+    file_ids = {filename: i for i, filename in enumerate(files)}
+
+    num_regions = np.array([len(func['regions']) for func in functions],
+                           dtype=np.int64)
+    regions = np.array([(region[REGION_LINE_START],
+                         region[REGION_EXECUTION_COUNT], region[REGION_KIND])
+                        for func in functions for region in func['regions']],
+                       dtype=np.int64).reshape(-1, 3)
+
+    # Drop the non-code (e.g., expansion, skipped) regions
+    is_code = regions[:, 2] == CODE_REGION_KIND
+    func_ids = np.repeat(np.arange(len(functions)), num_regions)[is_code]
+    num_code = np.bincount(func_ids, minlength=len(functions))
+
+    return dict(files=np.array(files, dtype=str),
+                functions=np.array([func['name'] for func in functions],
+                                   dtype=str),
+                function_file=np.array([file_ids[func['filenames'][0]]
+                                        for func in functions],
+                                       dtype=np.int32),
+                region_offsets=np.concatenate(([0], np.cumsum(num_code))),
+                region_lines=regions[is_code, 0].astype(np.uint32),
+                region_counts=regions[is_code, 1].astype(np.uint64))
+
+
+def save_index(index: Dict[str, np.ndarray], path: Path) -> None:
+    """Save a region coverage index to a compressed NPZ file."""
+    with open(path, 'wb') as outf:
+        np.savez_compressed(outf, **index)
+
+
+def load_index(path: Path) -> Dict[str, np.ndarray]:
+    """Load a region coverage index from an NPZ file."""
+    with np.load(path) as npz:
+        return {key: npz[key] for key in npz.files}
+
+
+def get_index(llvm_cov_json: Path,
+              cache_dir: Optional[Path] = None) -> Dict[str, np.ndarray]:
+    """
+    Get the region coverage index for an llvm-cov JSON export (or an index
+    file). If a cache directory is given, the index is only rebuilt if the
+    export is newer than the cached index.
+    """
+    if llvm_cov_json.suffix == '.npz':
+        return load_index(llvm_cov_json)
+    if not cache_dir:
+        return build_index(llvm_cov_json)
+
+    path_hash = sha1(str(llvm_cov_json.resolve()).encode()).hexdigest()[:8]
+    index_path = cache_dir / f'{llvm_cov_json.stem}-{path_hash}.npz'
+    if index_path.exists() and \
+            index_path.stat().st_mtime >= llvm_cov_json.stat().st_mtime:
+        return load_index(index_path)
+
+    index = build_index(llvm_cov_json)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    save_index(index, index_path)
+    return index
+
+
+def align_counts(index: Dict[str, np.ndarray],
+                 ref: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Get the execution counts in `index` of the regions in the reference index
+    `ref`. Functions are matched by name. A function that is missing from
+    `index` (or has a different number of regions) is treated as uncovered.
+
+    Returns an array of execution counts over the regions in `ref`.
+    """
+    ref_offsets = ref['region_offsets']
+    offsets = index['region_offsets']
+    counts = np.zeros(ref_offsets[-1], dtype=np.uint64)
+    if not len(index['functions']):
+        return counts
+
+    order = np.argsort(index['functions'], kind='stable')
+    sorted_names = index['functions'][order]
+    pos = np.searchsorted(sorted_names, ref['functions'])
+    pos = np.minimum(pos, len(sorted_names) - 1)
+    src = order[pos]
+
+    ref_lens = np.diff(ref_offsets)
+    matched = (sorted_names[pos] == ref['functions']) & \
+        (np.diff(offsets)[src] == ref_lens)
+
+    # Gather the matched functions' regions in a single vectorised copy
+    lens = ref_lens[matched]
+    within = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens)
+    dst = np.repeat(ref_offsets[:-1][matched], lens) + within
+    src_regions = np.repeat(offsets[:-1][src[matched]], lens) + within
+    counts[dst] = index['region_counts'][src_regions]
+
+    return counts
+
+
+def align_coverage(index: Dict[str, np.ndarray],
+                   ref: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Determine which of the regions in the reference index `ref` are covered in
+    `index` (see `align_counts`).
+
+    Returns a boolean array over the regions in `ref`.
+    """
+    return align_counts(index, ref) > 0
+
+
+def segment_sum(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Sum `values` over the segments defined by `offsets`."""
+    cumsum = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+    return cumsum[offsets[1:]] - cumsum[offsets[:-1]]
@@ -0,0 +1,83 @@
+"""
+OptiMin/EvalMaxSAT helpers.
+
+Author: Adrian Herrera
+"""
+
+
+from typing import Dict, Optional, List, TextIO, Tuple
+import re
+
+
+WCNF_SEED_MAP_RE = re.compile(r'^c (\d+) : (.+)$')
+
+
+def get_seed_mapping(inf: TextIO) -> Dict[int, str]:
+    """
+    Retrieve the mapping of literal identifiers (integers) to seed names
+    (strings) from the WCNF file.
+    """
+    mapping = {}
+    for line in inf:
+        # This starts the constraint listing
+        if line.startswith('p wcnf '):
+            break
+
+        match = WCNF_SEED_MAP_RE.match(line.strip())
+        if not match:
+            continue
+
+        mapping[int(match.group(1))] = match.group(2)
+
+    return mapping
+
+
+def read_seed_map(inf: TextIO) -> Dict[int, str]:
+    """
+    Read the mapping of literal identifiers (integers) to seed names (strings)
+    from a seed map written by `afl-showmap-maxsat -m`. Unlike the WCNF, this
+    only contains the mapping.
+    """
+    mapping = {}
+    for line in inf:
+        lit, _, seed = line.rstrip('\n').partition(' : ')
+        mapping[int(lit)] = seed
+
+    return mapping
+
+
+def parse_maxsat_out(out: List[str], mapping: Dict[int, str]) -> Tuple[Optional[List[str]], Optional[float]]:
+    """
+    Parse the output from EvalMaxSat.
+
+    Returns a tuple containing:
+
+    1. The list of seeds that make up the solution, or `None` if a solution
+    could not be found.
+    2. The execution time.
+    """
+    solution = None
+    exec_time = None
+
+    for line in out:
+        # Solution status
+        if line.startswith('s ') and 'OPTIMUM FOUND' not in line:
+            # No optimum solution found
+            break
+
+        # Solution values
+        if line.startswith('v '):
+            vals = [int(v) for v in line[2:].split(' ')]
+            solution = [mapping[v] for v in vals if v > 0]
+
+        # Execution time
+        if line.startswith('c Total time: '):
+            toks = line.split(' ')
+            exec_time = float(toks[3])
+            units = toks[4]
+
+            # TODO other units to worry about?
+            if units == 'ms':
+                exec_time = exec_time / 1000
+
+    return solution, exec_time
@@ -0,0 +1,216 @@
+"""
+Corpus minimization techniques.
+
+Each technique minimizes a corpus from a directory of `afl-showmap` coverage
+files (one per seed) and returns the names of the seeds in the minimized
+corpus. External tools are searched for on PATH.
+
+Author: Adrian Herrera
+"""
+
+
+from csv import reader as csv_reader
+from pathlib import Path
+from shutil import which
+from subprocess import DEVNULL, PIPE, CalledProcessError, run
+from tempfile import TemporaryDirectory
+from typing import Dict, List, Optional, Tuple
+import re
+import resource
+import time
+
+from .cmin import cmin, read_showmap
+from .maxsat import parse_maxsat_out, read_seed_map
+from .resources import AccountedPopen
+
+
+SEED_LISTING_RE = re.compile(r'^Seeds \((\d+)\):$')
+
+
+def _find(executable: str) -> str:
+    path = which(executable)
+    if not path:
+        raise Exception('Cannot find `%s`. Check PATH' % executable)
+    return path
+
+
+def read_weights(path: Path) -> Dict[str, int]:
+    """Read a `FILE,WEIGHT` weights CSV."""
+    with open(path, 'r') as inf:
+        return {row[0]: int(row[1]) for row in csv_reader(inf) if row}
+
+
+def parse_seed_listing(out: str) -> List[str]:
+    """
+    Parse the seeds following the `Seeds (N):` line printed by the wrapper
+    scripts (e.g., `afl_cmin.py`, `qminset.py`).
+    """
+    lines = out.split('\n')
+    for i, line in enumerate(lines):
+        match = SEED_LISTING_RE.match(line.strip())
+        if match:
+            num_seeds = int(match.group(1))
+            return [seed.strip() for seed in lines[i + 1:i + 1 + num_seeds]]
+
+    raise Exception('No seed listing found')
+
+
+class Technique:
+    """Base class for minimization techniques."""
+
+    # Technique name (as in `MINIMIZE_TECHNIQUES`)
+    name = None
+    # Whether seed weights (i.e., file sizes) are required
+    weighted = False
+    # Whether the minimization runs in child processes (rather than in this
+    # process)
+    external = True
+    # Peak resident set size (in bytes) of the last minimization, if the
+    # technique measures it itself
+    peak_rss = None
+
+    def minimize(self, cov_dir: Path, weights: Optional[Path] = None,
+                 jobs: int = 1) -> List[str]:
+        """Minimize the corpus whose coverage is in `cov_dir`."""
+        raise NotImplementedError
+
+
+class CMin(Technique):
+    """
+    `afl-cmin`'s algorithm, run on existing coverage (so the target is not
+    rerun).
+    """
+
+    name = 'cmin'
+    weighted = True
+    external = False
+
+    def minimize(self, cov_dir: Path, weights: Optional[Path] = None,
+                 jobs: int = 1) -> List[str]:
+        # Techniques already run in parallel (in pool processes, which cannot
+        # have their own pool), so coverage is read serially
+        all_sizes = read_weights(weights)
+        sizes = {}
+        tuples = {}
+        for path in cov_dir.iterdir():
+            sizes[path.name] = all_sizes[path.name]
+            tuples[path.name] = read_showmap(path)
+
+        return cmin(sizes, tuples)
+
+
+class MinSet(Technique):
+    """MinSet (via `qminset.py`)."""
+
+    name = 'minset'
+
+    def minimize(self, cov_dir: Path, weights: Optional[Path] = None,
+                 jobs: int = 1) -> List[str]:
+        proc = run([_find('qminset.py'), '-j', f'{jobs}', '-i', str(cov_dir)],
+                   stdout=PIPE, check=True, encoding='utf-8')
+        return parse_seed_listing(proc.stdout)
+
+
+class Optimal(Technique):
+    """
+    OptiMin. The WCNF is streamed from `afl-showmap-maxsat` straight into
+    EvalMaxSAT. Both processes run concurrently, so the peak resident set size
+    is (an upper bound of) the sum of their peaks.
+    """
+
+    # Ignore hit counts
+    edge_only = True
+
+    def minimize(self, cov_dir: Path, weights: Optional[Path] = None,
+                 jobs: int = 1) -> List[str]:
+        optimin_args = [_find('afl-showmap-maxsat'), '-j', f'{jobs}']
+        eval_max_sat = _find('EvalMaxSAT_bin')
+        if self.edge_only:
+            optimin_args.append('-e')
+        if self.weighted:
+            optimin_args.extend(['-w', str(weights)])
+
+        with TemporaryDirectory() as temp_dir:
+            seed_map_path = Path(temp_dir) / 'seeds.map'
+            optimin_args.extend(['-m', str(seed_map_path), '-o', '-', '--',
+                                 str(cov_dir)])
+
+            optimin_proc = AccountedPopen(optimin_args, stdout=PIPE,
+                                          stderr=DEVNULL)
+            maxsat_args = [eval_max_sat, '/dev/stdin', '-p', f'{jobs}']
+            maxsat_proc = AccountedPopen(maxsat_args,
+                                         stdin=optimin_proc.stdout,
+                                         stdout=PIPE, encoding='utf-8')
+            optimin_proc.stdout.close()
+            maxsat_out, _ = maxsat_proc.communicate()
+            if optimin_proc.wait():
+                raise CalledProcessError(optimin_proc.returncode,
+                                         optimin_args)
+            if maxsat_proc.returncode:
+                raise CalledProcessError(maxsat_proc.returncode, maxsat_args)
+
+            # `ru_maxrss` is in kilobytes
+            self.peak_rss = (optimin_proc.rusage.ru_maxrss +
+                             maxsat_proc.rusage.ru_maxrss) * 1024
+
+            with open(seed_map_path, 'r') as inf:
+                seed_map = read_seed_map(inf)
+
+        solution, _ = parse_maxsat_out([line.strip() for line in
+                                        maxsat_out.split('\n')], seed_map)
+        if solution is None:
+            raise Exception('Unable to find optimum solution for %s' %
+                            cov_dir)
+        return solution
+
+
+class UnweightedOptimal(Optimal):
+    """Unweighted OptiMin (edges only)."""
+
+    name = 'unweighted-optimal'
+
+
+class WeightedOptimal(Optimal):
+    """Weighted OptiMin (edges only)."""
+
+    name = 'weighted-optimal'
+    weighted = True
+
+
+class WeightedMaxFreqOptimal(Optimal):
+    """Weighted OptiMin (edges and hit counts)."""
+
+    name = 'weighted-max-freq-optimal'
+    weighted = True
+    edge_only = False
+
+
+TECHNIQUES = {technique.name: technique for technique in
+              (CMin, MinSet, UnweightedOptimal, WeightedOptimal,
+               WeightedMaxFreqOptimal)}
+
+
+def measure(name: str, cov_dir: Path, weights: Optional[Path] = None,
+            jobs: int = 1) -> Tuple[List[str], float, int]:
+    """
+    Run a minimization technique. This should be called in a fresh process,
+    so that peak memory usage is that of this technique only.
+
+    Returns a tuple containing the minimized corpus, the wall time (in
+    seconds) and the peak resident set size (in bytes). Unless the technique
+    measures its own peak (as OptiMin does), the peak of an external technique
+    is that of its largest child process, not of all of its processes
+    combined.
+    """
+    technique = TECHNIQUES[name]()
+    start = time.time()
+    seeds = technique.minimize(cov_dir, weights, jobs)
+    wall_time = time.time() - start
+
+    if technique.peak_rss is not None:
+        return seeds, wall_time, technique.peak_rss
+
+    who = resource.RUSAGE_CHILDREN if technique.external else \
+        resource.RUSAGE_SELF
+    # `ru_maxrss` is in kilobytes
+    return seeds, wall_time, resource.getrusage(who).ru_maxrss * 1024
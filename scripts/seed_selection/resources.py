@@ -0,0 +1,287 @@
+"""
+Fuzzer resource accounting.
+
+Resource usage (CPU time, memory, and I/O) is sampled either from a (cgroup
+v2) control group, or from `/proc` for a process and all of its descendants.
+cgroups can also enforce memory/CPU quotas.
+
+Author: Adrian Herrera
+"""
+
+
+from pathlib import Path
+from subprocess import Popen, TimeoutExpired
+from typing import Dict, List, Optional, Set
+import os
+import resource
+import time
+
+
+RESOURCE_FIELDNAMES = ('unix_time', 'cpu_user', 'cpu_system', 'rss_bytes',
+                       'read_bytes', 'write_bytes', 'num_procs')
+RUSAGE_FIELDS = ('ru_utime', 'ru_stime', 'ru_maxrss', 'ru_minflt',
+                 'ru_majflt', 'ru_inblock', 'ru_oublock', 'ru_nvcsw',
+                 'ru_nivcsw')
+
+# cpu.max period (in microseconds)
+CPU_MAX_PERIOD = 100000
+
+_CLK_TCK = os.sysconf('SC_CLK_TCK')
+_PAGE_SIZE = resource.getpagesize()
+
+
+class AccountedPopen(Popen):
+    """
+    A `Popen` that reaps the child with `wait4` (when polled or waited for),
+    so that the resource usage of the child (and its waited-for descendants)
+    is recorded.
+    """
+
+    rusage: Optional[resource.struct_rusage] = None
+
+    def poll(self) -> Optional[int]:
+        if self.returncode is None:
+            pid, status, rusage = os.wait4(self.pid, os.WNOHANG)
+            if pid == self.pid:
+                self.rusage = rusage
+                self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+            while self.poll() is None:
+                if time.monotonic() > deadline:
+                    raise TimeoutExpired(self.args, timeout)
+                time.sleep(0.01)
+        elif self.returncode is None:
+            _, status, self.rusage = os.wait4(self.pid, 0)
+            self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+
+def rusage_to_dict(rusage: resource.struct_rusage) -> Dict[str, float]:
+    """Convert a `struct_rusage` to a dictionary."""
+    return {field: getattr(rusage, field) for field in RUSAGE_FIELDS}
+
+
+def _read_stat(pid: int) -> Optional[List[str]]:
+    """
+    Read `/proc/<pid>/stat`. The fields following the command name (which may
+    contain spaces) are returned, starting from field 3 (the process state).
+    """
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as inf:
+            return inf.read().rsplit(')', 1)[1].split()
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+
+
+def _children(pid: int) -> Optional[List[int]]:
+    """
+    Get the child processes of `pid`. Returns `None` if the kernel does not
+    provide `/proc/<pid>/task/<tid>/children`.
+    """
+    children = []
+    try:
+        with os.scandir(f'/proc/{pid}/task') as tasks:
+            for task in tasks:
+                with open(f'{task.path}/children', 'r') as inf:
+                    children.extend(int(child) for child in inf.read().split())
+    except FileNotFoundError:
+        return None if os.path.exists(f'/proc/{pid}') else []
+    except ProcessLookupError:
+        pass
+    return children
+
+
+def process_tree(root: int) -> Set[int]:
+    """Get `root` and all of its descendants."""
+    pids = set()
+    todo = [root]
+    while todo:
+        pid = todo.pop()
+        if pid in pids:
+            continue
+        pids.add(pid)
+
+        children = _children(pid)
+        if children is None:
+            break
+        todo.extend(children)
+    else:
+        return pids
+
+    # Fall back to scanning every process' parent
+    parents = {}
+    with os.scandir('/proc') as procs:
+        for proc in procs:
+            if proc.name.isdigit():
+                fields = _read_stat(int(proc.name))
+                if fields:
+                    parents.setdefault(int(fields[1]), []).append(
+                        int(proc.name))
+
+    pids = set()
+    todo = [root]
+    while todo:
+        pid = todo.pop()
+        if pid not in pids:
+            pids.add(pid)
+            todo.extend(parents.get(pid, ()))
+    return pids
+
+
+class ProcSampler:
+    """
+    Sample the resource usage of a process tree from `/proc`. The usage of
+    descendants that have exited is included once they are reaped by their
+    parent (via the parent's `cutime`/`cstime` and I/O counters).
+    """
+
+    def __init__(self, pid: int) -> None:
+        self._pid = pid
+
+    def sample(self) -> Dict[str, float]:
+        """Sample the process tree's current resource usage."""
+        totals = dict(user=0, system=0, rss=0)
+        num_procs = 0
+        for pid in process_tree(self._pid):
+            fields = _read_stat(pid)
+            if not fields:
+                continue
+
+            # utime, stime, cutime, cstime, and rss (fields 14-17 and 24)
+            totals['user'] += int(fields[11]) + int(fields[13])
+            totals['system'] += int(fields[12]) + int(fields[14])
+            totals['rss'] += int(fields[21]) * _PAGE_SIZE
+            num_procs += 1
+
+            try:
+                with open(f'/proc/{pid}/io', 'r') as inf:
+                    for line in inf:
+                        key, val = line.split(':')
+                        if key in ('read_bytes', 'write_bytes'):
+                            totals[key] = totals.get(key, 0) + int(val)
+            except (FileNotFoundError, PermissionError, ProcessLookupError):
+                pass
+
+        return dict(unix_time=time.time(),
+                    cpu_user=totals['user'] / _CLK_TCK,
+                    cpu_system=totals['system'] / _CLK_TCK,
+                    rss_bytes=totals['rss'],
+                    read_bytes=totals.get('read_bytes'),
+                    write_bytes=totals.get('write_bytes'),
+                    num_procs=num_procs)
+
+
+class Cgroup:
+    """A cgroup v2 control group."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    @staticmethod
+    def is_available(path: Path) -> bool:
+        """Determine if `path` is in a cgroup v2 hierarchy."""
+        return (path / 'cgroup.controllers').exists()
+
+    def create(self, controllers=('cpu', 'io', 'memory')) -> None:
+        """
+        Create the cgroup, enabling the given controllers for it (in its
+        parent).
+        """
+        parent = self.path.parent
+        available = (parent / 'cgroup.controllers').read_text().split()
+        enable = ' '.join(f'+{ctrl}' for ctrl in controllers
+                          if ctrl in available)
+        if enable:
+            (parent / 'cgroup.subtree_control').write_text(enable)
+        self.path.mkdir(exist_ok=True)
+
+    def child(self, name: str) -> 'Cgroup':
+        """Get a child cgroup."""
+        return Cgroup(self.path / name)
+
+    def set_limits(self, memory_max: Optional[int] = None,
+                   cpu_max: Optional[float] = None) -> None:
+        """
+        Set the cgroup's memory limit (in bytes) and CPU quota (in number of
+        CPUs).
+        """
+        if memory_max:
+            (self.path / 'memory.max').write_text(str(int(memory_max)))
+        if cpu_max:
+            quota = int(cpu_max * CPU_MAX_PERIOD)
+            (self.path / 'cpu.max').write_text(f'{quota} {CPU_MAX_PERIOD}')
+
+    def wrap_command(self, args: List[str]) -> List[str]:
+        """
+        Wrap a command-line so that the process joins this cgroup before it
+        `exec`s (and hence before it creates any children).
+        """
+        return ['sh', '-c', 'echo $$ > "$0/cgroup.procs" && exec "$@"',
+                str(self.path), *args]
+
+    def _read_keyed(self, name: str) -> Dict[str, int]:
+        try:
+            with open(self.path / name, 'r') as inf:
+                return {key: int(val) for key, val in
+                        (line.split() for line in inf if line.strip())}
+        except FileNotFoundError:
+            return {}
+
+    def _read_int(self, name: str) -> Optional[int]:
+        try:
+            return int((self.path / name).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def sample(self) -> Dict[str, float]:
+        """Sample the cgroup's current resource usage."""
+        cpu = self._read_keyed('cpu.stat')
+
+        read_bytes = write_bytes = 0
+        try:
+            with open(self.path / 'io.stat', 'r') as inf:
+                for line in inf:
+                    for stat in line.split()[1:]:
+                        key, _, val = stat.partition('=')
+                        if key == 'rbytes':
+                            read_bytes += int(val)
+                        elif key == 'wbytes':
+                            write_bytes += int(val)
+        except FileNotFoundError:
+            pass
+
+        procs = (self.path / 'cgroup.procs').read_text().split()
+
+        return dict(unix_time=time.time(),
+                    cpu_user=cpu.get('user_usec', 0) / 1e6,
+                    cpu_system=cpu.get('system_usec', 0) / 1e6,
+                    rss_bytes=self._read_int('memory.current'),
+                    read_bytes=read_bytes,
+                    write_bytes=write_bytes,
+                    num_procs=len(procs))
+
+    def summary(self) -> Dict[str, Optional[int]]:
+        """Get the cgroup's peak memory usage and limit events."""
+        events = self._read_keyed('memory.events')
+        cpu = self._read_keyed('cpu.stat')
+        return dict(memory_peak=self._read_int('memory.peak'),
+                    oom_kill=events.get('oom_kill'),
+                    nr_throttled=cpu.get('nr_throttled'),
+                    throttled_usec=cpu.get('throttled_usec'))
+
+    def remove(self) -> bool:
+        """
+        Remove the cgroup. Returns `False` if the cgroup could not be removed
+        (e.g., because it still contains processes).
+        """
+        try:
+            self.path.rmdir()
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return False
+        return True
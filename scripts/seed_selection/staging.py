@@ -0,0 +1,132 @@
+"""
+Staging of (write-heavy) output in a temporary (preferably tmpfs) directory,
+which is periodically synced to persistent storage.
+
+Author: Adrian Herrera
+"""
+
+
+from contextlib import asynccontextmanager
+from pathlib import Path
+from shutil import copy2, rmtree
+from tempfile import gettempdir, mkdtemp
+from typing import AsyncIterator, Container, Dict, Optional, Tuple
+import asyncio
+import os
+
+
+# Files that are never synced (e.g., AFL's constantly-rewritten current input)
+SYNC_EXCLUDE = ('.cur_input',)
+
+
+def get_temp_dir() -> Path:
+    """Determine temporary directory location. Prefer tmpfs if available."""
+    root = Path('/')
+    preferred_dirs = (root / 'dev' / 'shm', root / 'run' / 'shm')
+    for dir_ in preferred_dirs:
+        if dir_.exists():
+            return dir_
+
+    return Path(gettempdir())
+
+
+def free_space(path: Path) -> int:
+    """Get the free space (in bytes) available on `path`'s file system."""
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+
+def sync_tree(src: Path, dst: Path, synced: Dict[str, Tuple[int, int]],
+              names: Optional[Container[str]] = None) -> Tuple[int, int]:
+    """
+    Copy the files in `src` that are new or have changed (since the last sync)
+    to `dst`. `synced` records the size and modification time of every file
+    that has been copied, and is updated in-place. If `names` is given, only
+    files with those names are copied.
+
+    Files are copied to a temporary name and then renamed, so that `dst` never
+    contains partially-copied files. Returns the number of files copied and
+    the total size of `src` (in bytes).
+    """
+    num_copied = 0
+    total_size = 0
+    todo = [Path()]
+
+    while todo:
+        rel_dir = todo.pop()
+        (dst / rel_dir).mkdir(parents=True, exist_ok=True)
+        try:
+            it = os.scandir(src / rel_dir)
+        except FileNotFoundError:
+            continue
+
+        with it:
+            for entry in it:
+                if entry.name in SYNC_EXCLUDE:
+                    continue
+                rel_path = rel_dir / entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    todo.append(rel_path)
+                    continue
+
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                total_size += stat.st_size
+                if names is not None and entry.name not in names:
+                    continue
+
+                key = str(rel_path)
+                version = (stat.st_size, stat.st_mtime_ns)
+                if synced.get(key) == version:
+                    continue
+
+                tmp_path = dst / rel_dir / f'.{entry.name}.sync'
+                try:
+                    copy2(entry.path, tmp_path, follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                os.replace(tmp_path, dst / rel_path)
+                synced[key] = version
+                num_copied += 1
+
+    return num_copied, total_size
+
+
+class StagingArea:
+    """
+    A temporary directory for staging trial output. The number of trials
+    staged at any one time is limited so that each trial has `trial_size`
+    bytes of space available.
+    """
+
+    def __init__(self, parent: Optional[Path], trial_size: int) -> None:
+        self.trial_size = trial_size
+        self.root = Path(mkdtemp(prefix='fuzz-staging-',
+                                 dir=parent or get_temp_dir()))
+
+        self.max_trials = free_space(self.root) // trial_size
+        if not self.max_trials:
+            self.cleanup()
+            raise Exception('Not enough space in %s to stage a trial (%d MB '
+                            'required)' % (self.root.parent,
+                                           trial_size // 1024 // 1024))
+        self._sem = None
+
+    def trial_dir(self, trial: str) -> Path:
+        """Get the staging directory for the given trial."""
+        return self.root / trial.replace('/', '-')
+
+    @asynccontextmanager
+    async def reserve(self) -> AsyncIterator[None]:
+        """Wait until there is space to stage a trial."""
+        # Created lazily so that it belongs to the running event loop
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_trials)
+        async with self._sem:
+            yield
+
+    def cleanup(self) -> None:
+        """Remove the staging area."""
+        rmtree(self.root, ignore_errors=True)
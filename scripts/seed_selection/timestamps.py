@@ -0,0 +1,350 @@
+"""
+Fuzzer testcase timestamping.
+
+Testcase creation is recorded while the fuzzers run by a single collector
+(shared by all fuzzer nodes). The collector uses inotify where available,
+falling back to periodically scanning the testcase directories.
+
+Existing fuzzer output (e.g., entire experiments) can also be timestamped after
+the fact, from the testcases' creation (inode change) times.
+
+Author: Adrian Herrera
+"""
+
+
+from csv import writer as csv_writer
+from functools import partial
+from itertools import chain
+from pathlib import Path
+from typing import (Dict, Iterable, Iterator, List, Optional, Pattern, Set,
+                    Tuple)
+import asyncio
+import ctypes
+import errno
+import multiprocessing.pool as mpp
+import os
+import re
+import struct
+import time
+
+import numpy as np
+
+
+AFL_SEED_RE = re.compile(r'''^id[:_]''')
+HONGGFUZZ_SEED_RE = re.compile(r'''\.(honggfuzz\.cov|fuzz)$''')
+TESTCASE_DIRS = ('queue', 'crashes', 'hangs')
+
+# Timestamps of existing testcases
+TIMESTAMP_DTYPE = np.dtype([('seed', object), ('size', np.int64),
+                            ('unix_time_ns', np.int64)])
+TIMESTAMP_FIELDNAMES = ('seed', 'size', 'unix_time')
+
+# Per-node log of testcase creation events
+TESTCASE_LOG = 'testcases.csv'
+TESTCASE_LOG_FIELDNAMES = ('seed', 'unix_time_ns')
+
+# How often (in seconds) the testcase directories are scanned if inotify is
+# unavailable
+SCAN_INTERVAL = 5
+
+# From <sys/inotify.h>
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_INOTIFY_EVENT = struct.Struct('iIII')
+_INOTIFY_BUF_SIZE = 64 * 1024
+
+
+def walk_testcases(root: Path, pattern: Pattern = AFL_SEED_RE) -> \
+        Iterator[Tuple[str, int, int]]:
+    """
+    Recursively scan a directory (ignoring hidden directories) for testcases
+    (i.e., file names matching `pattern`). Yields the path, size, and creation
+    time (in nanoseconds) of each testcase. Each testcase is `stat`-ed once.
+    """
+    todo = [str(root)]
+    while todo:
+        try:
+            it = os.scandir(todo.pop())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        todo.append(entry.path)
+                elif pattern.search(entry.name):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_ctime_ns
+
+
+def timestamp_testcases(out_dir: Path,
+                        subdirs: Optional[Tuple[str, ...]] = TESTCASE_DIRS,
+                        pattern: Pattern = AFL_SEED_RE) -> np.ndarray:
+    """
+    Timestamp the existing testcases in a fuzzer's output directory (or, if
+    `subdirs` is `None`, anywhere under it). Returns a `TIMESTAMP_DTYPE`
+    array, sorted by creation time.
+    """
+    roots = [out_dir / subdir for subdir in subdirs] if subdirs else [out_dir]
+    records = np.array(list(chain.from_iterable(walk_testcases(root, pattern)
+                                                for root in roots)),
+                       dtype=TIMESTAMP_DTYPE)
+    return records[np.argsort(records['unix_time_ns'], kind='stable')]
+
+
+def write_timestamps(records: np.ndarray, out_path: Path) -> None:
+    """Write testcase timestamps (a `TIMESTAMP_DTYPE` array) to a CSV."""
+    with open(out_path, 'w') as outf:
+        writer = csv_writer(outf)
+        writer.writerow(TIMESTAMP_FIELDNAMES)
+        writer.writerows(zip(records['seed'], records['size'].tolist(),
+                             (records['unix_time_ns'] / 1e9).tolist()))
+
+
+def find_output_dirs(root: Path, marker: str = TESTCASE_DIRS[0]) -> List[Path]:
+    """
+    Find the fuzzer output directories (i.e., directories containing a
+    `marker` subdirectory) under `root`. Output directories are not searched
+    any further.
+    """
+    out_dirs = []
+    todo = [root]
+    while todo:
+        dir_ = todo.pop()
+        if (dir_ / marker).is_dir():
+            out_dirs.append(dir_)
+            continue
+        with os.scandir(dir_) as it:
+            todo.extend(Path(entry.path) for entry in it
+                        if entry.is_dir(follow_symlinks=False) and
+                        not entry.name.startswith('.'))
+
+    return sorted(out_dirs)
+
+
+def _timestamp_output_dir(out_dir: Path, out_name: str,
+                          subdirs: Optional[Tuple[str, ...]],
+                          pattern: Pattern) -> Tuple[Path, int]:
+    records = timestamp_testcases(out_dir, subdirs, pattern)
+    write_timestamps(records, out_dir / out_name)
+    return out_dir, len(records)
+
+
+def timestamp_output_dirs(out_dirs: Iterable[Path],
+                          out_name: str = 'timestamps.csv',
+                          subdirs: Optional[Tuple[str, ...]] = TESTCASE_DIRS,
+                          pattern: Pattern = AFL_SEED_RE,
+                          jobs: int = 1) -> Iterator[Tuple[Path, int]]:
+    """
+    Timestamp the testcases in multiple fuzzer output directories (in
+    parallel), writing the timestamps to `out_name` in each directory. Yields
+    each output directory (as it completes) and its number of testcases.
+    """
+    timestamp = partial(_timestamp_output_dir, out_name=out_name,
+                        subdirs=subdirs, pattern=pattern)
+    with mpp.Pool(processes=jobs) as pool:
+        yield from pool.imap_unordered(timestamp, out_dirs)
+
+
+def _load_inotify() -> Optional[ctypes.CDLL]:
+    """Load the inotify functions from libc. Returns `None` on failure."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        for func in ('inotify_init1', 'inotify_add_watch', 'inotify_rm_watch'):
+            getattr(libc, func)
+    except (AttributeError, OSError):
+        return None
+
+    libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32)
+    libc.inotify_rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+    return libc
+
+
+class _NodeLog:
+    """Testcase creation log for a single fuzzer node."""
+
+    def __init__(self, node_dir: Path, subdirs: Tuple[str, ...],
+                 pattern: Pattern) -> None:
+        self.node_dir = node_dir
+        self.subdirs = subdirs
+        self.pattern = pattern
+        self.seen: Dict[str, Set[str]] = {}
+        self.wds: Set[int] = set()
+        self._log = open(node_dir / TESTCASE_LOG, 'w')
+        self._writer = csv_writer(self._log)
+        self._writer.writerow(TESTCASE_LOG_FIELDNAMES)
+
+    def record(self, subdir: str, name: str, unix_time_ns: int) -> None:
+        """Record a testcase (if it has not already been recorded)."""
+        seen = self.seen.setdefault(subdir, set())
+        if name in seen:
+            return
+        seen.add(name)
+        self._writer.writerow((f'{subdir}/{name}', unix_time_ns))
+
+    def scan(self, subdir: str) -> None:
+        """Record any testcases in `subdir` that were missed."""
+        seen = self.seen.get(subdir, ())
+        try:
+            it = os.scandir(self.node_dir / subdir)
+        except FileNotFoundError:
+            return
+        with it:
+            for entry in it:
+                if entry.name not in seen and self.pattern.search(entry.name):
+                    try:
+                        self.record(subdir, entry.name,
+                                    entry.stat().st_ctime_ns)
+                    except FileNotFoundError:
+                        pass
+
+    def close(self) -> None:
+        """Close the log."""
+        self._log.close()
+
+
+class TestcaseCollector:
+    """
+    Record testcase creation times for multiple fuzzer nodes from the running
+    event loop. Each node's testcases are logged (with nanosecond timestamps)
+    to `TESTCASE_LOG` in the node's output directory.
+    """
+
+    def __init__(self, scan_interval: int = SCAN_INTERVAL) -> None:
+        self._scan_interval = scan_interval
+        self._nodes: Dict[Path, _NodeLog] = {}
+        # Watch descriptor -> (node, testcase subdirectory). The subdirectory
+        # is `None` for the node's output directory itself
+        self._wds: Dict[int, Tuple[_NodeLog, Optional[str]]] = {}
+        self._libc = None
+        self._fd = -1
+        self._scan_task = None
+
+    @property
+    def uses_inotify(self) -> bool:
+        """Whether inotify is used (rather than periodic scanning)."""
+        return self._fd >= 0
+
+    def start(self) -> None:
+        """Start collecting. Must be called from within the event loop."""
+        loop = asyncio.get_running_loop()
+
+        self._libc = _load_inotify()
+        if self._libc:
+            self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd >= 0:
+            loop.add_reader(self._fd, self._read_events)
+        else:
+            self._scan_task = loop.create_task(self._scan_periodically())
+
+    def stop(self) -> None:
+        """Stop collecting, and close all of the node logs."""
+        for node_dir in list(self._nodes):
+            self.unwatch(node_dir)
+
+        if self._fd >= 0:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = -1
+        if self._scan_task:
+            self._scan_task.cancel()
+            self._scan_task = None
+
+    def watch(self, node_dir: Path, subdirs: Tuple[str, ...] = TESTCASE_DIRS,
+              pattern: Pattern = AFL_SEED_RE) -> None:
+        """
+        Start recording the testcases (i.e., files matching `pattern`) created
+        in the given subdirectories of a node's directory.
+        """
+        node = _NodeLog(node_dir, subdirs, pattern)
+        self._nodes[node_dir] = node
+
+        if self.uses_inotify:
+            # The testcase directories may not exist yet
+            self._add_watch(node, None)
+            for subdir in subdirs:
+                if (node_dir / subdir).is_dir():
+                    self._add_watch(node, subdir)
+
+    def unwatch(self, node_dir: Path) -> None:
+        """Stop recording a node's testcases, and close its log."""
+        if self.uses_inotify:
+            self._read_events()
+        node = self._nodes.pop(node_dir)
+        for wd in node.wds:
+            del self._wds[wd]
+            if self.uses_inotify:
+                self._libc.inotify_rm_watch(self._fd, wd)
+        for subdir in node.subdirs:
+            node.scan(subdir)
+        node.close()
+
+    def _add_watch(self, node: _NodeLog, subdir: Optional[str]) -> None:
+        path = node.node_dir / subdir if subdir else node.node_dir
+        mask = IN_ONLYDIR | (IN_CREATE | IN_MOVED_TO)
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOENT:
+                return
+            raise OSError(err, 'inotify_add_watch failed: %s' %
+                          os.strerror(err), str(path))
+        self._wds[wd] = (node, subdir)
+        node.wds.add(wd)
+
+        # Testcases may have been created before the watch was added
+        if subdir:
+            node.scan(subdir)
+
+    def _read_events(self) -> None:
+        while True:
+            try:
+                buf = os.read(self._fd, _INOTIFY_BUF_SIZE)
+            except BlockingIOError:
+                return
+            now = time.time_ns()
+
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _, name_len = _INOTIFY_EVENT.unpack_from(buf, offset)
+                offset += _INOTIFY_EVENT.size
+                name = buf[offset:offset + name_len].rstrip(b'\0')
+                offset += name_len
+                self._handle_event(wd, mask, os.fsdecode(name), now)
+
+    def _handle_event(self, wd: int, mask: int, name: str,
+                      unix_time_ns: int) -> None:
+        if mask & IN_Q_OVERFLOW:
+            # Events were dropped, so fall back to rescanning
+            for node in self._nodes.values():
+                for subdir in node.subdirs:
+                    node.scan(subdir)
+            return
+        if wd not in self._wds:
+            return
+
+        node, subdir = self._wds[wd]
+        if mask & IN_IGNORED:
+            # The watched directory was deleted
+            del self._wds[wd]
+            node.wds.discard(wd)
+        elif subdir is None:
+            if mask & IN_ISDIR and name in node.subdirs:
+                self._add_watch(node, name)
+        elif node.pattern.search(name):
+            node.record(subdir, name, unix_time_ns)
+
+    async def _scan_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._scan_interval)
+            for node in self._nodes.values():
+                for subdir in node.subdirs:
+                    node.scan(subdir)
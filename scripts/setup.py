@@ -13,17 +13,24 @@ setup(
         'bin/afl_cmin.py',
         'bin/afl_coverage_merge.py',
         'bin/afl_coverage_pca.py',
+        'bin/corpora_coverage.py',
+        'bin/corpora_overlap.py',
         'bin/coverage_auc.py',
         'bin/expand_hdf5_coverage.py',
         'bin/fuzz.py',
+        'bin/fuzz_monitor.py',
         'bin/get_corpus.py',
         'bin/get_libs.py',
+        'bin/llvm_cov_diff.py',
         'bin/llvm_cov_merge.py',
+        'bin/llvm_cov_regions.py',
         'bin/llvm_cov_stats.py',
+        'bin/minimize.py',
         'bin/qminset.py',
         'bin/replay_seeds.py',
         'bin/eval_maxsat.py',
         'bin/timestamp_afl.py',
+        'bin/timestamp_experiment.py',
         'bin/timestamp_honggfuzz.py',
         'bin/triage_crashes.py',
         'bin/visualize_corpora.py',
@@ -32,18 +39,17 @@ setup(
     install_requires=[
         'h5py',
         'Jinja2',
-        'lifelines',
         'matplotlib',
         'numpy',
         'pandas',
         'pyelftools',
         'bootstrapped',
         'scikit-learn',
+        'scipy',
         'supervenn',
         'tabulate',
         'toml',
         'tqdm',
-        'watchdog',
         'requests',
         'moonbeam @ git+https://gitlab.anu.edu.au/lunar/moonbeam.git#egg=moonbeam',
     ],
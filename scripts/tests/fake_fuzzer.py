@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+"""
+A fake fuzzer, for testing fuzzer backends without a real fuzzer.
+
+Accepts the command-lines that the AFL and honggfuzz backends generate, and
+lays out its output in the same way: AFL nodes get a `fuzzer_stats` file,
+`plot_data` and `queue/id:...` entries, while honggfuzz instances get
+`*.honggfuzz.cov` entries in their queue directory. The input corpus is copied
+into the queue, and a new testcase is "found" (and the statistics updated)
+every `FAKE_FUZZER_INTERVAL` seconds. The fuzzer runs until it is sent SIGINT
+(or for `FAKE_FUZZER_RUN_TIME` seconds, if set).
+
+Author: Adrian Herrera
+"""
+
+
+from pathlib import Path
+from typing import List, Optional
+import hashlib
+import os
+import signal
+import sys
+import time
+
+
+PLOT_DATA_HEADER = ('# unix_time, cycles_done, cur_path, paths_total, '
+                    'pending_total, pending_favs, map_size, unique_crashes, '
+                    'unique_hangs, max_depth, execs_per_sec\n')
+
+
+def get_opt(args: List[str], opt: str) -> Optional[str]:
+    """Get the value of a command-line option (before any `--`)."""
+    if '--' in args:
+        args = args[:args.index('--')]
+    return args[args.index(opt) + 1] if opt in args else None
+
+
+class FakeAFL:
+    """Fake an AFL node."""
+
+    def __init__(self, args: List[str]) -> None:
+        name = get_opt(args, '-M') or get_opt(args, '-S')
+        self.node_dir = Path(get_opt(args, '-o')) / name
+        self.queue = self.node_dir / 'queue'
+        self.queue.mkdir(parents=True, exist_ok=True)
+        (self.node_dir / 'crashes').mkdir(exist_ok=True)
+        (self.node_dir / 'hangs').mkdir(exist_ok=True)
+        self.start_time = int(time.time())
+        self.num_paths = 0
+
+        with open(self.node_dir / 'plot_data', 'w') as outf:
+            outf.write(PLOT_DATA_HEADER)
+
+    def add_testcase(self, data: bytes, orig: Optional[str] = None) -> None:
+        """Add a testcase to the queue."""
+        name = f'id:{self.num_paths:06d},' + \
+            (f'orig:{orig}' if orig else 'src:000000,op:havoc,rep:2,+cov')
+        (self.queue / name).write_bytes(data)
+        self.num_paths += 1
+
+    def update_stats(self) -> None:
+        """Update `fuzzer_stats` and `plot_data`."""
+        now = int(time.time())
+        execs = self.num_paths * 1000
+        stats = dict(start_time=self.start_time, last_update=now,
+                     fuzzer_pid=os.getpid(), execs_done=execs,
+                     execs_per_sec='1000.00', paths_total=self.num_paths,
+                     unique_crashes=0, unique_hangs=0,
+                     bitmap_cvg=f'{self.num_paths / 100:.02f}%',
+                     stability='100.00%')
+
+        # Written atomically, as AFL does
+        tmp_path = self.node_dir / '.fuzzer_stats_tmp'
+        with open(tmp_path, 'w') as outf:
+            outf.writelines(f'{key:<18}: {val}\n'
+                            for key, val in stats.items())
+        tmp_path.replace(self.node_dir / 'fuzzer_stats')
+
+        with open(self.node_dir / 'plot_data', 'a') as outf:
+            outf.write(f'{now}, 0, 0, {self.num_paths}, 0, 0, '
+                       f'{self.num_paths / 100:.02f}%, 0, 0, 1, 1000.00\n')
+
+
+class FakeHonggfuzz:
+    """Fake a (single-threaded) honggfuzz instance."""
+
+    def __init__(self, args: List[str]) -> None:
+        self.queue = Path(get_opt(args, '-o'))
+        self.queue.mkdir(parents=True, exist_ok=True)
+        Path(get_opt(args, '--crashdir')).mkdir(parents=True, exist_ok=True)
+
+    def add_testcase(self, data: bytes, orig: Optional[str] = None) -> None:
+        """Add a testcase to the queue (named after its contents)."""
+        name = f'{hashlib.md5(data).hexdigest()}.{len(data):08x}' \
+            '.honggfuzz.cov'
+        (self.queue / name).write_bytes(data)
+
+    def update_stats(self) -> None:
+        """honggfuzz has no statistics files."""
+
+
+def main():
+    """The main function."""
+    args = sys.argv[1:]
+    interval = float(os.environ.get('FAKE_FUZZER_INTERVAL', 0.1))
+    run_time = os.environ.get('FAKE_FUZZER_RUN_TIME')
+
+    stopped = False
+
+    def stop(signum, frame):
+        nonlocal stopped
+        stopped = True
+
+    signal.signal(signal.SIGINT, stop)
+
+    fuzzer = FakeHonggfuzz(args) if '-W' in args else FakeAFL(args)
+    for seed in sorted(Path(get_opt(args, '-i')).iterdir()):
+        fuzzer.add_testcase(seed.read_bytes(), orig=seed.name)
+    fuzzer.update_stats()
+
+    deadline = time.monotonic() + float(run_time) if run_time else None
+    num_found = 0
+    while not stopped and (deadline is None or time.monotonic() < deadline):
+        time.sleep(interval)
+        num_found += 1
+        fuzzer.add_testcase(b'found %d' % num_found)
+        fuzzer.update_stats()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Tests for `fuzz.py` experiments, run with the fake fuzzer.
+
+Author: Adrian Herrera
+"""
+
+
+from pathlib import Path
+from subprocess import DEVNULL, PIPE, run
+from tempfile import TemporaryDirectory
+import os
+import sys
+import unittest
+
+from seed_selection.journal import Journal
+
+from test_fuzzers import FAKE_FUZZER, SEEDS
+from util import BIN_DIR
+
+
+class TestResume(unittest.TestCase):
+    """Resuming an experiment with the same (or a different) configuration."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        root = Path(self.temp_dir.name)
+        self.in_dir = root / 'in'
+        self.in_dir.mkdir()
+        for name, data in SEEDS.items():
+            (self.in_dir / name).write_bytes(data)
+        self.out_dir = root / 'out'
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def fuzz(self, *args):
+        """Run a (single-node, single-trial) experiment."""
+        env = dict(os.environ, PYTHONPATH=str(BIN_DIR.parent))
+        return run([sys.executable, BIN_DIR / 'fuzz.py', '-f',
+                    f'afl={FAKE_FUZZER}', '-n', '1', '--num-trials', '1',
+                    '--cores', '0', '--no-pin', '-i', self.in_dir, '-o',
+                    self.out_dir, *args, '/bin/cat', '@@'], env=env,
+                   stdout=DEVNULL, stderr=PIPE, encoding='utf-8')
+
+    def completed_trials(self):
+        with Journal(self.out_dir / 'journal.db') as journal:
+            return journal.completed_trials(1)
+
+    def test_resume(self):
+        self.assertEqual(self.fuzz('--trial-len', '1').returncode, 0)
+        self.assertEqual(self.completed_trials(), {'trial-01'})
+
+        proc = self.fuzz('--trial-len', '1', '--resume')
+        self.assertEqual(proc.returncode, 0)
+        self.assertIn('Skipping completed trial trial-01', proc.stderr)
+
+    def test_config_differs(self):
+        self.assertEqual(self.fuzz('--trial-len', '1').returncode, 0)
+
+        proc = self.fuzz('--trial-len', '2', '--resume')
+        self.assertNotEqual(proc.returncode, 0)
+        self.assertIn('--force', proc.stderr)
+
+        proc = self.fuzz('--trial-len', '2', '--resume', '--force')
+        self.assertEqual(proc.returncode, 0)
+        self.assertIn('`trial_len` differs', proc.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
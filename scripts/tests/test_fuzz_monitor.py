@@ -0,0 +1,83 @@
+"""
+Tests for `fuzz_monitor.py`, run against fake fuzzer output.
+
+Author: Adrian Herrera
+"""
+
+
+from pathlib import Path
+from subprocess import DEVNULL, run
+from tempfile import TemporaryDirectory
+import os
+import unittest
+
+from seed_selection.fuzzers import AFL
+
+from test_fuzzers import FAKE_FUZZER, SEEDS, fuzzer_kwargs
+from util import load_script
+
+
+fuzz_monitor = load_script('fuzz_monitor')
+
+
+class TestExperimentMonitor(unittest.TestCase):
+    """Discover and aggregate fuzzer nodes."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.in_dir = self.root / 'in'
+        self.in_dir.mkdir()
+        for name, data in SEEDS.items():
+            (self.in_dir / name).write_bytes(data)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def fuzz(self, trial_dir: Path, num_nodes: int = 2) -> None:
+        """Run (fake) fuzzer nodes in a trial directory."""
+        fuzzer = AFL(FAKE_FUZZER)
+        env = dict(os.environ, FAKE_FUZZER_RUN_TIME='0.2')
+        for node in range(1, num_nodes + 1):
+            node_dir = trial_dir / f'fuzzer-{node:02d}'
+            args = fuzzer.command_line(node_dir, node,
+                                       **fuzzer_kwargs(self.in_dir))
+            run(args, env=env, stdout=DEVNULL, check=True)
+
+    def test_single_fuzzer(self):
+        exp_dir = self.root / 'full'
+        self.fuzz(exp_dir / 'trial-01')
+        self.fuzz(exp_dir / 'trial-02')
+
+        stats = fuzz_monitor.ExperimentMonitor([exp_dir], stale=60).poll()
+        self.assertEqual([(trial['fuzzer'], trial['trial'], trial['nodes'])
+                          for trial in stats['trials']],
+                         [(None, 'trial-01', 2), (None, 'trial-02', 2)])
+        self.assertEqual(len(stats['nodes']), 4)
+        self.assertTrue(all(node['active'] for node in stats['nodes']))
+        self.assertEqual(stats['corpora']['full']['trials'], 2)
+        self.assertNotIn('fuzzers', stats['corpora']['full'])
+
+    def test_multi_fuzzer(self):
+        exp_dir = self.root / 'cmin'
+        self.fuzz(exp_dir / 'afl' / 'trial-01')
+        self.fuzz(exp_dir / 'honggfuzz' / 'trial-01', num_nodes=1)
+        self.fuzz(exp_dir / 'honggfuzz' / 'trial-02', num_nodes=1)
+
+        stats = fuzz_monitor.ExperimentMonitor([exp_dir], stale=60).poll()
+        self.assertEqual([(trial['fuzzer'], trial['trial'], trial['nodes'])
+                          for trial in stats['trials']],
+                         [('afl', 'trial-01', 2), ('honggfuzz', 'trial-01', 1),
+                          ('honggfuzz', 'trial-02', 1)])
+        self.assertTrue(all(trial.get('paths_total', 0) > len(SEEDS)
+                            for trial in stats['trials']))
+
+        corpus = stats['corpora']['cmin']
+        self.assertEqual(corpus['trials'], 3)
+        self.assertEqual({fuzzer: summary['trials'] for fuzzer, summary in
+                          corpus['fuzzers'].items()},
+                         dict(afl=1, honggfuzz=2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+"""
+Tests for the fuzzer backends, run against a fake fuzzer.
+
+Author: Adrian Herrera
+"""
+
+
+from pathlib import Path
+from subprocess import DEVNULL, Popen
+from tempfile import TemporaryDirectory
+import os
+import signal
+import time
+import unittest
+
+from seed_selection.fuzzers import AFL, AFLFast, Honggfuzz, get_fuzzer
+from seed_selection.timestamps import timestamp_testcases
+
+
+FAKE_FUZZER = Path(__file__).parent / 'fake_fuzzer.py'
+SEEDS = {'a': b'seed a', 'b': b'seed b!'}
+
+# How long to wait for the fake fuzzer to start (or stop)
+TIMEOUT = 10
+
+
+def fuzzer_kwargs(in_dir: Path, **kwargs) -> dict:
+    """Default `fuzz.py` options passed to the backends."""
+    return dict(dict(input=in_dir, timeout=None, memory=None, cmp_log=None,
+                     target=Path('/bin/cat'), target_args=['@@']), **kwargs)
+
+
+def wait_for(cond, timeout: float = TIMEOUT) -> bool:
+    """Wait for a condition to become true."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class FuzzerTestCase(unittest.TestCase):
+    """Run a backend's fuzzer node (i.e., the fake fuzzer)."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.in_dir = self.root / 'in'
+        self.in_dir.mkdir()
+        for name, data in SEEDS.items():
+            (self.in_dir / name).write_bytes(data)
+        self.procs = []
+
+    def tearDown(self):
+        for proc in self.procs:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        self.temp_dir.cleanup()
+
+    def start(self, fuzzer, node_dir: Path, node: int = 1, **kwargs) -> Popen:
+        """Start a fuzzer node, as `fuzz.py` would."""
+        args = fuzzer.command_line(node_dir, node,
+                                   **fuzzer_kwargs(self.in_dir, **kwargs))
+        env = dict(os.environ, **fuzzer.environment(pinned=True))
+        proc = Popen(args, env=env, stdout=DEVNULL, stderr=DEVNULL)
+        self.procs.append(proc)
+        return proc
+
+    def stop(self, proc: Popen) -> int:
+        """Stop a fuzzer node, as `fuzz.py` would."""
+        proc.send_signal(signal.SIGINT)
+        return proc.wait(TIMEOUT)
+
+    def run_node(self, fuzzer, node_dir: Path, **kwargs) -> None:
+        """Run a node until it has found a testcase (beyond the seeds)."""
+        proc = self.start(fuzzer, node_dir, **kwargs)
+        self.assertTrue(wait_for(lambda: fuzzer.is_ready(node_dir)))
+        self.assertTrue(wait_for(
+            lambda: len(timestamp_testcases(node_dir, fuzzer.testcase_dirs,
+                                            fuzzer.testcase_re)) >
+            len(SEEDS)))
+        self.assertEqual(self.stop(proc), 0)
+
+
+class TestAFL(FuzzerTestCase):
+    """AFL (and derived) backends."""
+
+    def test_command_line(self):
+        fuzzer = AFLFast(FAKE_FUZZER)
+        node_dir = self.root / 'trial' / 'fuzzer-02'
+        args = fuzzer.command_line(node_dir, 2,
+                                   **fuzzer_kwargs(self.in_dir, timeout=1000,
+                                                   memory=512))
+        self.assertEqual(args, [str(FAKE_FUZZER), '-i', str(self.in_dir),
+                                '-o', str(node_dir.parent), '-t', '1000',
+                                '-S', 'fuzzer-02', '-m', '512', '-p', 'fast',
+                                '--', '/bin/cat', '@@'])
+        self.assertEqual(fuzzer.environment(pinned=True),
+                         dict(AFL_NO_UI='1', AFL_NO_AFFINITY='1'))
+
+    def test_get_fuzzer(self):
+        fuzzer = get_fuzzer(f'afl={FAKE_FUZZER}')
+        self.assertIsInstance(fuzzer, AFL)
+        self.assertEqual(fuzzer.path, FAKE_FUZZER)
+        with self.assertRaises(Exception):
+            get_fuzzer('not-a-fuzzer')
+
+    def test_run(self):
+        fuzzer = AFL(FAKE_FUZZER)
+        node_dir = self.root / 'trial' / 'fuzzer-01'
+        self.assertFalse(fuzzer.is_ready(node_dir))
+        self.run_node(fuzzer, node_dir)
+
+        # Every queue entry is timestamped (in creation order), and the seeds
+        # are the oldest
+        records = timestamp_testcases(node_dir, fuzzer.testcase_dirs,
+                                      fuzzer.testcase_re)
+        queue = sorted((node_dir / 'queue').iterdir())
+        self.assertEqual(sorted(records['seed']), [str(seed) for seed in queue])
+        self.assertTrue((records['unix_time_ns'][:-1] <=
+                         records['unix_time_ns'][1:]).all())
+        self.assertEqual([Path(seed).name.split(',')[1]
+                          for seed in records['seed'][:len(SEEDS)]],
+                         [f'orig:{name}' for name in sorted(SEEDS)])
+        self.assertTrue(all(fuzzer.is_testcase(seed.name) for seed in queue))
+        self.assertFalse(fuzzer.is_testcase('README.txt'))
+
+
+class TestHonggfuzz(FuzzerTestCase):
+    """honggfuzz backend."""
+
+    def test_command_line(self):
+        fuzzer = Honggfuzz(FAKE_FUZZER)
+        node_dir = self.root / 'trial' / 'fuzzer-01'
+        args = fuzzer.command_line(node_dir, 1,
+                                   **fuzzer_kwargs(self.in_dir, timeout=1500,
+                                                   memory=512))
+        self.assertEqual(args, [str(FAKE_FUZZER), '--threads', '1', '--quiet',
+                                '--verbose', '-i', str(self.in_dir),
+                                '-o', str(node_dir / 'queue'),
+                                '-W', str(node_dir),
+                                '--crashdir', str(node_dir / 'crashes'),
+                                '-t', '2', '--rlimit_as', '512',
+                                '--', '/bin/cat', '___FILE___'])
+
+    def test_run(self):
+        fuzzer = Honggfuzz(FAKE_FUZZER)
+        node_dir = self.root / 'trial' / 'fuzzer-01'
+        self.assertFalse(fuzzer.is_ready(node_dir))
+        self.run_node(fuzzer, node_dir)
+
+        records = timestamp_testcases(node_dir, fuzzer.testcase_dirs,
+                                      fuzzer.testcase_re)
+        queue = sorted((node_dir / 'queue').iterdir())
+        self.assertEqual(sorted(records['seed']), [str(seed) for seed in queue])
+        self.assertEqual(sorted(records['size'].tolist())[:len(SEEDS)],
+                         sorted(len(data) for data in SEEDS.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
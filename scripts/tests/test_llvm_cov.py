@@ -0,0 +1,119 @@
+"""
+Tests for the llvm-cov JSON export helpers.
+
+Author: Adrian Herrera
+"""
+
+
+from pathlib import Path
+from subprocess import DEVNULL, run
+from tempfile import TemporaryDirectory
+import json
+import os
+import sys
+import unittest
+
+from h5py import File as H5File
+
+from seed_selection.llvm_cov import read_totals, summary_path, write_summary
+
+from util import BIN_DIR, load_script
+
+
+TOTALS = dict(branches=dict(count=10, covered=4, notcovered=6, percent=40.0),
+              functions=dict(count=5, covered=5, percent=100.0),
+              instantiations=dict(count=5, covered=5, percent=100.0),
+              lines=dict(count=100, covered=50, percent=50.0),
+              regions=dict(count=20, covered=5, notcovered=15, percent=25.0))
+
+
+def write_export(path: Path, totals: dict, functions=()) -> None:
+    """Write a (minimal) llvm-cov JSON export, as `llvm-cov export` would."""
+    export = dict(data=[dict(files=[], functions=list(functions),
+                             totals=totals)],
+                  type='llvm.coverage.json.export', version='2.0.1')
+    with open(path, 'w') as outf:
+        json.dump(export, outf, sort_keys=True)
+
+
+class TestLLVMCovTotals(unittest.TestCase):
+    """Read totals from a `llvm_cov_merge.py` output directory."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.out_dir = Path(self.temp_dir.name)
+
+        # Laid out as `llvm_cov_merge.py -o <out_dir>/trial-<N>.json` leaves it
+        for trial in range(3):
+            export = self.out_dir / f'trial-{trial}.json'
+            write_export(export, TOTALS)
+            write_summary(export, TOTALS)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_sidecar_not_globbed(self):
+        exports = sorted(self.out_dir.glob('*.json'))
+        self.assertEqual([path.name for path in exports],
+                         ['trial-0.json', 'trial-1.json', 'trial-2.json'])
+        for export in exports:
+            self.assertTrue(summary_path(export).exists())
+
+    def test_read_totals_over_output_dir(self):
+        # As `llvm_cov_stats.py <out_dir>/*.json` does
+        for export in self.out_dir.glob('*.json'):
+            self.assertEqual(read_totals(export), TOTALS)
+
+    def test_read_totals_without_sidecar(self):
+        for export in self.out_dir.glob('*.json'):
+            summary_path(export).unlink()
+            self.assertEqual(read_totals(export), TOTALS)
+
+
+class TestLLVMCovRegions(unittest.TestCase):
+    """`llvm_cov_regions.py`'s HDF5 output, fed to weighted minimization."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        root = Path(self.temp_dir.name)
+        self.seed_dir = root / 'seeds'
+        self.seed_dir.mkdir()
+        self.export_dir = root / 'exports'
+        self.export_dir.mkdir()
+        self.hdf5 = root / 'cov.hdf5'
+
+        # Each seed covers a different number of `main`'s code regions
+        for i, seed in enumerate(('a', 'b')):
+            (self.seed_dir / seed).write_bytes(b'x' * (i + 10))
+            regions = [[line, 1, line, 2, int(line <= i + 1), 0, 0, 0]
+                       for line in range(1, 4)]
+            write_export(self.export_dir / f'{seed}.json', TOTALS,
+                         [dict(name='main', filenames=['main.c'],
+                               regions=regions)])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def llvm_cov_regions(self, *args) -> int:
+        env = dict(os.environ, PYTHONPATH=str(BIN_DIR.parent))
+        return run([sys.executable, BIN_DIR / 'llvm_cov_regions.py', *args,
+                    self.export_dir], env=env, stderr=DEVNULL).returncode
+
+    def test_hdf5_sizes(self):
+        self.assertEqual(self.llvm_cov_regions('--hdf5', self.hdf5,
+                                               '--seeds', self.seed_dir), 0)
+        weights = Path(self.temp_dir.name) / 'weights.csv'
+        with H5File(self.hdf5, 'r') as h5f:
+            self.assertEqual({seed: dset['edge'].tolist()
+                              for seed, dset in h5f.items()},
+                             dict(a=[0], b=[0, 1]))
+            load_script('minimize').write_hdf5_weights(h5f, weights)
+        self.assertEqual(weights.read_text().split(), ['a,10', 'b,11'])
+
+    def test_hdf5_requires_seeds(self):
+        self.assertNotEqual(self.llvm_cov_regions('--hdf5', self.hdf5), 0)
+        self.assertFalse(self.hdf5.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
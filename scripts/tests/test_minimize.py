@@ -0,0 +1,122 @@
+"""
+Tests for corpus minimization (OptiMin is run against fake tools).
+
+Author: Adrian Herrera
+"""
+
+
+from pathlib import Path
+from subprocess import DEVNULL, run
+from tempfile import TemporaryDirectory
+import os
+import sys
+import unittest
+
+import pandas as pd
+
+from seed_selection.minimize import measure
+
+from util import BIN_DIR
+
+
+# Memory allocated (and touched) by each of the fake tools
+TOOL_RSS = 64 * 1024 * 1024
+
+# Writes the seed map and a (trivial) WCNF
+FAKE_SHOWMAP_MAXSAT = f'''#!{sys.executable}
+import sys
+args = sys.argv[1:]
+if '-p' in args:
+    sys.exit('unexpected -p')
+with open(args[args.index('-m') + 1], 'w') as outf:
+    outf.write('1 : seed-a\\n2 : seed-b\\n')
+buf = b'x' * {TOOL_RSS}
+print('p wcnf 2 2 3')
+print('3 1 0')
+print('1 -2 0')
+'''
+
+# Reads the WCNF and "solves" it
+FAKE_EVAL_MAXSAT = f'''#!{sys.executable}
+import sys
+sys.stdin.read()
+buf = b'x' * {TOOL_RSS}
+print('s OPTIMUM FOUND')
+print('v 1 -2')
+'''
+
+
+class TestOptimal(unittest.TestCase):
+    """OptiMin, with both of its processes measured."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        root = Path(self.temp_dir.name)
+        bin_dir = root / 'bin'
+        bin_dir.mkdir()
+        for name, script in (('afl-showmap-maxsat', FAKE_SHOWMAP_MAXSAT),
+                             ('EvalMaxSAT_bin', FAKE_EVAL_MAXSAT)):
+            (bin_dir / name).write_text(script)
+            (bin_dir / name).chmod(0o755)
+        self.cov_dir = root / 'cov'
+        self.cov_dir.mkdir()
+
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = f'{bin_dir}{os.pathsep}{self.path}'
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        self.temp_dir.cleanup()
+
+    def test_measure(self):
+        seeds, wall_time, peak_rss = measure('unweighted-optimal',
+                                             self.cov_dir)
+        self.assertEqual(seeds, ['seed-a'])
+        self.assertGreater(wall_time, 0)
+
+        # The tools run concurrently, so their peaks are summed
+        self.assertGreaterEqual(peak_rss, 2 * TOOL_RSS)
+
+
+class TestMinimizeBatch(unittest.TestCase):
+    """`minimize.py` over a batch of targets, one of which is broken."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        cov_dir = self.root / 'cov'
+        weights_dir = self.root / 'weights'
+        (cov_dir / 'libpng').mkdir(parents=True)
+        weights_dir.mkdir()
+
+        # libpng has valid coverage, but json's "HDF5" is not an HDF5 file
+        (cov_dir / 'libpng' / 'a').write_text('000001:1\n000002:1\n')
+        (cov_dir / 'libpng' / 'b').write_text('000001:1\n')
+        (cov_dir / 'json').write_text('not an HDF5 file\n')
+        for target in ('libpng', 'json'):
+            (weights_dir / f'{target}.csv').write_text('a,10\nb,5\n')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_prepare_failed(self):
+        out_dir = self.root / 'out'
+        env = dict(os.environ, PYTHONPATH=str(BIN_DIR.parent))
+        proc = run([sys.executable, BIN_DIR / 'minimize.py', '-b', 'fts',
+                    '-t', 'libpng', '-t', 'json', '-c', 'cmin',
+                    '-d', str(self.root / 'cov' / '{target}'),
+                    '-w', str(self.root / 'weights' / '{target}.csv'),
+                    out_dir], env=env, stderr=DEVNULL)
+        self.assertEqual(proc.returncode, 0)
+
+        stats = pd.read_csv(out_dir / 'stats.csv').set_index('target')
+        self.assertEqual(stats.loc['libpng', 'num_seeds'], 1)
+        self.assertTrue(pd.isna(stats.loc['libpng', 'error']))
+        self.assertTrue(pd.isna(stats.loc['json', 'num_seeds']))
+        self.assertFalse(pd.isna(stats.loc['json', 'error']))
+        listing = out_dir / 'fts' / 'libpng' / 'cmin.txt'
+        self.assertEqual(listing.read_text(), 'a\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,224 @@
+"""
+Tests for fuzzer resource accounting, run against a fake workload.
+
+Author: Adrian Herrera
+"""
+
+
+from csv import DictReader
+from pathlib import Path
+from subprocess import run
+from tempfile import TemporaryDirectory
+import asyncio
+import json
+import sys
+import time
+import unittest
+
+from seed_selection.resources import (RESOURCE_FIELDNAMES, RUSAGE_FIELDS,
+                                      AccountedPopen, Cgroup, ProcSampler,
+                                      rusage_to_dict)
+
+from util import load_script
+
+
+# The workload's memory allocation and CPU time
+WORKLOAD_RSS = 64 * 1024 * 1024
+WORKLOAD_CPU = 0.5
+
+# The workload allocates (and touches) memory, burns CPU, and runs a child (so
+# that it is a process tree)
+WORKLOAD = f'''
+import subprocess, sys, time
+child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(1)'])
+buf = b'x' * {WORKLOAD_RSS}
+end = time.process_time() + {WORKLOAD_CPU}
+while time.process_time() < end:
+    pass
+child.wait()
+'''
+
+# Upper bound on the workload's peak RSS (the allocation plus the interpreter)
+MAX_RSS = WORKLOAD_RSS + 128 * 1024 * 1024
+
+TIMEOUT = 30
+
+
+def start_workload() -> AccountedPopen:
+    """Start the fake workload."""
+    return AccountedPopen([sys.executable, '-c', WORKLOAD])
+
+
+def wait(proc: AccountedPopen, timeout: float = TIMEOUT) -> int:
+    """Wait for the workload to exit (by polling, as `fuzz.py` does)."""
+    deadline = time.monotonic() + timeout
+    while proc.poll() is None:
+        if time.monotonic() > deadline:
+            proc.kill()
+            raise TimeoutError('Workload did not exit')
+        time.sleep(0.05)
+    return proc.returncode
+
+
+class TestAccountedPopen(unittest.TestCase):
+    """Resource usage recorded when the workload is reaped."""
+
+    def test_rusage(self):
+        proc = start_workload()
+        self.assertIsNone(proc.rusage)
+        self.assertEqual(wait(proc), 0)
+
+        usage = rusage_to_dict(proc.rusage)
+        self.assertEqual(set(usage), set(RUSAGE_FIELDS))
+        self.assertGreaterEqual(usage['ru_utime'] + usage['ru_stime'],
+                                WORKLOAD_CPU * 0.9)
+
+        # `ru_maxrss` is in kilobytes
+        self.assertGreaterEqual(usage['ru_maxrss'] * 1024, WORKLOAD_RSS)
+        self.assertLess(usage['ru_maxrss'] * 1024, MAX_RSS)
+
+    def test_wait(self):
+        proc = start_workload()
+        self.assertEqual(proc.wait(), 0)
+        self.assertGreaterEqual(proc.rusage.ru_maxrss * 1024, WORKLOAD_RSS)
+
+
+class TestProcSampler(unittest.TestCase):
+    """Resource usage sampled from `/proc` while the workload runs."""
+
+    def test_sample(self):
+        proc = start_workload()
+        sampler = ProcSampler(proc.pid)
+        try:
+            samples = []
+            while proc.poll() is None:
+                samples.append(sampler.sample())
+                time.sleep(0.05)
+        finally:
+            wait(proc)
+
+        self.assertTrue(samples)
+        for sample in samples:
+            self.assertEqual(set(sample), set(RESOURCE_FIELDNAMES))
+
+        # The child is part of the sampled process tree
+        self.assertGreaterEqual(max(sample['num_procs'] for sample in samples),
+                                2)
+        peak_rss = max(sample['rss_bytes'] for sample in samples)
+        self.assertGreaterEqual(peak_rss, WORKLOAD_RSS)
+        self.assertLess(peak_rss, MAX_RSS)
+
+        cpu = [sample['cpu_user'] + sample['cpu_system'] for sample in samples]
+        self.assertEqual(cpu, sorted(cpu))
+        self.assertGreater(cpu[-1], 0)
+
+
+class TestResourceOutput(unittest.TestCase):
+    """`fuzz.py`'s `resources.csv` and `resources.json`."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.out_dir = Path(self.temp_dir.name)
+        self.fuzz = load_script('fuzz')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    async def run_workload(self) -> None:
+        proc = start_workload()
+        start = time.monotonic()
+        sampler_task = asyncio.create_task(self.fuzz.sample_resources(
+            ProcSampler(proc.pid), self.out_dir / 'resources.csv', 0.05))
+        try:
+            while proc.poll() is None:
+                await asyncio.sleep(0.05)
+        finally:
+            sampler_task.cancel()
+            wait(proc)
+        self.fuzz.write_resource_summary(proc, self.out_dir / 'resources.json',
+                                         time.monotonic() - start)
+
+    def test_output(self):
+        asyncio.run(self.run_workload())
+
+        with open(self.out_dir / 'resources.csv', 'r') as inf:
+            reader = DictReader(inf)
+            self.assertEqual(tuple(reader.fieldnames), RESOURCE_FIELDNAMES)
+            rows = list(reader)
+        self.assertGreater(len(rows), 1)
+        self.assertGreaterEqual(max(int(row['rss_bytes']) for row in rows),
+                                WORKLOAD_RSS)
+
+        with open(self.out_dir / 'resources.json', 'r') as inf:
+            summary = json.load(inf)
+        self.assertEqual(summary['exit_code'], 0)
+        self.assertGreaterEqual(summary['wall_time'], WORKLOAD_CPU)
+        self.assertGreaterEqual(summary['ru_utime'] + summary['ru_stime'],
+                                WORKLOAD_CPU * 0.9)
+        self.assertGreaterEqual(summary['ru_maxrss'] * 1024, WORKLOAD_RSS)
+        self.assertLess(summary['ru_maxrss'] * 1024, MAX_RSS)
+
+
+class TestCgroup(unittest.TestCase):
+    """cgroup accounting, against a fake cgroup (v2) filesystem."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.parent = Path(self.temp_dir.name)
+        (self.parent / 'cgroup.controllers').write_text('cpu io memory pids\n')
+        (self.parent / 'cgroup.subtree_control').write_text('')
+
+        self.cgroup = Cgroup(self.parent / 'trial-01')
+        self.cgroup.create()
+        for name, contents in {
+                'cgroup.procs': '',
+                'cpu.stat': 'usage_usec 3000000\nuser_usec 2500000\n'
+                            'system_usec 500000\nnr_throttled 4\n'
+                            'throttled_usec 1200\n',
+                'io.stat': '8:0 rbytes=4096 wbytes=8192 rios=1 wios=2\n'
+                           '8:16 rbytes=1024 wbytes=0 rios=1 wios=0\n',
+                'memory.current': '67108864\n',
+                'memory.peak': '134217728\n',
+                'memory.events': 'low 0\nhigh 0\nmax 3\noom 1\noom_kill 1\n',
+        }.items():
+            (self.cgroup.path / name).write_text(contents)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_create(self):
+        self.assertTrue(Cgroup.is_available(self.parent))
+        self.assertEqual((self.parent / 'cgroup.subtree_control').read_text(),
+                         '+cpu +io +memory')
+
+    def test_limits(self):
+        self.cgroup.set_limits(memory_max=512 * 1024 * 1024, cpu_max=1.5)
+        self.assertEqual((self.cgroup.path / 'memory.max').read_text(),
+                         str(512 * 1024 * 1024))
+        self.assertEqual((self.cgroup.path / 'cpu.max').read_text(),
+                         '150000 100000')
+
+    def test_wrap_command(self):
+        run(self.cgroup.wrap_command(['true']), check=True)
+        self.assertEqual(len((self.cgroup.path /
+                              'cgroup.procs').read_text().split()), 1)
+
+    def test_sample(self):
+        (self.cgroup.path / 'cgroup.procs').write_text('100\n101\n')
+        sample = self.cgroup.sample()
+        self.assertEqual(set(sample), set(RESOURCE_FIELDNAMES))
+        self.assertEqual(sample['cpu_user'], 2.5)
+        self.assertEqual(sample['cpu_system'], 0.5)
+        self.assertEqual(sample['rss_bytes'], 64 * 1024 * 1024)
+        self.assertEqual(sample['read_bytes'], 5120)
+        self.assertEqual(sample['write_bytes'], 8192)
+        self.assertEqual(sample['num_procs'], 2)
+
+    def test_summary(self):
+        self.assertEqual(self.cgroup.summary(),
+                         dict(memory_peak=128 * 1024 * 1024, oom_kill=1,
+                              nr_throttled=4, throttled_usec=1200))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+"""
+Tests for staging fuzzer output and syncing it to persistent storage.
+
+Author: Adrian Herrera
+"""
+
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import asyncio
+import unittest
+
+from seed_selection.cores import CoreAllocator
+from seed_selection.fuzzers import AFL
+from seed_selection.journal import Journal
+from seed_selection.staging import StagingArea, sync_tree
+
+from test_fuzzers import FAKE_FUZZER, SEEDS, fuzzer_kwargs
+from util import load_script
+
+
+fuzz = load_script('fuzz')
+
+
+class StagingTestCase(unittest.TestCase):
+    """A staged node directory and its persistent copy."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        root = Path(self.temp_dir.name)
+        self.stage_dir = root / 'stage'
+        self.trial_dir = root / 'trial'
+        self.queue = self.stage_dir / 'fuzzer-01' / 'queue'
+        self.queue.mkdir(parents=True)
+        self.write_stats(0)
+        (self.queue / 'id:000000').write_bytes(b'x' * 100)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_stats(self, paths_total: int) -> None:
+        """Update the (staged) node's statistics."""
+        node_dir = self.stage_dir / 'fuzzer-01'
+        for name in fuzz.STATS_FILES:
+            (node_dir / name).write_text(f'paths_total : {paths_total}\n')
+
+    def synced_names(self):
+        """The names of the files in the persistent directory."""
+        return sorted(path.name for path in self.trial_dir.rglob('*')
+                      if path.is_file())
+
+
+class TestSyncTree(StagingTestCase):
+    """Incremental syncs."""
+
+    def test_sync(self):
+        synced = {}
+        self.assertEqual(sync_tree(self.stage_dir, self.trial_dir, synced)[0],
+                         3)
+        self.assertEqual(sync_tree(self.stage_dir, self.trial_dir, synced)[0],
+                         0)
+        self.write_stats(10)
+        self.assertEqual(sync_tree(self.stage_dir, self.trial_dir, synced)[0],
+                         2)
+
+    def test_names(self):
+        synced = {}
+        num_copied, size = sync_tree(self.stage_dir, self.trial_dir, synced,
+                                     fuzz.STATS_FILES)
+        self.assertEqual(num_copied, 2)
+        self.assertEqual(self.synced_names(), sorted(fuzz.STATS_FILES))
+
+        # The size covers the whole tree, not just the copied files
+        self.assertEqual(size, sum(path.stat().st_size for path in
+                                   self.stage_dir.rglob('*')
+                                   if path.is_file()))
+
+
+class TestSyncStaged(StagingTestCase):
+    """`fuzz.py`'s periodic sync of a staged trial."""
+
+    def setUp(self):
+        super().setUp()
+        self.stats_sync_interval = fuzz.STATS_SYNC_INTERVAL
+        fuzz.STATS_SYNC_INTERVAL = 0.1
+
+    def tearDown(self):
+        fuzz.STATS_SYNC_INTERVAL = self.stats_sync_interval
+        super().tearDown()
+
+    async def sync(self, run_time: float, trial_size: int) -> None:
+        """Sync the staged trial for `run_time` seconds."""
+        task = asyncio.create_task(fuzz.sync_staged(
+            self.stage_dir, self.trial_dir, {}, 60, trial_size))
+        await asyncio.sleep(run_time)
+        task.cancel()
+
+    def test_stats(self):
+        asyncio.run(self.sync(0.5, 1024 * 1024))
+        self.assertEqual(self.synced_names(), sorted(fuzz.STATS_FILES))
+
+    def test_over_budget(self):
+        with self.assertLogs(fuzz.logger, 'WARNING'):
+            asyncio.run(self.sync(0.5, 100))
+        self.assertEqual(self.synced_names(),
+                         sorted(('id:000000', *fuzz.STATS_FILES)))
+
+
+class TestRunTrial(unittest.TestCase):
+    """A staged trial is only complete once it has been synced."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        root = Path(self.temp_dir.name)
+        in_dir = root / 'in'
+        in_dir.mkdir()
+        for name, data in SEEDS.items():
+            (in_dir / name).write_bytes(data)
+        self.out_dir = root / 'out'
+        self.out_dir.mkdir()
+        self.trial_dir = self.out_dir / 'trial-01'
+
+        self.staging = StagingArea(root, 1024 * 1024)
+        self.journal = Journal(self.out_dir / fuzz.JOURNAL_NAME)
+        self.kwargs = fuzzer_kwargs(
+            in_dir, nodes=1, trial_len=1, startup_timeout=10,
+            sample_interval=60, sync_interval=60, parent_cgroup=None,
+            trial_memory=None, trial_cpus=None, no_pin=True, taskset=None)
+        self.sync_tree = fuzz.sync_tree
+
+    def tearDown(self):
+        fuzz.sync_tree = self.sync_tree
+        self.journal.close()
+        self.staging.cleanup()
+        self.temp_dir.cleanup()
+
+    async def run_trial(self):
+        return await fuzz.run_trial(AFL(FAKE_FUZZER), self.trial_dir,
+                                    'trial-01', CoreAllocator([0]),
+                                    asyncio.Lock(), self.journal,
+                                    staging=self.staging, **self.kwargs)
+
+    def test_synced(self):
+        self.assertEqual(asyncio.run(self.run_trial()), [0])
+        self.assertEqual(self.journal.completed_trials(1), {'trial-01'})
+        self.assertTrue((self.trial_dir / 'fuzzer-01' /
+                         'fuzzer_stats').exists())
+        self.assertFalse(self.staging.trial_dir('trial-01').exists())
+
+    def test_sync_failed(self):
+        def sync_tree(*args):
+            raise OSError('No space left on device')
+
+        fuzz.sync_tree = sync_tree
+        with self.assertLogs(fuzz.logger, 'ERROR'), \
+                self.assertRaises(Exception):
+            asyncio.run(self.run_trial())
+        self.assertEqual(self.journal.completed_trials(1), set())
+        self.assertEqual(self.journal.status(), {'failed': 1})
+
+    def test_setup_failed(self):
+        # The trial fails before any fuzzer (or the sync task) starts
+        self.kwargs['parent_cgroup'] = self.out_dir / 'no-such-cgroup'
+        with self.assertRaises(FileNotFoundError):
+            asyncio.run(self.run_trial())
+        self.assertEqual(self.journal.status(), {})
+        self.assertFalse(self.staging.trial_dir('trial-01').exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
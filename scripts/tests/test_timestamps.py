@@ -0,0 +1,75 @@
+"""
+Tests for testcase timestamping.
+
+Author: Adrian Herrera
+"""
+
+
+from csv import DictReader
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import unittest
+
+from seed_selection.fuzzers import AFL
+from seed_selection.timestamps import (TIMESTAMP_FIELDNAMES,
+                                       timestamp_testcases)
+
+from test_fuzzers import FAKE_FUZZER
+from util import load_script
+
+
+fuzz = load_script('fuzz')
+llvm_cov_merge = load_script('llvm_cov_merge')
+
+
+class TestTimestamps(unittest.TestCase):
+    """A (staged) fuzzer node's `timestamps.csv`."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        root = Path(self.temp_dir.name)
+        self.node_dir = root / 'stage' / 'fuzzer-01'
+        self.seed_dir = root / 'trial' / 'fuzzer-01'
+
+        queue = self.node_dir / 'queue'
+        crashes = self.node_dir / 'crashes'
+        (queue / '.state').mkdir(parents=True)
+        crashes.mkdir()
+        for i, path in enumerate((queue / 'id:000000,orig:a',
+                                  queue / 'id:000001,+cov',
+                                  crashes / 'id:000000,sig:11',
+                                  queue / '.state' / 'id:0',
+                                  crashes / 'README.txt')):
+            path.write_bytes(b'x' * (i + 1))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_testcases(self):
+        records = timestamp_testcases(self.node_dir)
+        self.assertEqual([Path(seed).relative_to(self.node_dir).as_posix()
+                          for seed in records['seed']],
+                         ['queue/id:000000,orig:a', 'queue/id:000001,+cov',
+                          'crashes/id:000000,sig:11'])
+
+    def test_fuzz_node(self):
+        fuzz.timestamp_node(AFL(FAKE_FUZZER), self.node_dir, self.seed_dir)
+        with open(self.node_dir / 'timestamps.csv', 'r') as inf:
+            reader = DictReader(inf)
+            self.assertEqual(tuple(reader.fieldnames), TIMESTAMP_FIELDNAMES)
+            rows = list(reader)
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(Path(row['seed']).parent.parent == self.seed_dir
+                            for row in rows))
+
+        with open(self.node_dir / 'timestamps.csv', 'r') as inf:
+            timestamps = llvm_cov_merge.read_timestamps(inf)
+        self.assertEqual(set(timestamps),
+                         {Path('fuzzer-01', 'queue', 'id:000000,orig:a'),
+                          Path('fuzzer-01', 'queue', 'id:000001,+cov'),
+                          Path('fuzzer-01', 'crashes', 'id:000000,sig:11')})
+        self.assertEqual(min(timestamps.values()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,20 @@
+"""
+Test helpers.
+
+Author: Adrian Herrera
+"""
+
+
+from importlib.util import module_from_spec, spec_from_file_location
+from pathlib import Path
+
+
+BIN_DIR = Path(__file__).parent.parent / 'bin'
+
+
+def load_script(name: str):
+    """Import a script from `bin/`."""
+    spec = spec_from_file_location(name, BIN_DIR / f'{name}.py')
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module